@@ -1,18 +1,36 @@
 #!/usr/bin/env python
 # coding: utf-8
 import asyncio
+import time
 from functools import wraps
 from typing import Callable, Concatenate, Awaitable, Any, Coroutine, TypeVar, ParamSpec
 
-from asyncio import Lock, CancelledError
+from asyncio import CancelledError
 import logging
-from enum import IntEnum
+from enum import Enum, IntEnum
 
+import aiohttp
 import ucapi.media_player
 from config import DeviceInstance
 from pyee.asyncio import AsyncIOEventEmitter
 from ucapi.media_player import Attributes, States
+from sonyapilib import deadline, pacing, tracing
 from sonyapilib.device import SonyDevice, AuthenticationResult, DeviceState
+from sonyapilib.metrics import (
+    ENDPOINT_IRCC,
+    PREDICTION_CONFIRMED,
+    PREDICTION_PREDICTED,
+    PREDICTION_ROLLED_BACK,
+    QUEUE_DELIVERED,
+    QUEUE_DROPPED,
+    QUEUE_ENQUEUED,
+    QUEUE_FAILED,
+    command_queue_metrics,
+    http_metrics,
+    prediction_metrics,
+)
+from sonyapilib.pacing import KeyPacer
+from tasks import DeviceTasks, TaskLimitError
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -25,12 +43,123 @@ class Events(IntEnum):
     UPDATE = 2
     IP_ADDRESS_CHANGED = 3
     DISCONNECTED = 4
+    # the device description could not be read from the configured address
+    UNREACHABLE = 5
+    # a queued command, already acknowledged, could not be sent: device id, key, status code
+    COMMAND_FAILED = 6
+    # the learned interval between two keys changed enough to be persisted
+    PACING_LEARNED = 7
+
+
+class ConnectionState(Enum):
+    """Connection state of a device."""
+
+    DISCONNECTED = "disconnected"
+    CONNECTING = "connecting"
+    # device description read, the device can be controlled
+    READY = "ready"
+    # device created but its description could not be read, the next connect request retries
+    DEGRADED = "degraded"
 
 
 _SonyBlurayDeviceT = TypeVar("_SonyBlurayDeviceT", bound="SonyBlurayDevice")
 _P = ParamSpec("_P")
 
 CONNECTION_RETRIES = 10
+# Polling interval in seconds, and while the device is off if its SSDP announcements are received
+POLL_INTERVAL = 10
+OFF_POLL_INTERVAL = 60
+# Maximum age in seconds of a persisted state to be restored at startup
+STATE_MAX_AGE = 24 * 3600
+# Polling interval bounds in seconds of the state convergence watcher, the interval doubles after each poll
+CONVERGENCE_MIN_INTERVAL = 0.25
+CONVERGENCE_MAX_INTERVAL = 4
+# Maximum duration in seconds to wait for the expected state after a power or a transport command
+POWER_CONVERGENCE_TIMEOUT = 30
+TRANSPORT_CONVERGENCE_TIMEOUT = 8
+ON_STATES = {States.ON, States.PLAYING, States.PAUSED}
+# UPnP AVTransport states reporting an ongoing playback
+TRANSPORT_STATES = {
+    "PLAYING": States.PLAYING,
+    "TRANSITIONING": States.PLAYING,
+    "PAUSED_PLAYBACK": States.PAUSED,
+    "PAUSED_RECORDING": States.PAUSED,
+}
+# Interval in seconds of the interpolated media position updates while playing
+POSITION_UPDATE_INTERVAL = 1
+# Interval in seconds of the requests keeping the connection to the device open while the user is active
+WARM_UP_INTERVAL = 4
+# Inactivity in seconds after which the connection to the device is not kept open anymore
+WARM_UP_IDLE_TIMEOUT = 60
+# Timeout in seconds of the power status requests of the power commands
+POWER_STATUS_TIMEOUT = 2
+# Maximum number of keys waiting to be sent in the queued commands mode
+COMMAND_QUEUE_SIZE = 16
+# Relative change of the learned key interval triggering its persistence
+KEY_INTERVAL_PERSIST_CHANGE = 0.2
+# Errors of the connection to the device, a command failing with them is sent again once reconnected
+TRANSPORT_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, OSError)
+
+
+async def _reconnect_and_retry(obj, func, args, kwargs, exc: Exception) -> ucapi.StatusCodes | None:
+    """Reconnect after a failed command and send it again, return the error status or None if sent."""
+    if obj.connection_state == ConnectionState.READY and not isinstance(exc, TRANSPORT_ERRORS):
+        _LOGGER.error("Error calling %s on entity %s: %r", func.__name__, obj.id, exc)
+        return ucapi.StatusCodes.SERVER_ERROR
+    # If Kodi is off, we expect calls to fail.
+    if obj.state == States.OFF:
+        log_function = _LOGGER.debug
+    else:
+        log_function = _LOGGER.error
+    log_function(
+        "Error calling %s on entity %s: %r trying to reconnect and send the command next",
+        func.__name__,
+        obj.id,
+        exc,
+    )
+    # Kodi not connected, launch a connect task but
+    # don't wait longer than the budget of the command, then process the command if connected
+    # else returns error
+    obj.mark_degraded()
+    try:
+        connect_task = obj.tasks.spawn(obj.connect(), "connect")
+    except TaskLimitError:
+        return ucapi.StatusCodes.SERVICE_UNAVAILABLE
+    await asyncio.sleep(0)
+    try:
+        with tracing.span(tracing.STAGE_RECONNECT):
+            async with asyncio.timeout(deadline.remaining()):
+                await connect_task
+    except asyncio.TimeoutError:
+        log_function(
+            "Timeout for reconnect, command won't be sent"
+        )
+        return ucapi.StatusCodes.TIMEOUT
+    try:
+        http_metrics.record_retry(obj.id, ENDPOINT_IRCC)
+        await func(obj, *args, **kwargs)
+    except deadline.DeadlineExceeded:
+        _LOGGER.warning("Timeout calling %s on entity %s after reconnect", func.__name__, obj.id)
+        return ucapi.StatusCodes.TIMEOUT
+    except Exception as retry_exc:
+        log_function(
+            "Error calling %s on entity %s: %r trying to reconnect",
+            func.__name__,
+            obj.id,
+            retry_exc,
+        )
+        return ucapi.StatusCodes.BAD_REQUEST
+    return None
+
+
+def _is_busy_device_error(exc: Exception) -> bool:
+    """Return True if the error of a key shows a reachable device which is slow or refuses the keys."""
+    if isinstance(exc, aiohttp.ClientResponseError):
+        return True
+    if isinstance(exc, (deadline.DeadlineExceeded, aiohttp.ServerTimeoutError)):
+        # the budget of the command is spent, or the device could not be connected to in time
+        return False
+    return isinstance(exc, asyncio.TimeoutError)
 
 
 def cmd_wrapper(
@@ -41,52 +170,24 @@ def cmd_wrapper(
     @wraps(func)
     async def wrapper(obj: _SonyBlurayDeviceT, *args: _P.args, **kwargs: _P.kwargs) -> ucapi.StatusCodes:
         """Wrap all command methods."""
-        try:
-            await func(obj, *args, **kwargs)
-            if obj._device_config.polling:
-                await obj.start_polling()
-            return ucapi.StatusCodes.OK
-        except Exception as exc:
-            # If Kodi is off, we expect calls to fail.
-            if obj.state == States.OFF:
-                log_function = _LOGGER.debug
-            else:
-                log_function = _LOGGER.error
-            log_function(
-                "Error calling %s on entity %s: %r trying to reconnect and send the command next",
-                func.__name__,
-                obj.id,
-                exc,
-            )
-            # Kodi not connected, launch a connect task but
-            # don't wait more than 5 seconds, then process the command if connected
-            # else returns error
-            connect_task = obj._event_loop.create_task(obj.connect())
-            await asyncio.sleep(0)
+        tracing.mark(tracing.STAGE_DISPATCH)
+        with deadline.budget(deadline.KEY_PRESS):
             try:
-                async with asyncio.timeout(5):
-                    await connect_task
-            except asyncio.TimeoutError:
-                log_function(
-                    "Timeout for reconnect, command won't be sent"
-                )
-                pass
-            else:
-                try:
-                    await func(obj, *args, **kwargs)
-                    return ucapi.StatusCodes.OK
-                except Exception as exc:
-                    log_function(
-                        "Error calling %s on entity %s: %r trying to reconnect",
-                        func.__name__,
-                        obj.id,
-                        exc,
-                    )
-            return ucapi.StatusCodes.BAD_REQUEST
-        except Exception as ex:
-            _LOGGER.error(
-                "Unknown error %s",
-                func.__name__)
+                await func(obj, *args, **kwargs)
+            except deadline.DeadlineExceeded:
+                _LOGGER.warning("Timeout calling %s on entity %s", func.__name__, obj.id)
+                return ucapi.StatusCodes.TIMEOUT
+            except ValueError as exc:
+                # unknown command or key: the connection is fine and the command would fail again
+                _LOGGER.warning("Invalid call of %s on entity %s: %s", func.__name__, obj.id, exc)
+                return ucapi.StatusCodes.BAD_REQUEST
+            except Exception as exc:
+                status = await _reconnect_and_retry(obj, func, args, kwargs, exc)
+                if status is not None:
+                    return status
+            # the command was sent, nothing below may fail it and send it again
+            await obj.on_command_sent()
+            return ucapi.StatusCodes.OK
 
     return wrapper
 
@@ -101,59 +202,196 @@ class SonyBlurayDevice(object):
         self._timeout = timeout
         self.refresh_frequency = timedelta(seconds=refresh_frequency)
         self._state = States.UNKNOWN
+        # UPnP AVTransport state (PLAYING, PAUSED_PLAYBACK...), when reported by the device
+        self._transport_state: str | None = None
+        self._state_updated_at = 0.0
         self._event_loop = asyncio.get_event_loop() or asyncio.get_running_loop()
         self.events = AsyncIOEventEmitter(self._event_loop)
+        self.tasks = DeviceTasks(self._id, self._event_loop)
         self._sony_device: SonyDevice | None = None
         self._media_position = 0
         self._media_duration = 0
+        # monotonic time of the last media position read from the device
+        self._position_updated_at = 0.0
+        self._position_task: asyncio.Task | None = None
+        self._warm_task: asyncio.Task | None = None
+        self._last_activity = 0.0
         self._update_task = None
-        self._update_lock = Lock()
-        self._connected = False
+        # single-flight state refresh, and whether another refresh was requested while it is running
+        self._refresh_task: asyncio.Task | None = None
+        self._refresh_requested = False
+        self._watch_task: asyncio.Task | None = None
+        # optimistic state shown until it is observed: (predicted state, states confirming it, deadline in loop time)
+        self._prediction: tuple[States, set[States], float] | None = None
+        self._connection_state = ConnectionState.DISCONNECTED
+        self._connect_task: asyncio.Task | None = None
+        # result of the registration, attempted once per session: a PIN prompt or an error is not repeated
+        self._registration: AuthenticationResult | None = None
+        # description of the device saved when the Remote enters standby, to resume without bootstrap
+        self._capabilities: dict | None = None
+        # keys acknowledged and waiting to be sent in the queued commands mode: (key, command trace, monotonic time)
+        self._key_queue: asyncio.Queue[tuple[str, tracing.CommandTrace | None, float]] = asyncio.Queue(
+            COMMAND_QUEUE_SIZE)
+        self._key_task: asyncio.Task | None = None
+        # pacing of the key streams, and the learned interval last persisted
+        self._pacer = KeyPacer()
+        self._persisted_key_interval: float | None = None
+        # True if the SSDP announcements of the devices are received: a device turned on is then reported without
+        # polling
+        self.presence_hints = False
+        self.tracer = tracing.DeviceTracer()
 
     async def connect(self):
+        """
+        Connect the device: create the Sony device client and read its description.
+
+        Concurrent calls share the running connection, and the call is skipped if the device is ready.
+        """
+        if self._connect_task is None:
+            if self._connection_state == ConnectionState.READY:
+                return
+            self._connect_task = self.tasks.spawn(self._connect(), "bootstrap")
+        # cancelling a caller must not cancel the connection shared with the other callers
+        await asyncio.shield(self._connect_task)
+
+    async def _connect(self):
+        try:
+            self._set_connection_state(ConnectionState.CONNECTING)
+            with deadline.budget(deadline.BOOTSTRAP):
+                await self._bootstrap()
+        except Exception:
+            self._set_connection_state(ConnectionState.DEGRADED)
+            raise
+        finally:
+            if self._connect_task is asyncio.current_task():
+                self._connect_task = None
+        self._set_connection_state(
+            ConnectionState.READY if self._sony_device.initialized else ConnectionState.DEGRADED)
+        if not self._sony_device.initialized:
+            self.events.emit(Events.UNREACHABLE, self.id)
+
+        self.events.emit(Events.CONNECTED, self.id)
+        if self._device_config.polling:
+            await self.start_polling()
+
+    def _set_connection_state(self, state: ConnectionState) -> None:
+        if state != self._connection_state:
+            _LOGGER.debug("[%s] Connection state %s -> %s", self.id, self._connection_state.value, state.value)
+            self._connection_state = state
+
+    def mark_degraded(self) -> None:
+        """Force a new connection on the next connect request, e.g. after a failed command."""
+        if self._connection_state == ConnectionState.READY:
+            self._set_connection_state(ConnectionState.DEGRADED)
+
+    def set_address(self, address: str) -> None:
+        """Point the device to its new address, the Sony device client and its description are kept."""
+        self._hostname = address
+        if self._sony_device is not None:
+            self._sony_device.set_host(address)
+
+    async def _bootstrap(self):
         if self._sony_device:
-            # await self._sony_device.close()
+            await self._sony_device.close()
             self._sony_device = None
-            self._connected = False
-            self._state = States.OFF
 
         if self._device_config.password_key == '':
             self._device_config.password_key = None
         self._sony_device = SonyDevice(host=self._device_config.address, app_port=self._device_config.app_port,
                                        ircc_port=self._device_config.ircc_port, dmr_port=self._device_config.dmr_port,
                                        psk=self._device_config.password_key, nickname=self._device_config.client_name)
+        self._sony_device.device_id = self.id
+        self._sony_device.task_spawner = self.tasks.spawn
         self._sony_device.pin = self._device_config.pin_code
         self._sony_device.mac = self._device_config.mac_address
-        if self._device_config.pin_code is None:
-            register_result = self._sony_device.register()
-            if register_result == AuthenticationResult.PIN_NEEDED:
-                raise ConnectionError("PIN code needed")
+        if self._capabilities is not None:
+            # resume from standby: the description is revalidated by the next update or command
+            _LOGGER.debug("[%s] Restore device description", self.id)
+            self._sony_device.restore_capabilities(self._capabilities)
+            self._capabilities = None
+            return
         try:
-            # response = self._sony_device._send_http(self._sony_device.dmr_url, HttpMethod.GET)
-            # if response:
-            #     self._connected = True
             _LOGGER.debug("Init device")
             await self._sony_device.init_device()
 
         except Exception as ex:
             _LOGGER.debug("Sony device connection error, waiting next call %s", ex)
-        # except requests.exceptions.RequestException as exc:
-        #     _LOGGER.error("Failed to get DMR: %s: %s", type(exc), exc)
 
-        self.events.emit(Events.CONNECTED, self.id)
-        if self._device_config.polling:
-            await self.start_polling()
+        # the registration requires the action list of the device, it is done once per session
+        if self._device_config.pin_code is None and self._sony_device.initialized and self._registration is None:
+            self._registration = await self._sony_device.register()
+            if self._registration == AuthenticationResult.PIN_NEEDED:
+                self.events.emit(Events.ERROR, self.id,
+                                 f"[{self.id}] The device asks for a PIN code, run the setup of the integration again")
+            elif self._registration == AuthenticationResult.ERROR:
+                _LOGGER.warning("[%s] Registration failed, it is not retried until the integration restarts", self.id)
+
+    async def enter_standby(self):
+        """
+        Suspend the device while the Remote is in standby.
+
+        Polling and all background tasks are stopped, and the Sony device client is released. Only its description is
+        kept to reconnect without bootstrap.
+        """
+        if self._sony_device and self._sony_device.initialized and self._connection_state == ConnectionState.READY:
+            self._capabilities = self._sony_device.capabilities()
+        await self.disconnect()
 
     async def disconnect(self):
+        """Disconnect the device and cancel all its background tasks."""
+        self.tasks.cancel_all()
+        self._update_task = None
+        self._refresh_task = None
+        self._watch_task = None
+        self._position_task = None
+        self._warm_task = None
+        self._connect_task = None
+        self._key_task = None
+        self._drop_queued_keys()
+        self._set_connection_state(ConnectionState.DISCONNECTED)
         if self._sony_device:
+            await self._sony_device.close()
             self._sony_device = None
 
+    def warm_up(self, now: bool = False) -> None:
+        """
+        Keep a connection to the device open while the user is active, the connection lapses once idle.
+
+        :param now: open the connection right away, e.g. when the Remote wakes up, instead of keeping alive the
+                    connection of the last command.
+        """
+        self._last_activity = time.monotonic()
+        if self._warm_task is None and self._sony_device is not None and self.is_on:
+            self._warm_task = self.tasks.spawn(self._keep_warm(now), "warm-up")
+
+    async def _keep_warm(self, now: bool):
+        try:
+            if now:
+                await self._sony_device.warm_up()
+            while True:
+                await asyncio.sleep(WARM_UP_INTERVAL)
+                if self._sony_device is None or time.monotonic() - self._last_activity > WARM_UP_IDLE_TIMEOUT:
+                    return
+                await self._sony_device.warm_up()
+        finally:
+            if self._warm_task is asyncio.current_task():
+                self._warm_task = None
+
+    async def on_command_sent(self) -> None:
+        """Keep the connection warm and poll the device after a command, best effort: the command was sent."""
+        try:
+            self.warm_up()
+            if self._device_config.polling:
+                await self.start_polling()
+        except TaskLimitError as ex:
+            _LOGGER.debug("[%s] No follow-up of the command: %s", self.id, ex)
+
     async def start_polling(self):
         """Start polling task."""
         if self._update_task is not None:
             return
         _LOGGER.debug("Start polling task for device %s", self.id)
-        self._update_task = self._event_loop.create_task(self._background_update_task())
+        self._update_task = self.tasks.spawn(self._background_update_task(), "polling")
 
     async def stop_polling(self):
         """Stop polling task."""
@@ -178,46 +416,77 @@ class SonyBlurayDevice(object):
                     self._reconnect_retry = 0
                     _LOGGER.debug("Device %s is on again", self.id)
             await self.update()
-            await asyncio.sleep(10)
+            if self.presence_hints and self.state == States.OFF:
+                await asyncio.sleep(OFF_POLL_INTERVAL)
+            else:
+                await asyncio.sleep(POLL_INTERVAL)
 
         self._update_task = None
 
-    async def update(self, deferred_update=0):
-        if deferred_update > 0:
-            await asyncio.sleep(deferred_update)
-        if self._update_lock.locked():
+    def presence_hint(self, alive: bool, address: str | None = None) -> None:
+        """
+        Handle an SSDP announcement of the device.
+
+        :param alive: True for an ssdp:alive announcement, False for ssdp:byebye
+        :param address: address the device announced itself from
+        """
+        if address and address != self._device_config.address:
+            _LOGGER.info("[%s] Device announced from a new address %s", self.id, address)
+            self.events.emit(Events.IP_ADDRESS_CHANGED, self.id, address)
             return
-        await self._update_lock.acquire()
+        if alive == self.is_on:
+            return
+        _LOGGER.debug("[%s] Device announced %s, refresh state", self.id, "alive" if alive else "byebye")
+        self.tasks.spawn(self._on_presence(alive), "presence")
+
+    async def _on_presence(self, alive: bool) -> None:
+        await self.update()
+        if alive and self._device_config.polling:
+            # the polling task stops a while after the device is turned off
+            await self.start_polling()
+
+    async def update(self):
+        """
+        Refresh the device state.
+
+        Concurrent calls share the running refresh: a call during a refresh triggers exactly one follow-up refresh,
+        and returns once it is done.
+        """
+        if self._refresh_task is not None:
+            self._refresh_requested = True
+        else:
+            self._refresh_task = self.tasks.spawn(self._refresh_loop(), "refresh")
+        # cancelling a caller must not cancel the refresh shared with the other callers
+        await asyncio.shield(self._refresh_task)
+
+    async def _refresh_loop(self):
+        try:
+            while True:
+                self._refresh_requested = False
+                await self._refresh()
+                if not self._refresh_requested:
+                    return
+        finally:
+            self._refresh_task = None
+
+    async def _refresh(self):
         update_data = {}
         current_state = self.state
+        transport_state = self._transport_state
         try:
             # _LOGGER.debug("Refresh Sony data")
-            if self.state in [States.OFF, States.UNKNOWN]:
+            if self._connection_state != ConnectionState.READY or self._sony_device is None:
                 await self.connect()
 
-            power_status = await self._sony_device.get_power_status()
-            if not power_status:
-                self._state = States.OFF
-            else:
-                self._state = States.ON
-                device_state = await self._sony_device.get_status()
-                if device_state == DeviceState.OFF:
-                    self._state = States.OFF
-                elif device_state == DeviceState.STOPPED:
-                    self._state = States.ON
-                else:
-                    self._state = States.PLAYING
-
-            # playback_info = self._sony_device.get_playing_status()
-            # NO_MEDIA_PRESENT
-            # if playback_info == "PLAYING":
-            #     self._state = States.PLAYING
-            # elif playback_info == "PAUSED_PLAYBACK":
-            #     self._state = States.PAUSED
+            with deadline.budget(deadline.POLL):
+                state, position_info = await self._probe_state()
+                update_data.update(await self._refresh_media(transport_state, position_info))
         except Exception:
-            self._state = States.OFF
+            state = States.OFF
+            update_data.update(self._set_media(None, None))
 
-        self._update_lock.release()
+        self._state = self._reconcile_prediction(state)
+        self._state_updated_at = time.time()
         if self.state != current_state:
             update_data[Attributes.STATE] = self.state
 
@@ -228,18 +497,239 @@ class SonyBlurayDevice(object):
                 update_data
             )
 
+    async def _probe_state(self) -> tuple[States, tuple[int | None, int | None] | None]:
+        """
+        Probe the power, device and transport status concurrently, within one deadline, and merge them into a state.
+
+        A probe which fails or doesn't answer in time is ignored, except the power status. The playback position is
+        probed along if the device was playing.
+
+        :return: the state, and the playback position and duration if probed.
+        """
+        device = self._sony_device
+        # the state probes share the requests in flight of the device, the position probe is specific to the refresh
+        timeout = deadline.remaining(self._timeout)
+        probes = [self._probe(device.get_power_status(timeout=timeout)),
+                  self._probe(device.get_status(timeout=timeout)),
+                  self._probe(device.get_playing_status(timeout=timeout))]
+        if self._transport_state in TRANSPORT_STATES:
+            probes.append(self._probe(device.get_position_info(timeout=timeout)))
+        with deadline.budget(timeout):
+            power, device_state, transport_state, *position = await asyncio.gather(*probes)
+
+        if not power:
+            self._transport_state = None
+            return States.OFF, None
+        self._transport_state = transport_state
+        position_info = position[0] if position else None
+        state = TRANSPORT_STATES.get(self._transport_state)
+        if state is not None:
+            return state, position_info
+        if device_state == DeviceState.OFF:
+            return States.OFF, None
+        if device_state == DeviceState.PLAYING:
+            return States.PLAYING, None
+        # the AVTransport service only reports the playback of media rendered through DLNA
+        return States.ON, None
+
+    async def _refresh_media(self, previous_transport_state: str | None,
+                             position_info: tuple[int | None, int | None] | None) -> dict[str, Any]:
+        """
+        Update the playback position and duration from the transport state and the probed position.
+
+        The position and the media duration are read again when the transport state changes.
+
+        :return: the changed media attributes.
+        """
+        if self._transport_state not in TRANSPORT_STATES:
+            return self._set_media(None, None)
+        media_duration = None
+        if position_info is None or self._transport_state != previous_transport_state:
+            position_info, media_duration = await asyncio.gather(
+                self._probe(self._sony_device.get_position_info(timeout=self._timeout)),
+                self._probe(self._sony_device.get_media_info(timeout=self._timeout)))
+        position, duration = position_info or (None, None)
+        return self._set_media(position, duration or media_duration)
+
+    def _set_media(self, position: int | None, duration: int | None) -> dict[str, Any]:
+        """Set the playback position read from the device, and start or stop the interpolated position updates."""
+        update_data = {}
+        position = position or 0
+        duration = duration or 0
+        if position != self.media_position:
+            update_data[Attributes.MEDIA_POSITION] = position
+        if duration != self._media_duration:
+            update_data[Attributes.MEDIA_DURATION] = duration
+        self._media_position = position
+        self._media_duration = duration
+        self._position_updated_at = time.monotonic()
+
+        if self._transport_state == "PLAYING" and duration:
+            if self._position_task is None:
+                self._position_task = self.tasks.spawn(self._update_position_periodically(), "position")
+        else:
+            self._stop_position_updates()
+        return update_data
+
+    def _stop_position_updates(self) -> None:
+        if self._position_task is not None:
+            self._position_task.cancel()
+            self._position_task = None
+
+    async def _update_position_periodically(self) -> None:
+        """Emit the interpolated position while playing, without polling the device."""
+        position = self.media_position
+        while True:
+            await asyncio.sleep(POSITION_UPDATE_INTERVAL)
+            if self.media_position != position:
+                position = self.media_position
+                self.events.emit(Events.UPDATE, self.id, {Attributes.MEDIA_POSITION: position})
+
+    async def _probe(self, coro):
+        try:
+            return await coro
+        except Exception as ex:
+            _LOGGER.debug("[%s] Status probe failed: %r", self.id, ex)
+            return None
+
+    def _predict_state(self, state: States, expected: set[States], timeout: float = POWER_CONVERGENCE_TIMEOUT) -> None:
+        """
+        Show right away the state expected after a command, and watch the device until it is confirmed.
+
+        :param state: predicted state
+        :param expected: observed states which confirm the prediction
+        :param timeout: duration in seconds after which the prediction is rolled back if not confirmed
+        """
+        self._prediction = (state, expected, self._event_loop.time() + timeout)
+        prediction_metrics.record(self.id, PREDICTION_PREDICTED)
+        if state != self._state:
+            self._state = state
+            self.events.emit(Events.UPDATE, self.id, {Attributes.STATE: state})
+        self.watch_state(expected, timeout)
+
+    def _reconcile_prediction(self, observed: States) -> States:
+        """Return the state to show given the observed state, confirming or rolling back a pending prediction."""
+        if self._prediction is None:
+            return observed
+        predicted, expected, expires_at = self._prediction
+        if observed in expected:
+            self._prediction = None
+            prediction_metrics.record(self.id, PREDICTION_CONFIRMED)
+            return observed
+        if self._event_loop.time() < expires_at:
+            # the device did not process the command yet
+            return predicted
+        self._prediction = None
+        prediction_metrics.record(self.id, PREDICTION_ROLLED_BACK)
+        _LOGGER.debug("[%s] Predicted state %s rolled back to %s", self.id, predicted, observed)
+        return observed
+
+    def _rollback_prediction(self) -> None:
+        """Expire a pending prediction: the observed state is shown on the next update."""
+        if self._prediction is not None:
+            predicted, expected, _ = self._prediction
+            self._prediction = (predicted, expected, 0.0)
+
+    def watch_state(self, expected: set[States] | None, timeout: float = POWER_CONVERGENCE_TIMEOUT) -> None:
+        """
+        Poll the device state after a command until it converges, replacing any running watcher.
+
+        The device is polled with a growing interval from CONVERGENCE_MIN_INTERVAL to CONVERGENCE_MAX_INTERVAL.
+
+        :param expected: states to wait for, None to wait for any change of the current state
+        :param timeout: maximum duration of the watch in seconds
+        """
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            self._watch_task = None
+        try:
+            self._watch_task = self.tasks.spawn(self._watch_state(expected, self.state, timeout), "watch")
+        except TaskLimitError as ex:
+            # the command was sent, its state is observed on the next refresh
+            _LOGGER.debug("[%s] State not watched: %s", self.id, ex)
+
+    async def _watch_state(self, expected: set[States] | None, initial_state: States, timeout: float) -> None:
+        stop_at = self._event_loop.time() + timeout
+        interval = CONVERGENCE_MIN_INTERVAL
+        try:
+            while True:
+                remaining = stop_at - self._event_loop.time()
+                if remaining <= 0:
+                    _LOGGER.debug("[%s] State did not converge to %s within %ss (state %s)", self.id,
+                                  expected, timeout, self.state)
+                    if self._prediction is not None:
+                        self._rollback_prediction()
+                        await self.update()
+                    return
+                await asyncio.sleep(min(interval, remaining))
+                await self.update()
+                converged = (self.state != initial_state) if expected is None else (self.state in expected)
+                if converged and self._prediction is None:
+                    _LOGGER.debug("[%s] State converged to %s", self.id, self.state)
+                    return
+                interval = min(interval * 2, CONVERGENCE_MAX_INTERVAL)
+        finally:
+            if self._watch_task is asyncio.current_task():
+                self._watch_task = None
+
+    def restore_state(self, snapshot: dict) -> bool:
+        """
+        Restore a state persisted from state_snapshot, until it is verified by the next update.
+
+        The learned key interval is restored whatever the age of the snapshot.
+
+        :return: True if the state was restored, False if the snapshot is invalid or too old.
+        """
+        try:
+            self._pacer = KeyPacer(float(snapshot["key_interval"]))
+            self._persisted_key_interval = self._pacer.interval
+        except (KeyError, TypeError, ValueError):
+            pass
+        try:
+            state = States(snapshot["state"])
+            updated_at = float(snapshot.get("updated_at", 0))
+        except (KeyError, TypeError, ValueError):
+            return False
+        if time.time() - updated_at > STATE_MAX_AGE:
+            return False
+        self._state = state
+        self._transport_state = snapshot.get("transport_state")
+        self._state_updated_at = updated_at
+        return True
+
+    @property
+    def state_snapshot(self) -> dict:
+        """Return the last observed state to persist."""
+        return {
+            "state": self._state.value,
+            "transport_state": self._transport_state,
+            "updated_at": self._state_updated_at,
+            "key_interval": None if self._pacer.interval is None else round(self._pacer.interval, 3),
+        }
+
     @property
     def attributes(self) -> dict[str, any]:
         """Return the device attributes."""
         updated_data = {
-            Attributes.STATE: self.state
+            Attributes.STATE: self.state,
+            Attributes.MEDIA_POSITION: self.media_position,
+            Attributes.MEDIA_DURATION: self.media_duration,
         }
         return updated_data
 
+    @property
+    def connection_state(self) -> ConnectionState:
+        return self._connection_state
+
     @property
     def id(self):
         return self._id
 
+    @property
+    def udn(self) -> str | None:
+        """Return the unique device name (uuid:...) read from the device description, None until connected."""
+        return self._sony_device.udn if self._sony_device else None
+
     @property
     def state(self) -> States:
         return self._state
@@ -259,44 +749,120 @@ class SonyBlurayDevice(object):
         return self._media_duration
 
     @property
-    def media_position(self):
-        return self._media_position
+    def media_position(self) -> int:
+        """Return the playback position in seconds, interpolated since it was read while playing."""
+        if self._position_task is None:
+            return self._media_position
+        position = self._media_position + int(time.monotonic() - self._position_updated_at)
+        if self._media_duration:
+            position = min(position, self._media_duration)
+        return position
 
     @property
     def is_on(self):
         return self.state in [States.PAUSED, States.PLAYING, States.ON]
 
+    async def send_key(self, key) -> ucapi.StatusCodes:
+        """
+        Send a key.
+
+        In the queued commands mode, a known key is acknowledged at once and sent in background. The key is sent
+        right away while the device is not connected, to report the connection errors.
+        """
+        if self._connection_state == ConnectionState.READY and key not in self._sony_device.commands:
+            # same answer in both modes, the device does not need to be reached
+            _LOGGER.warning("[%s] Unknown key %s", self.id, key)
+            return ucapi.StatusCodes.BAD_REQUEST
+        if not self._device_config.queue_commands or self._connection_state != ConnectionState.READY:
+            return await self._send_key(key)
+        try:
+            self._key_queue.put_nowait((key, tracing.current_trace(), time.monotonic()))
+        except asyncio.QueueFull:
+            _LOGGER.warning("[%s] Too many keys waiting to be sent, %s dropped", self.id, key)
+            command_queue_metrics.record(self.id, QUEUE_DROPPED)
+            return ucapi.StatusCodes.SERVICE_UNAVAILABLE
+        command_queue_metrics.record(self.id, QUEUE_ENQUEUED)
+        if self._key_task is None:
+            self._key_task = self.tasks.spawn(self._send_queued_keys(), "commands")
+        return ucapi.StatusCodes.OK
+
+    async def _send_queued_keys(self):
+        try:
+            while True:
+                key, trace, enqueued_at = await self._key_queue.get()
+                # the keys of the queue are paced as a stream
+                with tracing.resume(trace), pacing.stream():
+                    if trace is not None:
+                        trace.add_span(tracing.STAGE_QUEUE, enqueued_at, time.monotonic())
+                    try:
+                        status = await self._send_key(key)
+                    except Exception as ex:  # pylint: disable=W0718
+                        # e.g. too many reconnection tasks: the next keys are still sent
+                        _LOGGER.error("[%s] Error sending queued key %s: %r", self.id, key, ex)
+                        status = ucapi.StatusCodes.SERVER_ERROR
+                if status == ucapi.StatusCodes.OK:
+                    command_queue_metrics.record(self.id, QUEUE_DELIVERED)
+                else:
+                    _LOGGER.warning("[%s] Queued key %s not sent: %s", self.id, key, status)
+                    command_queue_metrics.record(self.id, QUEUE_FAILED)
+                    self.events.emit(Events.COMMAND_FAILED, self.id, key, status)
+        finally:
+            if self._key_task is asyncio.current_task():
+                self._key_task = None
+
+    def _drop_queued_keys(self) -> None:
+        while not self._key_queue.empty():
+            key, _, _ = self._key_queue.get_nowait()
+            _LOGGER.debug("[%s] Queued key %s dropped", self.id, key)
+            command_queue_metrics.record(self.id, QUEUE_DROPPED)
+
     @cmd_wrapper
-    async def send_key(self, key):
-        await self._sony_device._send_command(key)
+    async def _send_key(self, key):
+        if pacing.in_stream():
+            with tracing.span(tracing.STAGE_PACING):
+                await self._pacer.wait()
+        start = time.monotonic()
+        try:
+            response = await self._sony_device._send_command(key)
+        except Exception as ex:
+            if _is_busy_device_error(ex):
+                self._observe_key(time.monotonic() - start, failed=True)
+            raise
+        if response is None:
+            # the device could not be connected to, the time spent tells nothing about its response time
+            return
+        self._observe_key(time.monotonic() - start)
+
+    def _observe_key(self, latency: float, failed: bool = False) -> None:
+        self._pacer.observe(latency, failed)
+        # the interval is persisted once a key is acknowledged, never while the device may be unreachable
+        if failed:
+            return
+        if self._persisted_key_interval is None or abs(self._pacer.interval - self._persisted_key_interval) > (
+                KEY_INTERVAL_PERSIST_CHANGE * self._persisted_key_interval):
+            self._persisted_key_interval = self._pacer.interval
+            self.events.emit(Events.PACING_LEARNED, self.id)
 
     @cmd_wrapper
     async def toggle(self):
         if not self._device_config.polling:
             if self._sony_device.initialized:
-                power_status = await self._sony_device.get_power_status(timeout=2)
-                if not power_status:
-                    await self._sony_device.power(True)
-                else:
-                    await self._sony_device.power(False)
+                power_status = await self._sony_device.get_power_status(timeout=POWER_STATUS_TIMEOUT)
             else:
-                await self._sony_device.power(True)
-            self._event_loop.create_task(self.update(10))
-            self._event_loop.create_task(self.update(20))
-            return
-
-        if not self.is_on:
-            await self._sony_device.power(True)
+                power_status = False
         else:
-            await self._sony_device.power(False)
+            power_status = self.is_on
+        await self._sony_device.power(not power_status)
+        if power_status:
+            self._predict_state(States.OFF, {States.OFF})
+        else:
+            self._predict_state(States.ON, ON_STATES)
 
     async def turn_on(self) -> ucapi.StatusCodes:
         _LOGGER.debug("Turn on (state %s)", self.state)
         try:
             await self._sony_device.power(True)
-            if not self._device_config.polling:
-                self._event_loop.create_task(self.update(10))
-                self._event_loop.create_task(self.update(20))
+            self._predict_state(States.ON, ON_STATES)
             return ucapi.StatusCodes.OK
         except Exception as ex:
             _LOGGER.debug("Error turn on %s", ex)
@@ -305,57 +871,49 @@ class SonyBlurayDevice(object):
     @cmd_wrapper
     async def turn_off(self):
         if not self._device_config.polling:
-            power_status = await self._sony_device.get_power_status(timeout=2)
+            power_status = await self._sony_device.get_power_status(timeout=POWER_STATUS_TIMEOUT)
             if power_status:
                 await self._sony_device.power(False)
-            self._event_loop.create_task(self.update(10))
+            self._predict_state(States.OFF, {States.OFF})
             return
 
         if self.is_on:
             await self._sony_device.power(False)
+            self._predict_state(States.OFF, {States.OFF})
 
-    @cmd_wrapper
     async def channel_up(self):
-        return await self._sony_device.next()
+        return await self.send_key("Next")
 
-    @cmd_wrapper
     async def channel_down(self):
-        return await self._sony_device.prev()
+        return await self.send_key("Prev")
 
     @cmd_wrapper
     async def play_pause(self):
-        if not self._device_config.polling:
-            self._event_loop.create_task(self.update())
-        return await self._sony_device.pause()
+        await self._sony_device.pause()
+        self.watch_state(None, TRANSPORT_CONVERGENCE_TIMEOUT)
 
     @cmd_wrapper
     async def play(self):
-        if not self._device_config.polling:
-            self._event_loop.create_task(self.update())
         await self._sony_device.play()
+        self._predict_state(States.PLAYING, {States.PLAYING}, TRANSPORT_CONVERGENCE_TIMEOUT)
 
     @cmd_wrapper
     async def pause(self):
-        if not self._device_config.polling:
-            self._event_loop.create_task(self.update())
         await self._sony_device.pause()
+        self.watch_state(None, TRANSPORT_CONVERGENCE_TIMEOUT)
 
     @cmd_wrapper
     async def stop(self):
-        if not self._device_config.polling:
-            self._event_loop.create_task(self.update())
         await self._sony_device.stop()
+        self._predict_state(States.ON, {States.ON, States.OFF}, TRANSPORT_CONVERGENCE_TIMEOUT)
 
     @cmd_wrapper
     async def eject(self):
-        if not self._device_config.polling:
-            self._event_loop.create_task(self.update())
         await self._sony_device.eject()
+        self.watch_state(None, TRANSPORT_CONVERGENCE_TIMEOUT)
 
-    @cmd_wrapper
     async def fast_forward(self):
-        await self._sony_device.forward()
+        return await self.send_key("Forward")
 
-    @cmd_wrapper
     async def rewind(self):
-        await self._sony_device.rewind()
+        return await self.send_key("Rewind")
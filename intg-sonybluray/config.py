@@ -5,10 +5,12 @@ Configuration handling of the integration driver.
 :license: Mozilla Public License Version 2.0, see LICENSE for more details.
 """
 
+import asyncio
 import dataclasses
 import json
 import logging
 import os
+import threading
 from dataclasses import dataclass
 from typing import Iterator
 
@@ -18,6 +20,8 @@ from const import IRCC_PORT, APP_PORT, DMR_PORT
 _LOG = logging.getLogger(__name__)
 
 _CFG_FILENAME = "config.json"
+# Delay in seconds to coalesce configuration changes before writing the configuration file
+STORE_DEBOUNCE = 0.5
 
 
 def create_entity_id(device_id: str, entity_type: EntityTypes) -> str:
@@ -37,6 +41,23 @@ def device_from_entity_id(entity_id: str) -> str | None:
     return entity_id.split(".", 1)[1]
 
 
+def normalize_mac(mac_address: str | None) -> str | None:
+    """Return the mac address in lower case with colon separators, or None if not set."""
+    if not mac_address:
+        return None
+    return mac_address.strip().lower().replace("-", ":")
+
+
+def write_file_atomic(path: str, data: str) -> None:
+    """Write the given content to a temporary file and rename it to the target path."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
 @dataclass
 class DeviceInstance:
     """Orange TV device configuration."""
@@ -53,10 +74,11 @@ class DeviceInstance:
     mac_address: str
     pin_code: int
     polling: bool
+    queue_commands: bool
 
     def __init__(self, id, name, address, pin_code, client_name, always_on=False, app_port=APP_PORT, dmr_port=DMR_PORT,
                  ircc_port=IRCC_PORT, password_key=None,
-                 mac_address=None, polling=False):
+                 mac_address=None, polling=False, queue_commands=False):
         self.id = id
         self.name = name
         self.client_name = client_name
@@ -69,6 +91,8 @@ class DeviceInstance:
         self.mac_address = mac_address
         self.pin_code = pin_code
         self.polling = polling
+        # acknowledge the keys at once and send them in background
+        self.queue_commands = queue_commands
 
 
 class _EnhancedJSONEncoder(json.JSONEncoder):
@@ -92,8 +116,17 @@ class Devices:
         self._data_path: str = data_path
         self._cfg_file_path: str = os.path.join(data_path, _CFG_FILENAME)
         self._config: list[DeviceInstance] = []
+        self._by_id: dict[str, DeviceInstance] = {}
+        self._by_address: dict[str, DeviceInstance] = {}
+        self._by_mac: dict[str, DeviceInstance] = {}
         self._add_handler = add_handler
         self._remove_handler = remove_handler
+        self._store_handle: asyncio.TimerHandle | None = None
+        self._store_task: asyncio.Task | None = None
+        self._store_pending = False
+        # incremented when the configuration is cleared, so that a write in progress doesn't create the file again
+        self._generation = 0
+        self._write_lock = threading.Lock()
 
         self.load()
 
@@ -106,12 +139,15 @@ class Devices:
         """Get an iterator for all device configurations."""
         return iter(self._config)
 
+    def _reindex(self) -> None:
+        """Rebuild the lookup indexes after a change of the configured devices."""
+        self._by_id = {item.id: item for item in self._config}
+        self._by_address = {item.address: item for item in self._config if item.address}
+        self._by_mac = {normalize_mac(item.mac_address): item for item in self._config if item.mac_address}
+
     def contains(self, avr_id: str) -> bool:
         """Check if there's a device with the given device identifier."""
-        for item in self._config:
-            if item.id == avr_id:
-                return True
-        return False
+        return avr_id in self._by_id
 
     def get_by_id_or_address(self, unique_id: str, address: str) -> DeviceInstance | None:
         """
@@ -119,69 +155,79 @@ class Devices:
 
         :return: A copy of the device configuration or None if not found.
         """
-        for item in self._config:
-            if item.id == unique_id or item.address == address:
-                # return a copy
-                return dataclasses.replace(item)
-        return None
+        item = self._by_id.get(unique_id) or self._by_address.get(address)
+        # return a copy
+        return dataclasses.replace(item) if item else None
+
+    def get_by_mac(self, mac_address: str) -> DeviceInstance | None:
+        """
+        Get device configuration for a matching mac address, in any notation.
+
+        :return: A copy of the device configuration or None if not found.
+        """
+        item = self._by_mac.get(normalize_mac(mac_address))
+        return dataclasses.replace(item) if item else None
 
     def add(self, atv: DeviceInstance) -> None:
         """Add a new configured Sony device."""
-        existing = self.get_by_id_or_address(atv.id, atv.address)
+        existing = self._by_id.get(atv.id) or self._by_address.get(atv.address)
         if existing:
             _LOG.debug("Replacing existing device %s => %s", existing, atv)
             self._config.remove(existing)
 
         self._config.append(atv)
+        self._reindex()
         if self._add_handler is not None:
             self._add_handler(atv)
 
     def get(self, avr_id: str) -> DeviceInstance | None:
         """Get device configuration for given identifier."""
-        for item in self._config:
-            if item.id == avr_id:
-                # return a copy
-                return dataclasses.replace(item)
-        return None
+        item = self._by_id.get(avr_id)
+        # return a copy
+        return dataclasses.replace(item) if item else None
 
     def update(self, device_instance: DeviceInstance) -> bool:
         """Update a configured Sony device and persist configuration."""
-        for item in self._config:
-            if item.id == device_instance.id:
-                item.address = device_instance.address
-                item.name = device_instance.name
-                item.always_on = device_instance.always_on
-                item.password_key = device_instance.password_key
-                item.app_port = device_instance.app_port
-                item.dmr_port = device_instance.dmr_port
-                item.ircc_port = device_instance.ircc_port
-                item.mac_address = device_instance.mac_address
-                item.pin_code = device_instance.pin_code
-                item.client_name = device_instance.client_name
-                item.polling = device_instance.polling
-                return self.store()
-        return False
+        item = self._by_id.get(device_instance.id)
+        if item is None:
+            return False
+        item.address = device_instance.address
+        item.name = device_instance.name
+        item.always_on = device_instance.always_on
+        item.password_key = device_instance.password_key
+        item.app_port = device_instance.app_port
+        item.dmr_port = device_instance.dmr_port
+        item.ircc_port = device_instance.ircc_port
+        item.mac_address = device_instance.mac_address
+        item.pin_code = device_instance.pin_code
+        item.client_name = device_instance.client_name
+        item.polling = device_instance.polling
+        item.queue_commands = device_instance.queue_commands
+        self._reindex()
+        return self.store()
 
     def remove(self, device_id: str) -> bool:
         """Remove the given device configuration."""
-        device = self.get(device_id)
+        device = self._by_id.get(device_id)
         if device is None:
             return False
-        try:
-            self._config.remove(device)
-            if self._remove_handler is not None:
-                self._remove_handler(device)
-            return True
-        except ValueError:
-            pass
-        return False
+        self._config.remove(device)
+        self._reindex()
+        if self._remove_handler is not None:
+            self._remove_handler(device)
+        return True
 
     def clear(self) -> None:
         """Remove the configuration file."""
         self._config = []
+        self._reindex()
+        self._cancel_store()
 
-        if os.path.exists(self._cfg_file_path):
-            os.remove(self._cfg_file_path)
+        # waits for a write in progress in the executor
+        with self._write_lock:
+            self._generation += 1
+            if os.path.exists(self._cfg_file_path):
+                os.remove(self._cfg_file_path)
 
         if self._remove_handler is not None:
             self._remove_handler(None)
@@ -190,14 +236,74 @@ class Devices:
         """
         Store the configuration file.
 
+        Within the event loop, the write is debounced to coalesce successive changes and runs in an executor thread:
+        its failures are logged, use flush to get the result.
+
+        :return: True if the configuration could be saved or the write has been scheduled.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return self._write(self._serialize(), self._generation)
+
+        if self._store_handle:
+            self._store_handle.cancel()
+        self._store_handle = loop.call_later(STORE_DEBOUNCE, self._start_store_task)
+        return True
+
+    async def flush(self) -> bool:
+        """
+        Write the pending configuration changes now.
+
         :return: True if the configuration could be saved.
         """
+        self._cancel_store()
+        if self._store_task:
+            await asyncio.shield(self._store_task)
+        return await asyncio.get_running_loop().run_in_executor(None, self._write, self._serialize(),
+                                                                self._generation)
+
+    def _cancel_store(self) -> None:
+        if self._store_handle:
+            self._store_handle.cancel()
+            self._store_handle = None
+        self._store_pending = False
+
+    def _start_store_task(self) -> None:
+        self._store_handle = None
+        if self._store_task:
+            # a write is in progress: write again once it is done with the latest configuration
+            self._store_pending = True
+            return
+        self._store_task = asyncio.get_running_loop().create_task(self._store_async())
+
+    async def _store_async(self) -> None:
+        loop = asyncio.get_running_loop()
         try:
-            with open(self._cfg_file_path, "w+", encoding="utf-8") as f:
-                json.dump(self._config, f, ensure_ascii=False, cls=_EnhancedJSONEncoder)
-            return True
-        except OSError:
-            _LOG.error("Cannot write the config file")
+            while True:
+                self._store_pending = False
+                await loop.run_in_executor(None, self._write, self._serialize(), self._generation)
+                if not self._store_pending:
+                    break
+        except Exception as ex:  # pylint: disable=W0718
+            _LOG.error("Cannot write the config file: %r", ex)
+        finally:
+            self._store_task = None
+
+    def _serialize(self) -> str:
+        # serialized in the loop thread, the configuration may be changed while the file is written
+        return json.dumps(self._config, ensure_ascii=False, cls=_EnhancedJSONEncoder)
+
+    def _write(self, data: str, generation: int) -> bool:
+        with self._write_lock:
+            if generation != self._generation:
+                _LOG.debug("Configuration cleared, pending write discarded")
+                return False
+            try:
+                write_file_atomic(self._cfg_file_path, data)
+                return True
+            except OSError as ex:
+                _LOG.error("Cannot write the config file: %s", ex)
 
         return False
 
@@ -215,6 +321,7 @@ class Devices:
                     self._config.append(DeviceInstance(**item))
                 except TypeError as ex:
                     _LOG.warning("Invalid configuration entry will be ignored: %s", ex)
+            self._reindex()
             return True
         except OSError:
             _LOG.error("Cannot open the config file")
@@ -0,0 +1,103 @@
+"""
+Persistence of the last known state of the configured devices.
+
+The state is restored at startup so that entities show a plausible state immediately, without any network I/O.
+
+:copyright: (c) 2024 by Unfolded Circle ApS.
+:license: Mozilla Public License Version 2.0, see LICENSE for more details.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+
+from config import write_file_atomic
+
+_LOG = logging.getLogger(__name__)
+
+_STATE_DIRECTORY = "state"
+# Delay in seconds to coalesce state changes before writing a state file
+STORE_DEBOUNCE = 2
+
+
+class DeviceStateStore:
+    """Store a compact state file per device."""
+
+    def __init__(self, data_path: str):
+        """
+        Create the store.
+
+        :param data_path: configuration path, the state files are stored in a sub directory.
+        """
+        self._path = os.path.join(data_path, _STATE_DIRECTORY)
+        self._pending: dict[str, dict] = {}
+        self._store_handles: dict[str, asyncio.TimerHandle] = {}
+        # writes running in the executor
+        self._writes: set[asyncio.Future] = set()
+
+    def _file_path(self, device_id: str) -> str:
+        return os.path.join(self._path, re.sub(r"[^\w.-]", "_", device_id) + ".json")
+
+    def load(self, device_id: str) -> dict | None:
+        """
+        Load the last known state of the given device.
+
+        :return: the state dictionary or None if not available.
+        """
+        try:
+            with open(self._file_path(device_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as ex:
+            _LOG.warning("[%s] Cannot read the state file: %s", device_id, ex)
+            return None
+
+    def save(self, device_id: str, state: dict) -> None:
+        """Persist the state of the given device, the write is debounced and runs in an executor thread."""
+        self._pending[device_id] = state
+        if device_id in self._store_handles:
+            return
+        loop = asyncio.get_running_loop()
+        self._store_handles[device_id] = loop.call_later(STORE_DEBOUNCE, self._start_write, device_id)
+
+    def remove(self, device_id: str) -> None:
+        """Remove the state file of the given device."""
+        self._pending.pop(device_id, None)
+        handle = self._store_handles.pop(device_id, None)
+        if handle:
+            handle.cancel()
+        try:
+            os.remove(self._file_path(device_id))
+        except OSError:
+            pass
+
+    async def flush(self) -> None:
+        """Write the pending states now, e.g. before the driver exits."""
+        for handle in self._store_handles.values():
+            handle.cancel()
+        self._store_handles.clear()
+        # a state being written is older than the pending one of the same device
+        if self._writes:
+            await asyncio.gather(*self._writes)
+        pending, self._pending = self._pending, {}
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(None, self._write, device_id, json.dumps(state))
+                               for device_id, state in pending.items()))
+
+    def _start_write(self, device_id: str) -> None:
+        self._store_handles.pop(device_id, None)
+        state = self._pending.pop(device_id, None)
+        if state is not None:
+            write = asyncio.get_running_loop().run_in_executor(None, self._write, device_id, json.dumps(state))
+            self._writes.add(write)
+            write.add_done_callback(self._writes.discard)
+
+    def _write(self, device_id: str, data: str) -> None:
+        try:
+            os.makedirs(self._path, exist_ok=True)
+            write_file_atomic(self._file_path(device_id), data)
+        except OSError as ex:
+            _LOG.error("[%s] Cannot write the state file: %s", device_id, ex)
@@ -3,20 +3,24 @@
 """This module implements a discovery function for Orange TV."""
 
 import asyncio
+import ipaddress
 import logging
-import re
 import socket
 import xml.etree.ElementTree as ET
-from typing import Dict, List, Optional, Set, Tuple
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
 from urllib.parse import urlparse
 
 import httpx
+import ifaddr
 
 # import netifaces
 from defusedxml import DefusedXmlException
 from defusedxml.ElementTree import ParseError, fromstring
 from httpx import Response
 
+from const import DMR_PORT, IRCC_PORT
+from sonyapilib.ssdp import parse_ssdp
+
 _LOGGER = logging.getLogger(__name__)
 
 SSDP_ADDR = "239.255.255.250"
@@ -29,7 +33,6 @@ SSDP_ST_3 = "urn:schemas-upnp-org:device:Basic:1"
 
 SSDP_ST_LIST = (SSDP_ST_1, SSDP_ST_2, SSDP_ST_3)
 
-SSDP_LOCATION_PATTERN = re.compile(r"(?<=LOCATION:\s).+?(?=\r)")
 
 SCPD_XMLNS = "{urn:schemas-upnp-org:device-1-0}"
 SCPD_DEVICE = f"{SCPD_XMLNS}device"
@@ -44,6 +47,15 @@ SCPD_PRESENTATIONURL = f"{SCPD_XMLNS}presentationURL"
 SUPPORTED_DEVICETYPES = [
     "urn:schemas-upnp-org:device:Basic:1",
 ]
+# dmr.xml describes the player as a media renderer
+SWEEP_DEVICETYPES = SUPPORTED_DEVICETYPES + ["urn:schemas-upnp-org:device:MediaRenderer:1"]
+
+# Number of concurrent connections and connection timeout in seconds of the subnet sweep
+SWEEP_CONCURRENCY = 128
+SWEEP_CONNECT_TIMEOUT = 0.5
+# Minimum prefix length of the swept local networks, larger networks are reduced to the /24 network of the local address
+SWEEP_MIN_PREFIX = 24
+SWEEP_MAX_HOSTS = 1024
 
 SUPPORTED_MANUFACTURERS = ["Sony Corporation"]
 
@@ -128,12 +140,33 @@ async def async_send_ssdp_broadcast() -> Set[str]:
     return urls
 
 
+async def async_search_devices() -> Dict[str, str]:
+    """
+    Send SSDP broadcast messages to discover UPnP devices.
+
+    Returns a dictionary of the unique device name (uuid:...) and the SCPD XML resource url of the responding devices.
+    """
+    tasks = [async_ssdp_search(ip_addr) for ip_addr in get_local_ips()]
+    tasks.append(async_ssdp_search(""))
+    devices = {}
+    for protocol in await asyncio.gather(*tasks):
+        if protocol is not None:
+            devices.update(protocol.devices)
+    return devices
+
+
 async def async_send_ssdp_broadcast_ip(ip_addr: str) -> Set[str]:
     """Send SSDP broadcast messages to a single IP."""
+    protocol = await async_ssdp_search(ip_addr)
+    return protocol.urls if protocol is not None else set()
+
+
+async def async_ssdp_search(ip_addr: str) -> Optional["SonyBluraySSDP"]:
+    """Send SSDP broadcast messages from a single IP and collect the responses until the timeout period."""
     try:
         # Ignore 169.254.0.0/16 addresses
         if ip_addr.startswith("169.254."):
-            return set()
+            return None
 
         # Prepare socket
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
@@ -151,13 +184,92 @@ async def async_send_ssdp_broadcast_ip(ip_addr: str) -> Set[str]:
 
         _LOGGER.debug("Got %s results after SSDP queries using ip %s", len(protocol.urls), ip_addr)
 
-        return protocol.urls
+        return protocol
     # pylint: disable = W0718
     except Exception:
-        return set()
+        return None
+
+
+def local_networks() -> List[ipaddress.IPv4Network]:
+    """Return the IPv4 networks of the local network adapters, reduced to /24 networks."""
+    networks = []
+    for adapter in ifaddr.get_adapters():
+        for ip in adapter.ips:
+            if not ip.is_IPv4 or ip.network_prefix >= 31:
+                continue
+            network = ipaddress.IPv4Network(f"{ip.ip}/{max(ip.network_prefix, SWEEP_MIN_PREFIX)}", strict=False)
+            if network.is_loopback or network.is_link_local or network in networks:
+                continue
+            networks.append(network)
+    return networks
+
+
+async def async_sweep_sonybluray_devices(networks: Optional[Iterable[ipaddress.IPv4Network]] = None) -> List[Dict]:
+    """
+    Identify devices by probing every host of the given networks, without multicast.
+
+    Hosts accepting a connection on the DMR or IRCC port are identified with their SCPD XML description.
+
+    :param networks: networks to sweep, defaults to the local networks
+    :return: same result as async_identify_sonybluray_devices
+    """
+    hosts = []
+    for network in networks if networks is not None else local_networks():
+        hosts.extend(str(host) for host in network.hosts())
+    hosts = list(dict.fromkeys(hosts))[:SWEEP_MAX_HOSTS]
+    _LOGGER.debug("Sweeping %s hosts", len(hosts))
+
+    semaphore = asyncio.Semaphore(SWEEP_CONCURRENCY)
+    results = await asyncio.gather(*(_async_probe_host(host, semaphore) for host in hosts))
+    urls = [url for url in results if url]
+    _LOGGER.debug("Hosts responding to the sweep: %s", urls)
+
+    async with httpx.AsyncClient() as client:
+        responses = await asyncio.gather(*(client.get(url, timeout=5.0) for url in urls), return_exceptions=True)
+    devices = []
+    for url, res in zip(urls, responses):
+        if isinstance(res, Exception) or res.is_error:
+            continue
+        device = evaluate_scpd_xml(url, res, SWEEP_DEVICETYPES)
+        if device is not None:
+            devices.append(device)
+    return devices
+
+
+async def _async_probe_host(host: str, semaphore: asyncio.Semaphore) -> Optional[str]:
+    """Return the SCPD XML resource url of the host if its DMR or IRCC port accepts connections."""
+    for port, path in ((DMR_PORT, "/dmr.xml"), (IRCC_PORT, "/Ircc.xml")):
+        async with semaphore:
+            try:
+                _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), SWEEP_CONNECT_TIMEOUT)
+            except (OSError, asyncio.TimeoutError):
+                continue
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+        return f"http://{host}:{port}{path}"
+    return None
+
+
+def parse_network(value: str) -> Optional[ipaddress.IPv4Network]:
+    """
+    Parse a network range in CIDR notation given by the user.
+
+    :return: the network, or None if the value is not a network range.
+    :raises ValueError: if the network range has more than SWEEP_MAX_HOSTS hosts.
+    """
+    if "/" not in value:
+        return None
+    network = ipaddress.IPv4Network(value.strip(), strict=False)
+    if network.num_addresses - 2 > SWEEP_MAX_HOSTS:
+        raise ValueError(f"Network range {network} is too large")
+    return network
 
 
-def evaluate_scpd_xml(url: str, response: Response) -> Optional[Dict]:
+def evaluate_scpd_xml(url: str, response: Response,
+                      device_types: Sequence[str] = tuple(SUPPORTED_DEVICETYPES)) -> Optional[Dict]:
     """
     Evaluate SCPD XML.
 
@@ -178,11 +290,11 @@ def evaluate_scpd_xml(url: str, response: Response) -> Optional[Dict]:
         if not device["manufacturer"] in SUPPORTED_MANUFACTURERS:
             return None
 
-        if root.find(SCPD_DEVICE).find(SCPD_DEVICETYPE).text in SUPPORTED_DEVICETYPES:
+        if root.find(SCPD_DEVICE).find(SCPD_DEVICETYPE).text in device_types:
             device_xml = root.find(SCPD_DEVICE)
         elif root.find(SCPD_DEVICE).find(SCPD_DEVICELIST) is not None:
             for dev in root.find(SCPD_DEVICE).find(SCPD_DEVICELIST):
-                if dev.find(SCPD_DEVICETYPE).text in SUPPORTED_DEVICETYPES and dev.find(SCPD_SERIALNUMBER) is not None:
+                if dev.find(SCPD_DEVICETYPE).text in device_types and dev.find(SCPD_SERIALNUMBER) is not None:
                     device_xml = dev
                     break
 
@@ -219,6 +331,8 @@ class SonyBluraySSDP(asyncio.DatagramProtocol):
     def __init__(self) -> None:
         """Create instance."""
         self.urls = set()
+        # unique device name (uuid:...) -> location url
+        self.devices: Dict[str, str] = {}
 
     def connection_made(self, transport: asyncio.DatagramTransport) -> None:
         """Send SSDP request when connection was made."""
@@ -229,11 +343,11 @@ class SonyBluraySSDP(asyncio.DatagramProtocol):
             _LOGGER.debug("SSDP request sent %s", request)
 
     def datagram_received(self, data: bytes, addr: Tuple[str, int]) -> None:
-        """Receive responses to SSDP call."""
-        # Some string operations to get the receivers URL
-        # which could be found between LOCATION and end of line of the response
-        _LOGGER.debug("Response to SSDP call received: %s", data)
-        data_text = data.decode("utf-8")
-        match = SSDP_LOCATION_PATTERN.search(data_text)
-        if match:
-            self.urls.add(match.group(0))
+        """Receive responses to SSDP call, the responses of other devices than Sony are ignored."""
+        record = parse_ssdp(data, addr[0], sony_only=True)
+        if record is None or record.notify or not record.location:
+            return
+        _LOGGER.debug("Response to SSDP call received: %s", record)
+        self.urls.add(record.location)
+        if record.uuid:
+            self.devices[record.uuid] = record.location
@@ -7,8 +7,10 @@ This module implements a Remote Two integration driver for Orange STB.
 """
 
 import asyncio
+import json
 import logging
 import os
+import signal
 from typing import Any
 
 import ucapi
@@ -16,11 +18,18 @@ from ucapi.media_player import Attributes as MediaAttr
 
 import client
 import config
+import device_state
+import log_buffer
+import loop_monitor
 import media_player
+import rediscovery
 import remote
 import setup_flow
+import ssdp_listener
 from client import SonyBlurayDevice
 from config import device_from_entity_id
+from sonyapilib.metrics import command_queue_metrics, dump_prometheus, http_metrics, prediction_metrics
+from sonyapilib.ssdp import SSDPRecord
 
 _LOG = logging.getLogger("driver")  # avoid having __main__ in log messages
 _LOOP = asyncio.get_event_loop()
@@ -30,6 +39,12 @@ api = ucapi.IntegrationAPI(_LOOP)
 # Map of device_id -> Orange instance
 _configured_devices: dict[str, SonyBlurayDevice] = {}
 _R2_IN_STANDBY = False
+_loop_monitor: loop_monitor.LoopMonitor | None = None
+_log_buffer: log_buffer.RingBufferHandler | None = None
+_state_store: device_state.DeviceStateStore | None = None
+_ssdp_listener: ssdp_listener.SSDPListener | None = None
+_rediscovery: rediscovery.Rediscovery | None = None
+METRICS_DUMP_INTERVAL = 60
 
 
 @api.listens_to(ucapi.Events.CONNECT)
@@ -41,7 +56,7 @@ async def on_r2_connect_cmd() -> None:
     for device in _configured_devices.values():
         # start background task
         await device.connect()
-        await _LOOP.create_task(device.update())
+        await device.update()
 
 
 @api.listens_to(ucapi.Events.DISCONNECT)
@@ -60,10 +75,9 @@ async def on_r2_enter_standby() -> None:
     """
     global _R2_IN_STANDBY
     _R2_IN_STANDBY = True
-    _LOG.debug("Enter standby event: disconnecting device(s)")
+    _LOG.debug("Enter standby event: suspending device(s)")
     for device in _configured_devices.values():
-        # start background task
-        await device.disconnect()
+        await device.enter_standby()
 
 
 @api.listens_to(ucapi.Events.EXIT_STANDBY)
@@ -79,9 +93,10 @@ async def on_r2_exit_standby() -> None:
     _LOG.debug("Exit standby event: connecting device(s)")
 
     for device in _configured_devices.values():
-        # start background task
+        # resumes from the description saved in standby, the state is refreshed in the background
         await device.connect()
-        await _LOOP.create_task(device.update())
+        device.warm_up(now=True)
+        device.tasks.spawn(device.update(), "update")
 
 
 @api.listens_to(ucapi.Events.SUBSCRIBE_ENTITIES)
@@ -101,6 +116,7 @@ async def on_subscribe_entities(entity_ids: list[str]) -> None:
 
         if device_id in _configured_devices:
             device = _configured_devices[device_id]
+            device.warm_up(now=True)
             attributes = device.attributes
             _LOG.debug("Subscribe entity %s, attributes : %s", entity_id, attributes)
             if isinstance(entity, media_player.SonyMediaPlayer):
@@ -153,6 +169,10 @@ async def on_device_connected(device_id: str):
     if device_id not in _configured_devices:
         _LOG.warning("Device %s is not configured", device_id)
         return
+    # the SSDP announcements of the device are identified by the unique device name of its description
+    udn = _configured_devices[device_id].udn
+    if udn and _rediscovery:
+        _rediscovery.learn(udn, device_id)
 
     # TODO #20 when multiple devices are supported, the device state logic isn't that simple anymore!
     await api.set_device_state(ucapi.DeviceStates.CONNECTED)
@@ -230,6 +250,47 @@ async def handle_avr_address_change(avr_id: str, address: str) -> None:
         _LOG.info("Updating IP address of configured AVR %s: %s -> %s", avr_id, device.address, address)
         device.address = address
         config.devices.update(device)
+        if avr_id in _configured_devices:
+            sony_device = _configured_devices[avr_id]
+            sony_device.set_address(address)
+            sony_device.tasks.spawn(sony_device.update(), "update")
+
+
+async def on_device_unreachable(device_id: str) -> None:
+    """Look for a device which doesn't respond at its configured address anymore."""
+    device = config.devices.get(device_id)
+    if device and device_id in _configured_devices and _rediscovery and not _R2_IN_STANDBY:
+        _rediscovery.request(device, _configured_devices[device_id].tasks.spawn)
+
+
+async def on_command_failed(device_id: str, key: str, status: ucapi.StatusCodes) -> None:
+    """Resynchronize the entity states after a queued command, already acknowledged, failed."""
+    _LOG.warning("[%s] Queued command %s failed: %s", device_id, key, status)
+    device = _configured_devices.get(device_id)
+    if device and not _R2_IN_STANDBY:
+        device.tasks.spawn(device.update(), "update")
+
+
+def on_pacing_learned(device_id: str) -> None:
+    """Persist the key interval learned for a device."""
+    if _state_store and device_id in _configured_devices:
+        _state_store.save(device_id, _configured_devices[device_id].state_snapshot)
+
+
+def on_ssdp_notification(notification: SSDPRecord) -> None:
+    """Forward an SSDP announcement to the configured device it comes from."""
+    device = _configured_devices.get(_rediscovery.device_id(notification.uuid))
+    if device is None:
+        device_config = config.devices.get_by_id_or_address("", notification.host)
+        if device_config is None or device_config.id not in _configured_devices:
+            return
+        device = _configured_devices[device_config.id]
+        if notification.uuid and device.udn and notification.uuid != device.udn:
+            # another device took the address of the configured one
+            return
+    if _R2_IN_STANDBY:
+        return
+    device.presence_hint(notification.alive, notification.host)
 
 
 async def on_avr_update(device_id: str, update: dict[str, Any] | None) -> None:
@@ -242,12 +303,14 @@ async def on_avr_update(device_id: str, update: dict[str, Any] | None) -> None:
     if update is None:
         if device_id not in _configured_devices:
             return
-        device = _configured_devices[device_id]
-        update = {
-            MediaAttr.STATE: device.state,
-        }
+        update = _configured_devices[device_id].attributes
+    elif update.keys() == {MediaAttr.MEDIA_POSITION}:
+        # interpolated position while playing
+        _LOG.debug("[%s] Sony update: %s", device_id, update)
     else:
         _LOG.info("[%s] Sony update: %s", device_id, update)
+        if MediaAttr.STATE in update and _state_store and device_id in _configured_devices:
+            _state_store.save(device_id, _configured_devices[device_id].state_snapshot)
 
     attributes = None
 
@@ -292,17 +355,25 @@ def _configure_new_device(device_config: config.DeviceInstance, connect: bool =
         device = _configured_devices[device_config.id]
     else:
         device = SonyBlurayDevice(device_config)
+        if _state_store:
+            snapshot = _state_store.load(device_config.id)
+            if snapshot and device.restore_state(snapshot):
+                _LOG.debug("[%s] Restored last known state %s", device_config.id, device.state)
 
         device.events.on(client.Events.CONNECTED, on_device_connected)
         device.events.on(client.Events.ERROR, on_avr_connection_error)
         device.events.on(client.Events.UPDATE, on_avr_update)
-        # receiver.events.on(avr.Events.IP_ADDRESS_CHANGED, handle_avr_address_change)
+        device.events.on(client.Events.IP_ADDRESS_CHANGED, handle_avr_address_change)
+        device.events.on(client.Events.UNREACHABLE, on_device_unreachable)
+        device.events.on(client.Events.COMMAND_FAILED, on_command_failed)
+        device.events.on(client.Events.PACING_LEARNED, on_pacing_learned)
+        device.presence_hints = _ssdp_listener is not None
         _configured_devices[device_config.id] = device
 
     if connect:
         # start background connection task
-        _LOOP.create_task(device.update())
-        _LOOP.create_task(on_device_connected(device_config.id))
+        device.tasks.spawn(device.update(), "update")
+        device.tasks.spawn(on_device_connected(device_config.id), "connected")
     _register_available_entities(device_config, device)
 
 
@@ -333,7 +404,11 @@ def on_device_removed(device: config.DeviceInstance | None) -> None:
     if device is None:
         _LOG.debug("Configuration cleared, disconnecting & removing all configured AVR instances")
         for configured in _configured_devices.values():
-            _LOOP.create_task(_async_remove(configured))
+            configured.tasks.spawn(_async_remove(configured), "remove")
+            if _state_store:
+                _state_store.remove(configured.id)
+            if _rediscovery:
+                _rediscovery.forget(configured.id)
         _configured_devices.clear()
         api.configured_entities.clear()
         api.available_entities.clear()
@@ -341,7 +416,11 @@ def on_device_removed(device: config.DeviceInstance | None) -> None:
         if device.id in _configured_devices:
             _LOG.debug("Disconnecting from removed AVR %s", device.id)
             configured = _configured_devices.pop(device.id)
-            _LOOP.create_task(_async_remove(configured))
+            configured.tasks.spawn(_async_remove(configured), "remove")
+            if _state_store:
+                _state_store.remove(configured.id)
+            if _rediscovery:
+                _rediscovery.forget(configured.id)
             for entity_id in _entities_from_device(configured.id):
                 api.configured_entities.remove(entity_id)
                 api.available_entities.remove(entity_id)
@@ -349,33 +428,135 @@ def on_device_removed(device: config.DeviceInstance | None) -> None:
 
 async def _async_remove(device: SonyBlurayDevice) -> None:
     """Disconnect from receiver and remove all listeners."""
-    # await device.disconnect()
+    await device.disconnect()
     device.events.remove_all_listeners()
+    http_metrics.remove_device(device.id)
+    prediction_metrics.remove_device(device.id)
+    command_queue_metrics.remove_device(device.id)
 
 
-async def main():
-    """Start the Remote Two integration driver."""
+def _metrics_file_path() -> str:
+    """Return the path of the Prometheus metrics file, overridable with UC_METRICS_FILE."""
+    return os.getenv("UC_METRICS_FILE") or os.path.join(api.config_dir_path, "metrics.prom")
+
+
+def _dump_diagnostics() -> None:
+    """Dump the runtime statistics and the latest command traces on demand (SIGUSR1)."""
+    path = _metrics_file_path()
+    try:
+        dump_prometheus(path)
+        _LOG.info("Metrics written to %s", path)
+    except OSError as ex:
+        _LOG.error("Cannot write the metrics file %s: %s", path, ex)
+
+    path = os.path.join(api.config_dir_path, "traces.json")
+    traces = {device_id: device.tracer.dump() for device_id, device in _configured_devices.items()}
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(traces, f, indent=2)
+        _LOG.info("Command traces written to %s", path)
+    except OSError as ex:
+        _LOG.error("Cannot write the traces file %s: %s", path, ex)
+
+    if _loop_monitor:
+        _LOG.info("Event loop statistics: %s", _loop_monitor.stats())
+
+    for device_id, device in _configured_devices.items():
+        _LOG.info("[%s] %d background task(s): %s", device_id, len(device.tasks), device.tasks.counts())
+
+    if _log_buffer:
+        _LOG.info("Debug log buffer written to %s", _log_buffer.dump())
+
+
+async def _dump_metrics_periodically() -> None:
+    """Keep the Prometheus metrics file up to date."""
+    path = _metrics_file_path()
+    while True:
+        await asyncio.sleep(METRICS_DUMP_INTERVAL)
+        try:
+            dump_prometheus(path)
+        except OSError as ex:
+            _LOG.error("Cannot write the metrics file %s: %s", path, ex)
+
+
+async def _flush_on_exit() -> None:
+    """Write the configuration and device state changes still debounced."""
+    await config.devices.flush()
+    if _state_store:
+        await _state_store.flush()
+
+
+def _setup_logging() -> None:
+    """Set the log levels from the environment, keeping every record in memory in production mode."""
+    global _log_buffer
+
     logging.basicConfig()
 
-    level = os.getenv("UC_LOG_LEVEL", "DEBUG").upper()
+    if os.getenv("UC_LOG_MODE", "").lower() == "production":
+        # Only warnings and errors are printed, every record is kept in memory and written to disk on error or SIGUSR1
+        console_level = os.getenv("UC_LOG_LEVEL", "WARNING").upper()
+        for handler in logging.getLogger().handlers:
+            handler.setLevel(console_level)
+        _log_buffer = log_buffer.RingBufferHandler(os.path.join(api.config_dir_path, "debug_log.txt"))
+        logging.getLogger().addHandler(_log_buffer)
+        level = "DEBUG"
+    else:
+        level = os.getenv("UC_LOG_LEVEL", "DEBUG").upper()
     logging.getLogger("client").setLevel(level)
+    logging.getLogger("device_state").setLevel(level)
     logging.getLogger("discover").setLevel(level)
     logging.getLogger("driver").setLevel(level)
+    logging.getLogger("loop_monitor").setLevel(level)
     logging.getLogger("media_player").setLevel(level)
     logging.getLogger("receiver").setLevel(level)
+    logging.getLogger("rediscovery").setLevel(level)
     logging.getLogger("setup_flow").setLevel(level)
+    logging.getLogger("sonyapilib.description").setLevel(level)
     logging.getLogger("sonyapilib.device").setLevel(level)
+    logging.getLogger("ssdp_listener").setLevel(level)
+    logging.getLogger("tasks").setLevel(level)
     # logging.getLogger("sonyapilib.device").setLevel(level)
 
+
+async def main():
+    """Start the Remote Two integration driver."""
+    global _loop_monitor
+    global _state_store
+    global _ssdp_listener
+    global _rediscovery
+
+    _setup_logging()
+
+    threshold = loop_monitor.threshold_from_env(os.getenv("UC_LOOP_MONITOR"))
+    if threshold:
+        _loop_monitor = loop_monitor.LoopMonitor(_LOOP, threshold)
+        _loop_monitor.start()
+
+    if os.getenv("UC_METRICS_FILE"):
+        _LOOP.create_task(_dump_metrics_periodically())
+    try:
+        _LOOP.add_signal_handler(signal.SIGUSR1, _dump_diagnostics)
+        _LOOP.add_signal_handler(signal.SIGTERM, _LOOP.stop)
+        _LOOP.add_signal_handler(signal.SIGINT, _LOOP.stop)
+    except (AttributeError, NotImplementedError):
+        _LOG.debug("Signal handlers not supported, diagnostics dump on demand disabled")
+
+    _rediscovery = rediscovery.Rediscovery(handle_avr_address_change)
+    listener = ssdp_listener.SSDPListener(on_ssdp_notification)
+    if await listener.start():
+        _ssdp_listener = listener
+
+    _state_store = device_state.DeviceStateStore(api.config_dir_path)
     config.devices = config.Devices(api.config_dir_path, on_device_added, on_device_removed)
     for device in config.devices.all():
         _LOG.debug("Sony device %s %s", device.id, device.address)
         _configure_new_device(device, connect=False)
 
+    # verify in background the restored states of the devices which were on
     for device in _configured_devices.values():
         if not device.is_on:
             continue
-        _LOOP.create_task(device.update())
+        device.tasks.spawn(device.update(), "update")
 
     await api.init("driver.json", setup_flow.driver_setup_handler)
 
@@ -383,3 +564,5 @@ async def main():
 if __name__ == "__main__":
     _LOOP.run_until_complete(main())
     _LOOP.run_forever()
+    # stopped by SIGTERM or SIGINT
+    _LOOP.run_until_complete(_flush_on_exit())
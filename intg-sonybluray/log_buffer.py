@@ -0,0 +1,77 @@
+"""
+In-memory ring buffer of log records for the low overhead production logging mode.
+
+Log records are kept unformatted in a fixed-size ring and are only formatted when the buffer is written to disk: when
+an error is logged, or on demand.
+
+:copyright: (c) 2024 by Unfolded Circle ApS.
+:license: Mozilla Public License Version 2.0, see LICENSE for more details.
+"""
+
+import logging
+import sys
+import threading
+import time
+from collections import deque
+
+DEFAULT_CAPACITY = 2000
+# Minimum interval in seconds between two dumps triggered by errors, e.g. while a device is unreachable
+MIN_ERROR_DUMP_INTERVAL = 60
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(name)s] %(message)s"
+
+
+class RingBufferHandler(logging.Handler):
+    """Keep the latest log records in memory and write them to a file on error or on demand."""
+
+    def __init__(self, path: str, capacity: int = DEFAULT_CAPACITY, dump_level: int = logging.ERROR):
+        """
+        Create the handler.
+
+        :param path: file the buffered records are written to
+        :param capacity: number of buffered records
+        :param dump_level: records of this level or above trigger a dump of the buffer
+        """
+        super().__init__(logging.DEBUG)
+        self.setFormatter(logging.Formatter(LOG_FORMAT))
+        self._path = path
+        self._records: deque[logging.LogRecord] = deque(maxlen=capacity)
+        self._dump_level = dump_level
+        self._last_error_dump = 0.0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """Buffer the record, formatting is deferred until the buffer is written."""
+        if record.args and isinstance(record.args, tuple):
+            # mutable arguments (like attribute dictionaries) may change before the record gets formatted
+            record.args = tuple(arg.copy() if isinstance(arg, (dict, list, set)) else arg for arg in record.args)
+        if record.exc_info and not record.exc_text:
+            # don't keep the traceback frames alive in the buffer
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        self._records.append(record)
+
+        if record.levelno >= self._dump_level:
+            now = time.monotonic()
+            if now - self._last_error_dump >= MIN_ERROR_DUMP_INTERVAL:
+                self._last_error_dump = now
+                self.dump()
+
+    def dump(self, path: str | None = None) -> str:
+        """
+        Write the buffered records to a file, in a separate thread not to block the caller.
+
+        :param path: target file, defaults to the path given at creation
+        :return: the target file
+        """
+        path = path or self._path
+        records = list(self._records)
+        threading.Thread(target=self._write, args=(path, records), name="log-dump", daemon=True).start()
+        return path
+
+    def _write(self, path: str, records: list[logging.LogRecord]) -> None:
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                for record in records:
+                    f.write(self.format(record))
+                    f.write("\n")
+        except OSError as ex:
+            sys.stderr.write(f"Cannot write the log buffer to {path}: {ex}\n")
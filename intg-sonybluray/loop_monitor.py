@@ -0,0 +1,139 @@
+"""
+Event loop responsiveness monitor.
+
+Measures the scheduling lag of the asyncio loop with a periodic heartbeat, and captures from a watchdog thread the
+stack of the callback which blocks the loop for longer than a threshold.
+
+:copyright: (c) 2024 by Unfolded Circle ApS.
+:license: Mozilla Public License Version 2.0, see LICENSE for more details.
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+_LOG = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLD = 0.1
+# Lowest configurable threshold: the watchdog thread wakes up at half the threshold
+MIN_THRESHOLD = 0.05
+HEARTBEAT_INTERVAL = 0.25
+REPORT_INTERVAL = 60
+MAX_STALLS = 10
+
+
+def threshold_from_env(value: str | None) -> float | None:
+    """
+    Return the stall threshold in seconds configured with the UC_LOOP_MONITOR environment variable.
+
+    :param value: threshold in milliseconds, raised to MIN_THRESHOLD, or 1, true, on or any other value to use the
+                  default threshold
+    :return: None if the monitor is disabled
+    """
+    if value is None or value.strip().lower() in ("", "0", "false", "no", "off"):
+        return None
+    if value.strip().lower() in ("1", "true", "yes", "on"):
+        return DEFAULT_THRESHOLD
+    try:
+        return max(MIN_THRESHOLD, float(value) / 1000)
+    except ValueError:
+        return DEFAULT_THRESHOLD
+
+
+class LoopMonitor:
+    """Monitor the scheduling lag of an asyncio loop and the callbacks which stall it."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, threshold: float = DEFAULT_THRESHOLD,
+                 heartbeat_interval: float = HEARTBEAT_INTERVAL, report_interval: float = REPORT_INTERVAL):
+        """
+        Create the monitor.
+
+        :param loop: the monitored loop
+        :param threshold: blocking duration in seconds above which the stack of the loop thread is captured
+        :param heartbeat_interval: interval of the lag measures in seconds
+        :param report_interval: interval of the reports in seconds
+        """
+        self._loop = loop
+        self._threshold = threshold
+        self._heartbeat_interval = heartbeat_interval
+        self._report_interval = report_interval
+        self._loop_thread_id: int | None = None
+        self._last_beat = time.monotonic()
+        self._stall_captured = False
+        self._stopped = threading.Event()
+        self._tasks: list[asyncio.Task] = []
+        self._lags: deque[float] = deque(maxlen=int(report_interval / heartbeat_interval) + 1)
+        self._max_lag = 0.0
+        self._stall_count = 0
+        self.stalls: deque[dict] = deque(maxlen=MAX_STALLS)
+
+    def start(self) -> None:
+        """Start monitoring, must be called from the loop thread."""
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopped.clear()
+        self._tasks = [self._loop.create_task(self._heartbeat()), self._loop.create_task(self._report())]
+        threading.Thread(target=self._watchdog, name="loop-monitor", daemon=True).start()
+        _LOG.info("Event loop monitor started, stall threshold %d ms", self._threshold * 1000)
+
+    def stop(self) -> None:
+        """Stop monitoring."""
+        self._stopped.set()
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    async def _heartbeat(self) -> None:
+        while True:
+            start = self._loop.time()
+            await asyncio.sleep(self._heartbeat_interval)
+            lag = max(0.0, self._loop.time() - start - self._heartbeat_interval)
+            self._lags.append(lag)
+            self._max_lag = max(self._max_lag, lag)
+            self._last_beat = time.monotonic()
+            self._stall_captured = False
+
+    def _watchdog(self) -> None:
+        """Capture the stack of the loop thread while it is blocked, runs in a separate thread."""
+        while not self._stopped.wait(self._threshold / 2):
+            blocked = time.monotonic() - self._last_beat - self._heartbeat_interval
+            if blocked < self._threshold or self._stall_captured:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)  # pylint: disable=protected-access
+            if frame is None:
+                continue
+            self._stall_captured = True
+            self._stall_count += 1
+            stack = "".join(traceback.format_stack(frame))
+            del frame
+            self.stalls.append({"time": time.time(), "blocked_ms": round(blocked * 1000), "stack": stack})
+            _LOG.warning("Event loop blocked for more than %d ms:\n%s", blocked * 1000, stack)
+
+    async def _report(self) -> None:
+        while True:
+            await asyncio.sleep(self._report_interval)
+            stats = self.stats()
+            _LOG.info("Event loop lag p50 %.1f ms, p99 %.1f ms, max %.1f ms, %d stall(s) over %d ms",
+                      stats["lag_p50_ms"], stats["lag_p99_ms"], stats["lag_max_ms"], stats["stalls"],
+                      self._threshold * 1000)
+            self._lags.clear()
+            self._max_lag = 0.0
+
+    def stats(self) -> dict:
+        """Return the lag statistics of the current report period and the total number of stalls."""
+        lags = sorted(self._lags)
+        if lags:
+            p50 = lags[len(lags) // 2]
+            p99 = lags[min(len(lags) - 1, int(len(lags) * 0.99))]
+        else:
+            p50 = p99 = 0.0
+        return {
+            "lag_p50_ms": p50 * 1000,
+            "lag_p99_ms": p99 * 1000,
+            "lag_max_ms": self._max_lag * 1000,
+            "stalls": self._stall_count,
+        }
@@ -14,9 +14,60 @@ from ucapi import EntityTypes, MediaPlayer, StatusCodes
 from ucapi.media_player import Attributes, Commands, DeviceClasses, Features, Options
 
 from const import SONY_SIMPLE_COMMANDS
+from sonyapilib import deadline
 
 _LOG = logging.getLogger(__name__)
 
+# media-player commands handled by a method of the device
+_DEVICE_COMMANDS = {
+    Commands.ON: "turn_on",
+    Commands.OFF: "turn_off",
+    Commands.TOGGLE: "toggle",
+    Commands.CHANNEL_UP: "channel_up",
+    Commands.CHANNEL_DOWN: "channel_down",
+    Commands.PLAY_PAUSE: "play_pause",
+    Commands.STOP: "stop",
+    Commands.EJECT: "eject",
+    Commands.FAST_FORWARD: "fast_forward",
+    Commands.REWIND: "rewind",
+    "POWER": "toggle",
+}
+# media-player commands sent as a remote key
+_KEY_COMMANDS = {
+    Commands.CURSOR_UP: "Up",
+    Commands.CURSOR_DOWN: "Down",
+    Commands.CURSOR_LEFT: "Left",
+    Commands.CURSOR_RIGHT: "Right",
+    Commands.CURSOR_ENTER: "Confirm",
+    Commands.BACK: "Return",
+    Commands.MENU: "TopMenu",
+    Commands.CONTEXT_MENU: "PopUpMenu",
+    Commands.SETTINGS: "Options",
+    Commands.HOME: "Home",
+    Commands.AUDIO_TRACK: "Audio",
+    Commands.SUBTITLE: "SubTitle",  # CLOSED_CAPTION?
+    Commands.DIGIT_0: "Num0",
+    Commands.DIGIT_1: "Num1",
+    Commands.DIGIT_2: "Num2",
+    Commands.DIGIT_3: "Num3",
+    Commands.DIGIT_4: "Num4",
+    Commands.DIGIT_5: "Num5",
+    Commands.DIGIT_6: "Num6",
+    Commands.DIGIT_7: "Num7",
+    Commands.DIGIT_8: "Num8",
+    Commands.DIGIT_9: "Num9",
+    Commands.INFO: "Display",
+    Commands.FUNCTION_RED: "Red",
+    Commands.FUNCTION_BLUE: "Blue",
+    Commands.FUNCTION_YELLOW: "Yellow",
+    Commands.FUNCTION_GREEN: "Green",
+    Commands.NEXT: "Next",
+    Commands.PREVIOUS: "Prev",
+    Commands.VOLUME_UP: "VolumeUp",
+    Commands.VOLUME_DOWN: "VolumeDown",
+    Commands.MUTE_TOGGLE: "Mute",
+}
+
 
 class SonyMediaPlayer(MediaPlayer):
     """Representation of a Sony Media Player entity."""
@@ -48,10 +99,14 @@ class SonyMediaPlayer(MediaPlayer):
             Features.PREVIOUS,
             Features.NEXT,
             Features.VOLUME_UP_DOWN,
-            Features.MUTE_TOGGLE
+            Features.MUTE_TOGGLE,
+            Features.MEDIA_POSITION,
+            Features.MEDIA_DURATION,
         ]
         attributes = {
             Attributes.STATE: device.state,
+            Attributes.MEDIA_POSITION: device.media_position,
+            Attributes.MEDIA_DURATION: device.media_duration,
         }
 
         options = {
@@ -81,96 +136,20 @@ class SonyMediaPlayer(MediaPlayer):
         if self._device is None:
             _LOG.warning("No device instance for entity: %s", self.id)
             return StatusCodes.SERVICE_UNAVAILABLE
-        elif cmd_id == Commands.ON:
-            return await self._device.turn_on()
-        elif cmd_id == Commands.OFF:
-            return await self._device.turn_off()
-        elif cmd_id == Commands.TOGGLE:
-            return await self._device.toggle()
-        elif cmd_id == Commands.CHANNEL_UP:
-            return await self._device.channel_up()
-        elif cmd_id == Commands.CHANNEL_DOWN:
-            return await self._device.channel_down()
-        elif cmd_id == Commands.PLAY_PAUSE:
-            return await self._device.play_pause()
-        elif cmd_id == Commands.STOP:
-            return await self._device.stop()
-        elif cmd_id == Commands.EJECT:
-            return await self._device.eject()
-        elif cmd_id == Commands.FAST_FORWARD:
-            return await self._device.fast_forward()
-        elif cmd_id == Commands.REWIND:
-            return await self._device.rewind()
-        elif cmd_id == Commands.CURSOR_UP:
-            return await self._device.send_key("Up")
-        elif cmd_id == Commands.CURSOR_DOWN:
-            return await self._device.send_key("Down")
-        elif cmd_id == Commands.CURSOR_LEFT:
-            return await self._device.send_key("Left")
-        elif cmd_id == Commands.CURSOR_RIGHT:
-            return await self._device.send_key("Right")
-        elif cmd_id == Commands.CURSOR_ENTER:
-            return await self._device.send_key("Confirm")
-        elif cmd_id == Commands.BACK:
-            return await self._device.send_key("Return")
-        elif cmd_id == Commands.MENU:
-            return await self._device.send_key("TopMenu")
-        elif cmd_id == Commands.CONTEXT_MENU:
-            return await self._device.send_key("PopUpMenu")
-        elif cmd_id == Commands.SETTINGS:
-            return await self._device.send_key("Options")
-        elif cmd_id == Commands.HOME:
-            return await self._device.send_key("Home")
-        elif cmd_id == Commands.AUDIO_TRACK:
-            return await self._device.send_key("Audio")
-        elif cmd_id == Commands.SUBTITLE:
-            return await self._device.send_key("SubTitle")  # CLOSED_CAPTION?
-        elif cmd_id == Commands.DIGIT_0:
-            return await self._device.send_key("Num0")
-        elif cmd_id == Commands.DIGIT_1:
-            return await self._device.send_key("Num1")
-        elif cmd_id == Commands.DIGIT_2:
-            return await self._device.send_key("Num2")
-        elif cmd_id == Commands.DIGIT_3:
-            return await self._device.send_key("Num3")
-        elif cmd_id == Commands.DIGIT_4:
-            return await self._device.send_key("Num4")
-        elif cmd_id == Commands.DIGIT_5:
-            return await self._device.send_key("Num5")
-        elif cmd_id == Commands.DIGIT_6:
-            return await self._device.send_key("Num6")
-        elif cmd_id == Commands.DIGIT_7:
-            return await self._device.send_key("Num7")
-        elif cmd_id == Commands.DIGIT_8:
-            return await self._device.send_key("Num8")
-        elif cmd_id == Commands.DIGIT_9:
-            return await self._device.send_key("Num9")
-        elif cmd_id == Commands.INFO:
-            return await self._device.send_key("Display")
-        elif cmd_id == Commands.FUNCTION_RED:
-            return await self._device.send_key("Red")
-        elif cmd_id == Commands.FUNCTION_BLUE:
-            return await self._device.send_key("Blue")
-        elif cmd_id == Commands.FUNCTION_YELLOW:
-            return await self._device.send_key("Yellow")
-        elif cmd_id == Commands.FUNCTION_GREEN:
-            return await self._device.send_key("Green")
-        elif cmd_id == Commands.NEXT:
-            return await self._device.send_key("Next")
-        elif cmd_id == Commands.PREVIOUS:
-            return await self._device.send_key("Prev")
-        elif cmd_id == Commands.VOLUME_UP:
-            return await self._device.send_key("VolumeUp")
-        elif cmd_id == Commands.VOLUME_DOWN:
-            return await self._device.send_key("VolumeDown")
-        elif cmd_id == Commands.MUTE_TOGGLE:
-            return await self._device.send_key("Mute")
-        elif cmd_id == "POWER":
-            return await self._device.toggle()
-        elif cmd_id in self.options[Options.SIMPLE_COMMANDS]:
-            return await self._device.send_key(SONY_SIMPLE_COMMANDS[cmd_id])
-        else:
+        with self._device.tracer.trace(cmd_id) as trace, deadline.budget(deadline.MAX_OPERATION):
+            trace.status = await self._handle_command(cmd_id)
+            return trace.status
+
+    async def _handle_command(self, cmd_id: str) -> StatusCodes:
+        """Dispatch the command to the device."""
+        if cmd_id in _DEVICE_COMMANDS:
+            return await getattr(self._device, _DEVICE_COMMANDS[cmd_id])()
+        key = _KEY_COMMANDS.get(cmd_id)
+        if key is None and cmd_id in self.options[Options.SIMPLE_COMMANDS]:
+            key = SONY_SIMPLE_COMMANDS[cmd_id]
+        if key is None:
             return StatusCodes.NOT_IMPLEMENTED
+        return await self._device.send_key(key)
 
     def filter_changed_attributes(self, update: dict[str, Any]) -> dict[str, Any]:
         """
@@ -185,6 +164,10 @@ class SonyMediaPlayer(MediaPlayer):
             state = update[Attributes.STATE]
             attributes = self._key_update_helper(Attributes.STATE, state, attributes)
 
+        for attr in [Attributes.MEDIA_POSITION, Attributes.MEDIA_DURATION]:
+            if attr in update:
+                attributes = self._key_update_helper(attr, update[attr], attributes)
+
         _LOG.debug("MediaPlayer update attributes %s -> %s", update, attributes)
         return attributes
 
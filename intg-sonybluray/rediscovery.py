@@ -0,0 +1,166 @@
+"""
+Rediscovery of the devices which are not reachable at their configured address anymore.
+
+A device moved by DHCP is looked up by its mac address in the kernel neighbor table, and by its SSDP unique device
+name or mac address among the devices answering an SSDP search.
+
+:copyright: (c) 2024 by Unfolded Circle ApS.
+:license: Mozilla Public License Version 2.0, see LICENSE for more details.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Coroutine
+from urllib.parse import urlparse
+
+import discover
+from config import DeviceInstance, normalize_mac
+from tasks import TaskLimitError
+
+_LOG = logging.getLogger(__name__)
+
+NEIGHBOR_TABLE = "/proc/net/arp"
+# ARP flag of a complete neighbor entry
+_ATF_COM = 0x2
+# Minimum interval in seconds between two rediscoveries of the same device
+REDISCOVERY_INTERVAL = 60
+# Timeout in seconds of the connections resolving the mac address of the SSDP responders
+PROBE_TIMEOUT = 1
+
+
+def read_neighbors(path: str = NEIGHBOR_TABLE) -> dict[str, str]:
+    """
+    Read the kernel neighbor table.
+
+    :return: the mac address of every resolved IPv4 address, empty if the table is not available.
+    """
+    neighbors = {}
+    try:
+        with open(path, "r", encoding="ascii") as f:
+            lines = f.readlines()[1:]
+    except OSError:
+        return neighbors
+    for line in lines:
+        fields = line.split()
+        if len(fields) < 4:
+            continue
+        try:
+            flags = int(fields[2], 16)
+        except ValueError:
+            continue
+        if flags & _ATF_COM:
+            neighbors[fields[0]] = normalize_mac(fields[3])
+    return neighbors
+
+
+async def _resolve(host: str, port: int) -> None:
+    """Open a connection to the given host, the kernel resolves its mac address in the neighbor table."""
+    try:
+        async with asyncio.timeout(PROBE_TIMEOUT):
+            _, writer = await asyncio.open_connection(host, port)
+        writer.close()
+        await writer.wait_closed()
+    except (OSError, asyncio.TimeoutError):
+        pass
+
+
+class Rediscovery:
+    """Find the new address of the configured devices."""
+
+    def __init__(self, on_address_found: Callable[[str, str], Awaitable[None]]):
+        """
+        Create the rediscovery service.
+
+        :param on_address_found: called with the device identifier and its new address
+        """
+        self._on_address_found = on_address_found
+        # SSDP unique device name (uuid:...) -> device identifier
+        self._devices: dict[str, str] = {}
+        self._last_attempt: dict[str, float] = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+
+    def learn(self, uuid: str, device_id: str) -> None:
+        """Remember the SSDP unique device name of a device."""
+        if self._devices.get(uuid) != device_id:
+            _LOG.debug("[%s] SSDP device %s", device_id, uuid)
+            self._devices[uuid] = device_id
+
+    def device_id(self, uuid: str | None) -> str | None:
+        """Return the identifier of the device with the given SSDP unique device name."""
+        return self._devices.get(uuid) if uuid else None
+
+    def forget(self, device_id: str) -> None:
+        """Forget a removed device."""
+        self._devices = {uuid: value for uuid, value in self._devices.items() if value != device_id}
+        self._last_attempt.pop(device_id, None)
+        task = self._tasks.pop(device_id, None)
+        if task:
+            task.cancel()
+
+    def request(self, device: DeviceInstance, spawn: Callable[[Coroutine, str], asyncio.Task]) -> None:
+        """
+        Look for the device in background, at most once per REDISCOVERY_INTERVAL.
+
+        :param device: configuration of the device, it must have a mac address or a known SSDP unique device name
+        :param spawn: starts the background task of the device, which cancels it when the device is disconnected
+        """
+        if device.id in self._tasks:
+            return
+        now = time.monotonic()
+        if now - self._last_attempt.get(device.id, -REDISCOVERY_INTERVAL) < REDISCOVERY_INTERVAL:
+            return
+        if not device.mac_address and device.id not in self._devices.values():
+            return
+        try:
+            task = spawn(self._rediscover(device), "rediscovery")
+        except TaskLimitError:
+            return
+        self._last_attempt[device.id] = now
+        self._tasks[device.id] = task
+        # also called if the task is cancelled before it starts
+        task.add_done_callback(lambda done: self._task_done(device.id, done))
+
+    def _task_done(self, device_id: str, task: asyncio.Task) -> None:
+        if self._tasks.get(device_id) is task:
+            del self._tasks[device_id]
+
+    async def _rediscover(self, device: DeviceInstance) -> None:
+        try:
+            address = await self.find_address(device)
+        except Exception as ex:  # pylint: disable=W0718
+            _LOG.warning("[%s] Rediscovery failed: %r", device.id, ex)
+            return
+        if address is None:
+            _LOG.debug("[%s] Device not found on the network", device.id)
+        elif address != device.address:
+            _LOG.info("[%s] Device found at %s", device.id, address)
+            await self._on_address_found(device.id, address)
+
+    async def find_address(self, device: DeviceInstance) -> str | None:
+        """
+        Find the current address of a device.
+
+        :return: the address of the device, or None if it's not found.
+        """
+        mac_address = normalize_mac(device.mac_address)
+        if mac_address:
+            # the entry of the configured address may be outdated, until it is garbage collected by the kernel
+            for address, neighbor_mac in read_neighbors().items():
+                if neighbor_mac == mac_address and address != device.address:
+                    return address
+
+        responders = {}
+        for uuid, location in (await discover.async_search_devices()).items():
+            url = urlparse(location)
+            if self._devices.get(uuid) == device.id:
+                return url.hostname
+            if url.hostname:
+                responders[url.hostname] = url.port or 80
+        if not mac_address or not responders:
+            return None
+
+        # the responders are resolved in the neighbor table once they are connected to
+        await asyncio.gather(*(_resolve(host, port) for host, port in responders.items()))
+        neighbors = read_neighbors()
+        return next((address for address in responders if neighbors.get(address) == mac_address), None)
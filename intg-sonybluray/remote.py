@@ -14,6 +14,7 @@ from ucapi import EntityTypes, Remote, StatusCodes
 from ucapi.remote import Attributes, Commands, States as RemoteStates, Options, Features
 from ucapi.media_player import States as MediaStates
 from const import SONY_REMOTE_BUTTONS_MAPPING, SONY_REMOTE_UI_PAGES, KEYS, SONY_SIMPLE_COMMANDS
+from sonyapilib import deadline, pacing
 
 _LOG = logging.getLogger(__name__)
 
@@ -76,8 +77,15 @@ class SonyRemote(Remote):
 
         repeat = self.getIntParam("repeat", params, 1)
         res = StatusCodes.OK
-        for i in range (0, repeat):
-            res = await self.handle_command(cmd_id, params)
+        command = params.get("command", cmd_id) if params else cmd_id
+        # a sequence of commands is bounded as a whole, every command of the sequence has its own budget too
+        # the keys of repeated commands and sequences are paced, a single key is sent right away
+        stream = repeat > 1 or cmd_id == Commands.SEND_CMD_SEQUENCE
+        with (self._device.tracer.trace(command) as trace, deadline.budget(deadline.MAX_OPERATION),
+              pacing.stream(stream)):
+            for i in range (0, repeat):
+                res = await self.handle_command(cmd_id, params)
+            trace.status = res
         return res
 
     async def handle_command(self, cmd_id: str, params: dict[str, Any] | None = None) -> StatusCodes:
@@ -14,7 +14,7 @@ from enum import IntEnum
 from sonyapilib.device import SonyDevice, AuthenticationResult
 
 import config
-from discover import async_identify_sonybluray_devices
+from discover import async_identify_sonybluray_devices, async_sweep_sonybluray_devices, parse_network
 from config import DeviceInstance
 from ucapi import (
     AbortDriverSetup,
@@ -50,6 +50,7 @@ _sony_device: SonyDevice | None = None
 _device_name = "Sony Bluray"
 _always_on = False
 _polling = False
+_queue_commands = False
 _client_name = "Sony Bluray"
 _user_input_discovery = RequestUserInput(
     {"en": "Setup mode", "de": "Setup Modus"},
@@ -65,9 +66,12 @@ _user_input_discovery = RequestUserInput(
             "field": {
                 "label": {
                     "value": {
-                        "en": "Leave blank to use auto-discovery.",
-                        "de": "Leer lassen, um automatische Erkennung zu verwenden.",
-                        "fr": "Laissez le champ vide pour utiliser la découverte automatique.",
+                        "en": "Leave blank to use auto-discovery, or enter a network range to scan "
+                              "(e.g. 192.168.1.0/24).",
+                        "de": "Leer lassen, um automatische Erkennung zu verwenden, oder einen Netzwerkbereich zum "
+                              "Durchsuchen eingeben (z.B. 192.168.1.0/24).",
+                        "fr": "Laissez le champ vide pour utiliser la découverte automatique, ou saisissez une plage "
+                              "réseau à analyser (ex. 192.168.1.0/24).",
                     }
                 }
             },
@@ -231,7 +235,8 @@ async def handle_configuration_mode(msg: UserDataResponse) -> RequestUserInput |
             if not config.devices.remove(choice):
                 _LOG.warning("Could not remove device from configuration: %s", choice)
                 return SetupError(error_type=IntegrationSetupError.OTHER)
-            config.devices.store()
+            if not await config.devices.flush():
+                return SetupError(error_type=IntegrationSetupError.OTHER)
             return SetupComplete()
         case "reset":
             config.devices.clear()  # triggers device instance removal
@@ -247,8 +252,10 @@ async def _handle_discovery(msg: UserDataResponse) -> RequestUserInput | SetupEr
     """
     Process user data response in a setup process.
 
-    If ``address`` field is set by the user: try connecting to device and retrieve model information.
-    Otherwise, start discovery and present the found devices to the user to choose from.
+    If ``address`` field is set by the user: try connecting to device and retrieve model information, or scan the
+    network range if it is given in CIDR notation.
+    Otherwise, start discovery and present the found devices to the user to choose from. If no device answers the
+    multicast discovery, e.g. on networks dropping multicast traffic, the local networks are scanned.
 
     :param msg: response data from the requested user data
     :return: the setup action on how to continue
@@ -261,12 +268,25 @@ async def _handle_discovery(msg: UserDataResponse) -> RequestUserInput | SetupEr
     dropdown_items = []
     address = msg.input_values["address"]
 
-    if address:
+    try:
+        network = parse_network(address) if address else None
+    except ValueError as ex:
+        _LOG.warning("Invalid network range %s: %s", address, ex)
+        return SetupError(error_type=IntegrationSetupError.OTHER)
+
+    if address and network is None:
         _LOG.debug("Starting manual driver setup for %s", address)
         dropdown_items.append({"id": address, "label": {"en": f"Sony [{address}]"}})
     else:
-        _LOG.debug("Starting auto-discovery driver setup")
-        devices = await async_identify_sonybluray_devices()
+        if network:
+            _LOG.debug("Starting driver setup scanning %s", network)
+            devices = await async_sweep_sonybluray_devices([network])
+        else:
+            _LOG.debug("Starting auto-discovery driver setup")
+            devices = await async_identify_sonybluray_devices()
+            if not devices:
+                _LOG.debug("No device answered the SSDP discovery, scanning the local networks")
+                devices = await async_sweep_sonybluray_devices()
         _LOG.debug("Discovered Sony devices %s", devices)
         _discovered_devices = devices
         for device in devices:
@@ -347,6 +367,14 @@ async def _handle_discovery(msg: UserDataResponse) -> RequestUserInput | SetupEr
                 },
                 "field": {"checkbox": {"value": False}},
             },
+            {
+                "id": "queue_commands",
+                "label": {
+                    "en": "Acknowledge navigation keys immediately and send them in background",
+                    "fr": "Valider immédiatement les touches de navigation et les envoyer en arrière-plan",
+                },
+                "field": {"checkbox": {"value": False}},
+            },
         ],
     )
 
@@ -367,11 +395,13 @@ async def handle_device_choice(msg: UserDataResponse) -> RequestUserInput | Setu
     global _device_name
     global _client_name
     global _polling
+    global _queue_commands
 
     _host = msg.input_values["choice"]
     _password_key = msg.input_values.get("password_key", None)
     _always_on = msg.input_values.get("always_on") == "true"
     _polling = msg.input_values.get("polling") == "true"
+    _queue_commands = msg.input_values.get("queue_commands") == "true"
 
     try:
         _ircc_port = int(msg.input_values.get("ircc_port", IRCC_PORT))
@@ -437,9 +467,11 @@ async def handle_device_choice(msg: UserDataResponse) -> RequestUserInput | Setu
     config.devices.add(
         DeviceInstance(id=unique_id, name=_device_name, address=_host, always_on=_always_on, mac_address=_sony_device.mac,
                        password_key=_password_key, ircc_port=_ircc_port, dmr_port=_dmr_port, app_port=_app_port,
-                       pin_code=None, client_name=_client_name, polling=_polling)
+                       pin_code=None, client_name=_client_name, polling=_polling,
+                       queue_commands=_queue_commands)
     )  # triggers Sony BR instance creation
-    config.devices.store()
+    if not await config.devices.flush():
+        return SetupError(error_type=IntegrationSetupError.OTHER)
 
     # AVR device connection will be triggered with subscribe_entities request
 
@@ -494,9 +526,11 @@ async def handle_pairing(msg: UserDataResponse) -> SetupComplete | SetupError:
                        always_on=_always_on, mac_address=_sony_device.mac,
                        password_key=_sony_device.psk, ircc_port=_sony_device.ircc_port, dmr_port=_sony_device.dmr_port,
                        app_port=_sony_device.app_port,
-                       pin_code=pin_code, client_name=_client_name, polling=_polling)
+                       pin_code=pin_code, client_name=_client_name, polling=_polling,
+                       queue_commands=_queue_commands)
     )  # triggers Sony BR instance creation
-    config.devices.store()
+    if not await config.devices.flush():
+        return SetupError(error_type=IntegrationSetupError.OTHER)
 
     # AVR device connection will be triggered with subscribe_entities request
 
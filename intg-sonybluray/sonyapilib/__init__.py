@@ -0,0 +1 @@
+"""Sony Media player lib"""
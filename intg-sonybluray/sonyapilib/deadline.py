@@ -0,0 +1,61 @@
+"""Deadline budget of the operations sent to the Sony devices."""
+import asyncio
+import time
+from contextvars import ContextVar
+
+# Default budgets in seconds per operation class, from the entity command handler to the last request
+KEY_PRESS = 10
+POLL = 5
+BOOTSTRAP = 30
+# Upper bound of any operation, e.g. a command sequence of the remote entity
+MAX_OPERATION = 60
+
+_current_deadline: ContextVar[float | None] = ContextVar("sony_deadline", default=None)
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """Raised when the budget of the current operation is spent."""
+
+
+class _BudgetScope:
+    __slots__ = ("_seconds", "_token")
+
+    def __init__(self, seconds: float):
+        self._seconds = seconds
+        self._token = None
+
+    def __enter__(self) -> float:
+        deadline = time.monotonic() + self._seconds
+        current = _current_deadline.get()
+        if current is not None:
+            deadline = min(deadline, current)
+        self._token = _current_deadline.set(deadline)
+        return deadline
+
+    def __exit__(self, exc_type, exc, traceback):
+        _current_deadline.reset(self._token)
+
+
+def budget(seconds: float) -> _BudgetScope:
+    """
+    Return a context manager limiting the operations of the current task to the given duration.
+
+    A nested budget never extends the deadline of the enclosing one.
+    """
+    return _BudgetScope(seconds)
+
+
+def remaining(limit: float | None = None) -> float | None:
+    """
+    Return the time left in seconds before the deadline of the current operation.
+
+    :param limit: upper bound of the returned time, returned as is outside any budget
+    :raises DeadlineExceeded: if the deadline has passed
+    """
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return limit
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise DeadlineExceeded()
+    return left if limit is None else min(limit, left)
@@ -0,0 +1,566 @@
+"""Description of a Sony device: service URLs, actions, commands and apps read from its XML resources."""
+import base64
+import json
+import logging
+import struct
+import xml.etree.ElementTree
+from enum import Enum
+from urllib.parse import quote, urljoin, urlparse, urlunparse
+
+import aiohttp
+from aiohttp.web_exceptions import HTTPError
+
+from .metrics import ENDPOINT_ACTION_LIST, ENDPOINT_APP, ENDPOINT_DMR, ENDPOINT_IRCC_LIST, ENDPOINT_V4_SYSTEM
+from .xml_helper import find_in_xml
+
+_LOGGER = logging.getLogger(__name__)
+
+# Timeout in seconds of the requests reading the description of the device, larger XML documents than the control
+# requests and served slowly while the device boots; the bootstrap budget still bounds it
+DESCRIPTION_TIMEOUT = 20
+
+# Attributes of the device description saved by SonyDevice.capabilities
+_CAPABILITY_URLS = ("dmr_url", "ircc_url", "irccscpd_url", "actionlist_url", "control_url", "av_transport_url",
+                    "app_url", "base_url")
+URN_UPNP_DEVICE = "{urn:schemas-upnp-org:device-1-0}"
+URN_SONY_AV = "{urn:schemas-sony-com:av}"
+URN_SONY_IRCC = "urn:schemas-sony-com:serviceId:IRCC"
+URN_SCALAR_WEB_API_DEVICE_INFO = "{urn:schemas-sony-com:av}"
+WEBAPI_SERVICETYPE = "av:X_ScalarWebAPI_ServiceType"
+
+
+class HttpMethod(Enum):
+    """Define which http method is used."""
+
+    GET = "get"
+    POST = "post"
+
+
+class IrccCategory(Enum):
+    """Device categories used by IRCC."""
+
+    TV1 = 1
+    AUSYS3 = 80
+    TV1EEE = 119
+    TV1E = 164
+    AUSYS3E = 208
+    AUSYS3SE = 528
+    AUSYS3EE = 1552
+    DVD4 = 3578
+    DVD4E = 3834
+    BD1 = 7258
+
+
+IR_KEY_CODES = {
+    IrccCategory.BD1: (
+        ('Num1', 0),
+        ('Num2', 1),
+        ('Num3', 2),
+        ('Num4', 3),
+        ('Num5', 4),
+        ('Num6', 5),
+        ('Num7', 6),
+        ('Num8', 7),
+        ('Num9', 8),
+        ('Num0', 9),
+        ('Power', 21),
+        ('Eject', 22),
+        ('Stop', 24),
+        ('Pause', 25),
+        ('Play', 26),
+        ('Rewind', 27),
+        ('Forward', 28),
+        ('PopUpMenu', 41),
+        ('TopMenu', 44),
+        ('Up', 57),
+        ('Down', 58),
+        ('Left', 59),
+        ('Right', 60),
+        ('Confirm', 61),
+        ('Options', 63),
+        ('Display', 65),
+        ('Home', 66),
+        ('Return', 67),
+        ('Karaoke', 74),
+        ('Netflix', 75),
+        ('Mode3D', 77),
+        ('Next', 86),
+        ('Prev', 87),
+        ('Favorites', 94),
+        ('SubTitle', 99),
+        ('Audio', 100),
+        ('Angle', 101),
+        ('Blue', 102),
+        ('Red', 103),
+        ('Green', 104),
+        ('Yellow', 105),
+        ('Advance', 117),
+        ('Replay', 118),
+    )
+}
+
+
+class XmlApiObject:
+    # pylint: disable=too-few-public-methods
+    """Holds data for a device action or a command."""
+
+    def __init__(self, xml_data):
+        """Init xml object with given data"""
+        self.name = None
+        self.mode = None
+        self.url = None
+        self.type = None
+        self.value = None
+        self.mac = None
+        # must be named that way to match xml
+        # pylint: disable=invalid-name
+        self.id = None
+        if not xml_data:
+            return
+
+        for attr in self.__dict__:
+            if attr == "mode" and xml_data.get(attr):
+                xml_data[attr] = int(xml_data[attr])
+            setattr(self, attr, xml_data.get(attr))
+
+
+class DeviceDescription:
+    """Service URLs, actions, commands and apps read from the description of the device, extended by SonyDevice."""
+
+    def __init__(self, host, nickname, *, app_port, dmr_port, ircc_port):
+        """Init the description with the default resources of the device at the given address."""
+        self.host = host
+        self.nickname = nickname
+        self.client_id = nickname
+        self.actionlist_url = None
+        self.control_url = None
+        self.av_transport_url = None
+        self.app_url = None
+
+        self.app_port = app_port
+        self.dmr_port = dmr_port
+        self.ircc_port = ircc_port
+
+        # actions are thing like getting status
+        self.actions = {}
+        self.headers = {}
+        # commands are alike to buttons on the remote
+        self.commands = {}
+        self.apps = {}
+
+        self.pin = None
+        self.cookies = None
+        self.mac: str | None = None
+        # unique device name (uuid:...) read from the device description, also announced in SSDP
+        self.udn: str | None = None
+        self.api_version = 0
+
+        self.dmr_url = f"http://{self.host}:{self.dmr_port}/dmr.xml"
+        self.app_url = f"http://{self.host}:{self.app_port}"
+        self.base_url = f"http://{self.host}/sony/"
+        ircc_base = f"http://{self.host}:{self.ircc_port}"
+        if self.ircc_port == self.dmr_port:
+            self.ircc_url = self.dmr_url
+        else:
+            self.ircc_url = urljoin(ircc_base, "/Ircc.xml")
+
+        self.irccscpd_url = urljoin(ircc_base, "/IRCCSCPD.xml")
+        self._ircc_categories = set()
+        self._add_headers()
+
+    def capabilities(self) -> dict:
+        """Return the description read from the device, to restore it later without any request."""
+        return {
+            "host": self.host,
+            "api_version": self.api_version,
+            "mac": self.mac,
+            "udn": self.udn,
+            "urls": {name: getattr(self, name) for name in _CAPABILITY_URLS},
+            "ircc_categories": list(self._ircc_categories),
+            "actions": {name: vars(action).copy() for name, action in self.actions.items()},
+            "commands": {name: vars(command).copy() for name, command in self.commands.items()},
+            "apps": {name: vars(app).copy() for name, app in self.apps.items()},
+            "headers": dict(self.headers),
+            "cookies": self.cookies,
+        }
+
+    def restore_capabilities(self, capabilities: dict) -> None:
+        """Restore a description returned by capabilities, instead of reading it from the device."""
+        self.api_version = capabilities["api_version"]
+        self.mac = capabilities["mac"] or self.mac
+        self.udn = capabilities.get("udn") or self.udn
+        for name, url in capabilities["urls"].items():
+            setattr(self, name, url)
+        self._ircc_categories = set(capabilities["ircc_categories"])
+        self.actions = {name: XmlApiObject(dict(data)) for name, data in capabilities["actions"].items()}
+        self.commands = {name: XmlApiObject(dict(data)) for name, data in capabilities["commands"].items()}
+        self.apps = {name: XmlApiObject(dict(data)) for name, data in capabilities["apps"].items()}
+        self.headers = dict(capabilities["headers"])
+        self.cookies = capabilities["cookies"]
+        host = capabilities.get("host")
+        if host and host != self.host:
+            self._rewrite_urls(host, self.host)
+
+    def set_host(self, host: str) -> None:
+        """Point the device to a new address, e.g. after a DHCP lease change, keeping its description."""
+        if host == self.host:
+            return
+        _LOGGER.debug("Device address changed %s -> %s", self.host, host)
+        previous_host = self.host
+        self.host = host
+        self._rewrite_urls(previous_host, host)
+
+    def _rewrite_urls(self, previous_host: str, host: str) -> None:
+        for name in _CAPABILITY_URLS:
+            setattr(self, name, _replace_host(getattr(self, name), previous_host, host))
+        for action in self.actions.values():
+            action.url = _replace_host(action.url, previous_host, host)
+
+    async def _update_service_urls(self) -> bool:
+        """Initialize the device by reading the necessary resources from it."""
+        try:
+            content = await self._send_http(self.dmr_url, method=HttpMethod.GET, raise_errors=True,
+                                            endpoint=ENDPOINT_DMR, timeout=DESCRIPTION_TIMEOUT)
+        except aiohttp.ClientConnectorError:
+            return False
+        except HTTPError as exc:
+            _LOGGER.error("Failed to get DMR: %s", type(exc), exc)
+            return False
+
+        try:
+            if content:
+                self._parse_dmr(content)
+            if self.api_version <= 3:
+                await self._parse_ircc()
+                await self._parse_action_list()
+                if self.api_version > 0:
+                    await self._parse_system_information()
+            else:
+                await self._parse_system_information_v4()
+            return True
+        except Exception as ex:  # pylint: disable=broad-except
+            _LOGGER.exception("failed to get device information", ex)
+            return False
+
+    async def _parse_action_list(self):
+        try:
+            response = await self._send_http(self.actionlist_url, method=HttpMethod.GET,
+                                             endpoint=ENDPOINT_ACTION_LIST, timeout=DESCRIPTION_TIMEOUT)
+            if not response:
+                return
+        except (Exception, HTTPError) as ex:
+            _LOGGER.debug("Error on %s", self.actionlist_url, ex)
+            return
+
+        for element in find_in_xml(response, [("action", True)]):
+            action = XmlApiObject(element.attrib)
+            _LOGGER.debug("Available action %s : %s", action.name, action.url)
+            self.actions[action.name] = action
+
+            if action.mode is None:
+                action.mode = self.api_version
+            if action.url is None and action.name:
+                action.url = urljoin(self.actionlist_url, "?action={}".format(action.name))
+                separator = "&"
+            else:
+                separator = "?"
+
+            if action.name == "register":
+                # the authentication is based on the device id and the mac
+                action.url = (f"{action.url}{separator}name={quote(self.nickname)}"
+                              f"&registrationType=initial&deviceId={quote(self.client_id)}")
+                self.api_version = action.mode
+                if action.mode == 3:
+                    action.url = action.url + "&wolSupport=true"
+
+    async def _parse_ircc(self):
+        content = await self._send_http(
+            self.ircc_url, method=HttpMethod.GET, raise_errors=True, endpoint=ENDPOINT_IRCC_LIST,
+            timeout=DESCRIPTION_TIMEOUT)
+
+        upnp_device = "{}device".format(URN_UPNP_DEVICE)
+        # the action list contains everything the device supports
+        self.actionlist_url = find_in_xml(
+            content,
+            [upnp_device,
+             "{}X_UNR_DeviceInfo".format(URN_SONY_AV),
+             "{}X_CERS_ActionList_URL".format(URN_SONY_AV)]
+        ).text
+        services = find_in_xml(
+            content,
+            [upnp_device,
+             "{}serviceList".format(URN_UPNP_DEVICE),
+             ("{}service".format(URN_UPNP_DEVICE), True)],
+        )
+
+        lirc_url = urlparse(self.ircc_url)
+        for service in services:
+            service_id = service.find(
+                "{0}serviceId".format(URN_UPNP_DEVICE))
+
+            if service_id is None or \
+                    URN_SONY_IRCC not in service_id.text:
+                continue
+
+            service_location = service.find(
+                "{0}controlURL".format(URN_UPNP_DEVICE)).text
+
+            if service_location.startswith('http://'):
+                service_url = ''
+            else:
+                service_url = lirc_url.scheme + "://" + lirc_url.netloc
+            self.control_url = service_url + service_location
+
+        categories = find_in_xml(
+            content,
+            [upnp_device,
+             "{}X_IRCC_DeviceInfo".format(URN_SONY_AV),
+             "{}X_IRCC_CategoryList".format(URN_SONY_AV),
+             ("{}X_IRCC_Category".format(URN_SONY_AV), True)]
+        )
+
+        for category in categories:
+            category_info = category.find(
+                "{}X_CategoryInfo".format(URN_SONY_AV))
+            if category_info is None:
+                continue
+
+            self._ircc_categories.add(category_info.text)
+
+    async def _parse_system_information_v4(self):
+        url = urljoin(self.base_url, "system")
+        json_data = self._create_api_json("getSystemSupportedFunction")
+        response = await self._send_http(url, HttpMethod.POST, json=json_data, endpoint=ENDPOINT_V4_SYSTEM,
+                                         timeout=DESCRIPTION_TIMEOUT)
+        if not response:
+            _LOGGER.debug("no response received, device might be off")
+            return
+
+        json_resp = json.loads(response)
+        if json_resp and not json_resp.get('error'):
+            for option in json_resp.get('result')[0]:
+                if option['option'] == 'WOL':
+                    self.mac = option['value']
+
+    async def _parse_system_information(self):
+        try:
+            content = await self._send_http(
+                self._get_action(
+                    "getSystemInformation").url, method=HttpMethod.GET, endpoint=ENDPOINT_ACTION_LIST,
+                timeout=DESCRIPTION_TIMEOUT)
+            if not content:
+                return
+        except (Exception, HTTPError):
+            return
+        for element in find_in_xml(
+                content, [("supportFunction", "all"), ("function", True)]
+        ):
+            for function in element:
+                if function.attrib["name"] == "WOL":
+                    self.mac = function.find(
+                        "functionItem").attrib["value"]
+
+    def _parse_dmr(self, data):
+        lirc_url = urlparse(self.ircc_url)
+        xml_data = xml.etree.ElementTree.fromstring(data)
+
+        udn = xml_data.find("{0}device/{0}UDN".format(URN_UPNP_DEVICE))
+        if udn is not None and udn.text:
+            self.udn = udn.text.strip()
+
+        for device in find_in_xml(xml_data, [
+            ("{0}device".format(URN_UPNP_DEVICE), True),
+            "{0}serviceList".format(URN_UPNP_DEVICE)
+        ]):
+            for service in device:
+                service_id = service.find(
+                    "{0}serviceId".format(URN_UPNP_DEVICE))
+                if "urn:upnp-org:serviceId:AVTransport" not in service_id.text:
+                    continue
+                transport_location = service.find(
+                    "{0}controlURL".format(URN_UPNP_DEVICE)).text
+                self.av_transport_url = "{0}://{1}:{2}{3}".format(
+                    lirc_url.scheme, lirc_url.netloc.split(":")[0],
+                    self.dmr_port, transport_location
+                )
+
+        # this is only true for v4 devices.
+        if WEBAPI_SERVICETYPE not in data:
+            return
+
+        self.api_version = 4
+        device_info_name = "{0}X_ScalarWebAPI_DeviceInfo".format(
+            URN_SCALAR_WEB_API_DEVICE_INFO
+        )
+
+        search_params = [
+            ("{0}device".format(URN_UPNP_DEVICE), True),
+            (device_info_name, True),
+            "{0}X_ScalarWebAPI_BaseURL".format(URN_SCALAR_WEB_API_DEVICE_INFO),
+        ]
+        for device in find_in_xml(xml_data, search_params):
+            for xml_url in device:
+                self.base_url = xml_url.text
+                if not self.base_url.endswith("/"):
+                    self.base_url = "{}/".format(self.base_url)
+
+                action = XmlApiObject({})
+                action.url = urljoin(self.base_url, "accessControl")
+                action.mode = 4
+                self.actions["register"] = action
+
+                action = XmlApiObject({})
+                action.url = urljoin(self.base_url, "system")
+                action.value = "getRemoteControllerInfo"
+                self.actions["getRemoteCommandList"] = action
+                self.control_url = urljoin(self.base_url, "IRCC")
+
+    async def _update_commands(self):
+        """Update the list of commands."""
+        if self.api_version == 0:
+            self._use_builtin_command_list()
+        elif self.api_version <= 3:
+            await self._parse_command_list()
+        elif self.api_version > 3 and self.pin:
+            _LOGGER.debug("Registration necessary to read command list.")
+            await self._parse_command_list_v4()
+
+    async def _parse_command_list_v4(self):
+        action_name = "getRemoteCommandList"
+        action = self.actions[action_name]
+        json_data = self._create_api_json(action.value)
+
+        response = await self._send_http(
+            action.url, HttpMethod.POST, json=json_data, headers={}, endpoint=ENDPOINT_V4_SYSTEM,
+            timeout=DESCRIPTION_TIMEOUT
+        )
+
+        if not response:
+            _LOGGER.debug("no response received, device might be off")
+            return
+
+        json_resp = json.loads(response)
+        if json_resp and not json_resp.get('error'):
+            for command in json_resp.get('result')[1]:
+                api_object = XmlApiObject(command)
+                if api_object.name == "PowerOff":
+                    api_object.name = "Power"
+                self.commands[api_object.name] = api_object
+        else:
+            _LOGGER.error("JSON request error: %s",
+                          json.dumps(json_resp, indent=4))
+
+    async def _parse_command_list(self):
+        """Parse the list of available command in devices with the legacy api."""
+        action_name = "getRemoteCommandList"
+        if action_name not in self.actions:
+            _LOGGER.debug(
+                "Action list not set in device, try calling init_device")
+            return
+
+        action = self.actions[action_name]
+        url = action.url
+        response = await self._send_http(url, method=HttpMethod.GET, endpoint=ENDPOINT_ACTION_LIST,
+                                         timeout=DESCRIPTION_TIMEOUT)
+        if not response:
+            _LOGGER.debug(
+                "Failed to get response for command list, device might be off")
+            return
+
+        for command in find_in_xml(response, [("command", True)]):
+            name = command.get("name")
+            self.commands[name] = XmlApiObject(command.attrib)
+
+    def _use_builtin_command_list(self):
+        for encoded_str in self._ircc_categories:
+            fmt, category_id = struct.unpack(">HI", base64.b64decode(encoded_str))
+            try:
+                category = IrccCategory(category_id)
+            except ValueError:
+                _LOGGER.warning("Unknown IRCC category identifier: %d", category_id)
+                continue
+
+            code_list = IR_KEY_CODES.get(category)
+            if code_list is None:
+                _LOGGER.warning("No command list available for %s", category)
+                continue
+
+            for name, code in code_list:
+                value = base64.b64encode(struct.pack(">IIIB", fmt, category_id, code, 3))
+                data = XmlApiObject({
+                    "name": name,
+                    "type": "ircc",
+                    "value": value.decode("ascii"),
+                })
+                self.commands[name] = data
+
+    async def _update_applist(self):
+        """Update the list of apps which are supported by the device."""
+        if self.api_version < 4:
+            url = self.app_url + "/appslist"
+            response = await self._send_http(url, method=HttpMethod.GET, endpoint=ENDPOINT_APP,
+                                             timeout=DESCRIPTION_TIMEOUT)
+        else:
+            url = 'http://{}/DIAL/sony/applist'.format(self.host)
+            response = await self._send_http(
+                url,
+                method=HttpMethod.GET,
+                endpoint=ENDPOINT_APP, timeout=DESCRIPTION_TIMEOUT)
+
+        if response:
+            for app in find_in_xml(response, [(".//app", True)]):
+                data = XmlApiObject({
+                    "name": app.find("name").text,
+                    "id": app.find("id").text,
+                })
+                self.apps[data.name] = data
+
+    def _create_api_json(self, method, params=None):
+        # pylint: disable=invalid-name
+        """Create json data which will be send via post for the V4 api"""
+        if not params:
+            params = [{
+                "clientid": self.client_id,
+                "nickname": self.nickname
+            }, [{
+                "clientid": self.client_id,
+                "nickname": self.nickname,
+                "value": "yes",
+                "function": "WOL"
+            }]]
+
+        return {
+            "method": method,
+            "params": params,
+            "id": 1,
+            "version": "1.0"
+        }
+
+    def _get_action(self, name):
+        """Get the action object for the action with the given name"""
+        if name not in self.actions and not self.actions:
+            # self.init_device()
+            # if name not in self.actions and not self.actions:
+            raise ValueError('Failed to read action list from device.')
+
+        return self.actions[name]
+
+    def _add_headers(self):
+        """Add headers which all devices need"""
+        self.headers['X-CERS-DEVICE-ID'] = self.client_id
+        self.headers['X-CERS-DEVICE-INFO'] = self.client_id
+
+    async def _send_http(self, url, method, **kwargs) -> str | None:
+        """Send a request to the device, implemented by SonyDevice."""
+        raise NotImplementedError
+
+
+def _replace_host(url: str | None, previous_host: str, host: str) -> str | None:
+    """Return the url with the given host if it points to the previous host."""
+    if not url:
+        return url
+    parsed = urlparse(url)
+    if parsed.hostname != previous_host:
+        return url
+    netloc = host if parsed.port is None else f"{host}:{parsed.port}"
+    return urlunparse(parsed._replace(netloc=netloc))
@@ -3,29 +3,42 @@ import asyncio
 import base64
 import json
 import logging
-import socket
-import struct
-import aiohttp
-import xml.etree.ElementTree
+import time
 from enum import Enum
-from urllib.parse import (
-    urljoin,
-    urlparse,
-    quote,
-)
+from typing import Any
+from urllib.parse import urljoin
 
+import aiohttp
 import jsonpickle
-from aiohttp import ClientTimeout, ClientResponseError
+from aiohttp import ClientResponseError, ClientTimeout
 from aiohttp.web_exceptions import HTTPError
 
+from . import deadline, tracing, wol
+from .description import DeviceDescription, HttpMethod
+from .metrics import (
+    ENDPOINT_APP,
+    ENDPOINT_AV_TRANSPORT,
+    ENDPOINT_IRCC,
+    ENDPOINT_OTHER,
+    ENDPOINT_POWER,
+    ENDPOINT_REGISTER,
+    ENDPOINT_STATUS,
+    http_metrics,
+)
+from .xml_helper import find_in_xml
+
 _LOGGER = logging.getLogger(__name__)
 
 TIMEOUT = 5
-URN_UPNP_DEVICE = "{urn:schemas-upnp-org:device-1-0}"
-URN_SONY_AV = "{urn:schemas-sony-com:av}"
-URN_SONY_IRCC = "urn:schemas-sony-com:serviceId:IRCC"
-URN_SCALAR_WEB_API_DEVICE_INFO = "{urn:schemas-sony-com:av}"
-WEBAPI_SERVICETYPE = "av:X_ScalarWebAPI_ServiceType"
+# Timeout in seconds of the power status probe before sending the power on command, players are slow to answer
+# right after they wake up or while a disc loads
+POWER_PROBE_TIMEOUT = 2
+# Idle time in seconds after which a pooled connection is closed, below the idle timeout of the Sony firmwares
+KEEPALIVE_TIMEOUT = 5
+# Maximum duration in seconds of the registration, the user may have to confirm it on the device
+REGISTER_TIMEOUT = 60
+# Duration in seconds the result of a state probe (power status, getStatus, transport state) is reused
+PROBE_CACHE_TTL = 0.5
 
 
 class DeviceState(Enum):
@@ -42,102 +55,10 @@ class AuthenticationResult(Enum):
     PIN_NEEDED = 2
 
 
-class HttpMethod(Enum):
-    """Define which http method is used."""
-
-    GET = "get"
-    POST = "post"
-
-
-class IrccCategory(Enum):
-    """Device categories used by IRCC."""
-
-    TV1 = 1
-    AUSYS3 = 80
-    TV1EEE = 119
-    TV1E = 164
-    AUSYS3E = 208
-    AUSYS3SE = 528
-    AUSYS3EE = 1552
-    DVD4 = 3578
-    DVD4E = 3834
-    BD1 = 7258
-
-
-IR_KEY_CODES = {
-    IrccCategory.BD1: (
-        ('Num1', 0),
-        ('Num2', 1),
-        ('Num3', 2),
-        ('Num4', 3),
-        ('Num5', 4),
-        ('Num6', 5),
-        ('Num7', 6),
-        ('Num8', 7),
-        ('Num9', 8),
-        ('Num0', 9),
-        ('Power', 21),
-        ('Eject', 22),
-        ('Stop', 24),
-        ('Pause', 25),
-        ('Play', 26),
-        ('Rewind', 27),
-        ('Forward', 28),
-        ('PopUpMenu', 41),
-        ('TopMenu', 44),
-        ('Up', 57),
-        ('Down', 58),
-        ('Left', 59),
-        ('Right', 60),
-        ('Confirm', 61),
-        ('Options', 63),
-        ('Display', 65),
-        ('Home', 66),
-        ('Return', 67),
-        ('Karaoke', 74),
-        ('Netflix', 75),
-        ('Mode3D', 77),
-        ('Next', 86),
-        ('Prev', 87),
-        ('Favorites', 94),
-        ('SubTitle', 99),
-        ('Audio', 100),
-        ('Angle', 101),
-        ('Blue', 102),
-        ('Red', 103),
-        ('Green', 104),
-        ('Yellow', 105),
-        ('Advance', 117),
-        ('Replay', 118),
-    )
-}
-
-
-class XmlApiObject:
-    # pylint: disable=too-few-public-methods
-    """Holds data for a device action or a command."""
-
-    def __init__(self, xml_data):
-        """Init xml object with given data"""
-        self.name = None
-        self.mode = None
-        self.url = None
-        self.type = None
-        self.value = None
-        self.mac = None
-        # must be named that way to match xml
-        # pylint: disable=invalid-name
-        self.id = None
-        if not xml_data:
-            return
+_TRACE_CONFIG = tracing.create_aiohttp_trace_config()
 
-        for attr in self.__dict__:
-            if attr == "mode" and xml_data.get(attr):
-                xml_data[attr] = int(xml_data[attr])
-            setattr(self, attr, xml_data.get(attr))
 
-
-class SonyDevice:
+class SonyDevice(DeviceDescription):
     # pylint: disable=too-many-public-methods
     # pylint: disable=too-many-instance-attributes
     # pylint: disable=fixme
@@ -147,44 +68,22 @@ class SonyDevice:
                  app_port=50202, dmr_port=52323, ircc_port=50001):
         # pylint: disable=too-many-arguments
         """Init the device with the entry point."""
-        self.host = host
-        self.nickname = nickname
-        self.client_id = nickname
-        self.actionlist_url = None
-        self.control_url = None
-        self.av_transport_url = None
-        self.app_url = None
+        super().__init__(host, nickname, app_port=app_port, dmr_port=dmr_port, ircc_port=ircc_port)
         self.psk = psk
-
-        self.app_port = app_port
-        self.dmr_port = dmr_port
-        self.ircc_port = ircc_port
-
-        # actions are thing like getting status
-        self.actions = {}
-        self.headers = {}
-        # commands are alike to buttons on the remote
-        self.commands = {}
-        self.apps = {}
-
-        self.pin = None
-        self.cookies = None
-        self.mac: str | None = None
-        self.api_version = 0
-
-        self.dmr_url = f"http://{self.host}:{self.dmr_port}/dmr.xml"
-        self.app_url = f"http://{self.host}:{self.app_port}"
-        self.base_url = f"http://{self.host}/sony/"
-        ircc_base = f"http://{self.host}:{self.ircc_port}"
-        if self.ircc_port == self.dmr_port:
-            self.ircc_url = self.dmr_url
-        else:
-            self.ircc_url = urljoin(ircc_base, "/Ircc.xml")
-
-        self.irccscpd_url = urljoin(ircc_base, "/IRCCSCPD.xml")
-        self._ircc_categories = set()
-        self._add_headers()
+        # identifier used to label the request metrics, defaults to the host
+        self.device_id: str | None = None
         self._event_loop = asyncio.get_event_loop() or asyncio.get_running_loop()
+        # optional callable starting the background tasks of the device with a name, defaults to the event loop,
+        # raising RuntimeError when no task can be started
+        self.task_spawner = None
+        # state probes in flight, and last probe results with their monotonic time
+        self.probe_cache_ttl = PROBE_CACHE_TTL
+        self._probe_tasks: dict[str, asyncio.Task] = {}
+        self._probe_results: dict[str, tuple[float, Any]] = {}
+        # incremented when a command is sent, the probes started before don't update the cache
+        self._probe_generation = 0
+        # HTTP session with a pool of kept alive connections, created on the first request
+        self._session: aiohttp.ClientSession | None = None
 
     async def init_device(self):
         """Update this object with data from the device"""
@@ -227,293 +126,6 @@ class SonyDevice:
         await self.init_device()
         return jsonpickle.dumps(self)
 
-    async def _update_service_urls(self) -> bool:
-        """Initialize the device by reading the necessary resources from it."""
-        try:
-            content = await self._send_http(self.dmr_url, method=HttpMethod.GET, raise_errors=True)
-        except aiohttp.ClientConnectorError:
-            return False
-        except HTTPError as exc:
-            _LOGGER.error("Failed to get DMR: %s", type(exc), exc)
-            return False
-
-        try:
-            if content:
-                self._parse_dmr(content)
-            if self.api_version <= 3:
-                await self._parse_ircc()
-                await self._parse_action_list()
-                if self.api_version > 0:
-                    await self._parse_system_information()
-            else:
-                await self._parse_system_information_v4()
-            return True
-        except Exception as ex:  # pylint: disable=broad-except
-            _LOGGER.exception("failed to get device information", ex)
-            return False
-
-    async def _parse_action_list(self):
-        try:
-            response = await self._send_http(self.actionlist_url, method=HttpMethod.GET)
-            if not response:
-                return
-        except (Exception, HTTPError) as ex:
-            _LOGGER.debug("Error on %s", self.actionlist_url, ex)
-            return
-
-        for element in find_in_xml(response, [("action", True)]):
-            action = XmlApiObject(element.attrib)
-            _LOGGER.debug("Available action %s : %s", action.name, action.url)
-            self.actions[action.name] = action
-
-            if action.mode is None:
-                action.mode = self.api_version
-            if action.url is None and action.name:
-                action.url = urljoin(self.actionlist_url, "?action={}".format(action.name))
-                separator = "&"
-            else:
-                separator = "?"
-
-            if action.name == "register":
-                # the authentication is based on the device id and the mac
-                action.url = \
-                    f"{action.url}{separator}name={quote(self.nickname)}&registrationType=initial&deviceId={quote(self.client_id)}"
-                self.api_version = action.mode
-                if action.mode == 3:
-                    action.url = action.url + "&wolSupport=true"
-
-    async def _parse_ircc(self):
-        content = await self._send_http(
-            self.ircc_url, method=HttpMethod.GET, raise_errors=True)
-
-        upnp_device = "{}device".format(URN_UPNP_DEVICE)
-        # the action list contains everything the device supports
-        self.actionlist_url = find_in_xml(
-            content,
-            [upnp_device,
-             "{}X_UNR_DeviceInfo".format(URN_SONY_AV),
-             "{}X_CERS_ActionList_URL".format(URN_SONY_AV)]
-        ).text
-        services = find_in_xml(
-            content,
-            [upnp_device,
-             "{}serviceList".format(URN_UPNP_DEVICE),
-             ("{}service".format(URN_UPNP_DEVICE), True)],
-        )
-
-        lirc_url = urlparse(self.ircc_url)
-        for service in services:
-            service_id = service.find(
-                "{0}serviceId".format(URN_UPNP_DEVICE))
-
-            if service_id is None or \
-                    URN_SONY_IRCC not in service_id.text:
-                continue
-
-            service_location = service.find(
-                "{0}controlURL".format(URN_UPNP_DEVICE)).text
-
-            if service_location.startswith('http://'):
-                service_url = ''
-            else:
-                service_url = lirc_url.scheme + "://" + lirc_url.netloc
-            self.control_url = service_url + service_location
-
-        categories = find_in_xml(
-            content,
-            [upnp_device,
-             "{}X_IRCC_DeviceInfo".format(URN_SONY_AV),
-             "{}X_IRCC_CategoryList".format(URN_SONY_AV),
-             ("{}X_IRCC_Category".format(URN_SONY_AV), True)]
-        )
-
-        for category in categories:
-            category_info = category.find(
-                "{}X_CategoryInfo".format(URN_SONY_AV))
-            if category_info is None:
-                continue
-
-            self._ircc_categories.add(category_info.text)
-
-    async def _parse_system_information_v4(self):
-        url = urljoin(self.base_url, "system")
-        json_data = self._create_api_json("getSystemSupportedFunction")
-        response = await self._send_http(url, HttpMethod.POST, json=json_data)
-        if not response:
-            _LOGGER.debug("no response received, device might be off")
-            return
-
-        json_resp = json.loads(response)
-        if json_resp and not json_resp.get('error'):
-            for option in json_resp.get('result')[0]:
-                if option['option'] == 'WOL':
-                    self.mac = option['value']
-
-    async def _parse_system_information(self):
-        try:
-            content = await self._send_http(
-                self._get_action(
-                    "getSystemInformation").url, method=HttpMethod.GET)
-            if not content:
-                return
-        except (Exception, HTTPError):
-            return
-        for element in find_in_xml(
-                content, [("supportFunction", "all"), ("function", True)]
-        ):
-            for function in element:
-                if function.attrib["name"] == "WOL":
-                    self.mac = function.find(
-                        "functionItem").attrib["value"]
-
-    def _parse_dmr(self, data):
-        lirc_url = urlparse(self.ircc_url)
-        xml_data = xml.etree.ElementTree.fromstring(data)
-
-        for device in find_in_xml(xml_data, [
-            ("{0}device".format(URN_UPNP_DEVICE), True),
-            "{0}serviceList".format(URN_UPNP_DEVICE)
-        ]):
-            for service in device:
-                service_id = service.find(
-                    "{0}serviceId".format(URN_UPNP_DEVICE))
-                if "urn:upnp-org:serviceId:AVTransport" not in service_id.text:
-                    continue
-                transport_location = service.find(
-                    "{0}controlURL".format(URN_UPNP_DEVICE)).text
-                self.av_transport_url = "{0}://{1}:{2}{3}".format(
-                    lirc_url.scheme, lirc_url.netloc.split(":")[0],
-                    self.dmr_port, transport_location
-                )
-
-        # this is only true for v4 devices.
-        if WEBAPI_SERVICETYPE not in data:
-            return
-
-        self.api_version = 4
-        device_info_name = "{0}X_ScalarWebAPI_DeviceInfo".format(
-            URN_SCALAR_WEB_API_DEVICE_INFO
-        )
-
-        search_params = [
-            ("{0}device".format(URN_UPNP_DEVICE), True),
-            (device_info_name, True),
-            "{0}X_ScalarWebAPI_BaseURL".format(URN_SCALAR_WEB_API_DEVICE_INFO),
-        ]
-        for device in find_in_xml(xml_data, search_params):
-            for xml_url in device:
-                self.base_url = xml_url.text
-                if not self.base_url.endswith("/"):
-                    self.base_url = "{}/".format(self.base_url)
-
-                action = XmlApiObject({})
-                action.url = urljoin(self.base_url, "accessControl")
-                action.mode = 4
-                self.actions["register"] = action
-
-                action = XmlApiObject({})
-                action.url = urljoin(self.base_url, "system")
-                action.value = "getRemoteControllerInfo"
-                self.actions["getRemoteCommandList"] = action
-                self.control_url = urljoin(self.base_url, "IRCC")
-
-    async def _update_commands(self):
-        """Update the list of commands."""
-        if self.api_version == 0:
-            self._use_builtin_command_list()
-        elif self.api_version <= 3:
-            await self._parse_command_list()
-        elif self.api_version > 3 and self.pin:
-            _LOGGER.debug("Registration necessary to read command list.")
-            await self._parse_command_list_v4()
-
-    async def _parse_command_list_v4(self):
-        action_name = "getRemoteCommandList"
-        action = self.actions[action_name]
-        json_data = self._create_api_json(action.value)
-
-        response = await self._send_http(
-            action.url, HttpMethod.POST, json=json_data, headers={}
-        )
-
-        if not response:
-            _LOGGER.debug("no response received, device might be off")
-            return
-
-        json_resp = json.loads(response)
-        if json_resp and not json_resp.get('error'):
-            for command in json_resp.get('result')[1]:
-                api_object = XmlApiObject(command)
-                if api_object.name == "PowerOff":
-                    api_object.name = "Power"
-                self.commands[api_object.name] = api_object
-        else:
-            _LOGGER.error("JSON request error: %s",
-                          json.dumps(json_resp, indent=4))
-
-    async def _parse_command_list(self):
-        """Parse the list of available command in devices with the legacy api."""
-        action_name = "getRemoteCommandList"
-        if action_name not in self.actions:
-            _LOGGER.debug(
-                "Action list not set in device, try calling init_device")
-            return
-
-        action = self.actions[action_name]
-        url = action.url
-        response = await self._send_http(url, method=HttpMethod.GET)
-        if not response:
-            _LOGGER.debug(
-                "Failed to get response for command list, device might be off")
-            return
-
-        for command in find_in_xml(response, [("command", True)]):
-            name = command.get("name")
-            self.commands[name] = XmlApiObject(command.attrib)
-
-    def _use_builtin_command_list(self):
-        for encoded_str in self._ircc_categories:
-            fmt, category_id = struct.unpack(">HI", base64.b64decode(encoded_str))
-            try:
-                category = IrccCategory(category_id)
-            except ValueError:
-                _LOGGER.warning("Unknown IRCC category identifier: %d", category_id)
-                continue
-
-            code_list = IR_KEY_CODES.get(category)
-            if code_list is None:
-                _LOGGER.warning("No command list available for %s", category)
-                continue
-
-            for name, code in code_list:
-                value = base64.b64encode(struct.pack(">IIIB", fmt, category_id, code, 3))
-                data = XmlApiObject({
-                    "name": name,
-                    "type": "ircc",
-                    "value": value.decode("ascii"),
-                })
-                self.commands[name] = data
-
-    async def _update_applist(self):
-        """Update the list of apps which are supported by the device."""
-        if self.api_version < 4:
-            url = self.app_url + "/appslist"
-            response = await self._send_http(url, method=HttpMethod.GET)
-        else:
-            url = 'http://{}/DIAL/sony/applist'.format(self.host)
-            response = await self._send_http(
-                url,
-                method=HttpMethod.GET,
-                cookies={"auth", self.cookies.get("auth", None)})
-
-        if response:
-            for app in find_in_xml(response, [(".//app", True)]):
-                data = XmlApiObject({
-                    "name": app.find("name").text,
-                    "id": app.find("id").text,
-                })
-                self.apps[data.name] = data
-
     def _recreate_authentication(self):
         """Recreate auth authentication"""
         registration_action = self._get_action("register")
@@ -532,61 +144,106 @@ class SonyDevice:
         if self.psk:
             self.headers['X-Auth-PSK'] = self.psk
 
-    def _create_api_json(self, method, params=None):
-        # pylint: disable=invalid-name
-        """Create json data which will be send via post for the V4 api"""
-        if not params:
-            params = [{
-                "clientid": self.client_id,
-                "nickname": self.nickname
-            }, [{
-                "clientid": self.client_id,
-                "nickname": self.nickname,
-                "value": "yes",
-                "function": "WOL"
-            }]]
-
-        return {
-            "method": method,
-            "params": params,
-            "id": 1,
-            "version": "1.0"
-        }
-
     async def _send_http(self, url, method, **kwargs) -> str | None:
         # pylint: disable=too-many-arguments
         """Send request command via HTTP json to Sony Bravia."""
         log_errors = kwargs.pop("log_errors", True)
         raise_errors = kwargs.pop("raise_errors", False)
         method = kwargs.pop("method", method.value)
-        timeout = kwargs.pop("timeout", TIMEOUT)
+        # the request only gets the time left to the operation it is part of
+        timeout = deadline.remaining(kwargs.pop("timeout", TIMEOUT))
+        endpoint = kwargs.pop("endpoint", ENDPOINT_OTHER)
+        # only a request without side effect is sent again, an IRCC key or a power toggle may have been executed
+        idempotent = kwargs.pop("idempotent", method == HttpMethod.GET.value)
 
-        params = {
-            "timeout": timeout,
-            "headers": self.headers,
-        }
-        params.update(kwargs)
+        # the remaining keyword arguments are passed to the request
+        kwargs.setdefault("headers", self.headers)
 
         _LOGGER.debug(
             "Calling http url %s method %s", url, method)
         if url is None:
             return None
 
+        kwargs["timeout"] = ClientTimeout(total=timeout, connect=timeout, sock_connect=timeout)
+        if self.cookies is not None and "auth" in self.cookies:
+            kwargs.setdefault("cookies", {"auth": self.cookies["auth"].value})
+
+        start = time.monotonic()
+        bytes_received = 0
+        error = False
+        timed_out = False
         try:
-            cookies = {} if self.cookies is None else {"auth", self.cookies.get("auth", None)}
-            async with aiohttp.ClientSession(timeout=ClientTimeout(sock_read=60, sock_connect=timeout,
-                                                                   connect=timeout, total=60),
-                                             cookies=cookies) as session:
-                response = await getattr(session, method)(url, **params)
-                response.raise_for_status()
-                return await response.text(encoding="utf-8")
+            body = await self._request(method, url, kwargs, idempotent)
+            bytes_received = len(body)
+            return body.decode("utf-8")
         except aiohttp.ClientConnectorError as ex:
+            error = True
             if log_errors:
                 _LOGGER.error("HTTPError: %s", str(ex))
             if raise_errors:
                 raise
+        except asyncio.TimeoutError:
+            timed_out = True
+            raise
+        except Exception:
+            error = True
+            raise
+        finally:
+            http_metrics.observe(self.device_id or self.host, endpoint, time.monotonic() - start,
+                                 error=error, timeout=timed_out, bytes_sent=_body_size(kwargs),
+                                 bytes_received=bytes_received)
+
+    async def _request(self, method: str, url: str, params: dict, idempotent: bool) -> bytes:
+        """Send a request on the pooled session and return the body of the response."""
+        session = self._get_session()
+        for attempt in range(2):
+            try:
+                with tracing.span(tracing.STAGE_REQUEST):
+                    response = await getattr(session, method)(url, **params)
+                break
+            except aiohttp.ServerDisconnectedError:
+                # the device closed the pooled connection while it was idle
+                if attempt or not idempotent:
+                    raise
+        async with response:
+            response.raise_for_status()
+            with tracing.span(tracing.STAGE_RESPONSE):
+                return await response.read()
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(keepalive_timeout=KEEPALIVE_TIMEOUT),
+                cookie_jar=aiohttp.DummyCookieJar(), trace_configs=[_TRACE_CONFIG])
+        return self._session
+
+    async def warm_up(self, timeout=2) -> bool:
+        """
+        Open a connection to the IRCC control url, or keep it alive, so that the next command doesn't wait for it.
 
-    async def _post_soap_request(self, url, params, action) -> str | None:
+        :return: True if the device answered.
+        """
+        if self.control_url is None:
+            return False
+        try:
+            async with self._get_session().head(self.control_url, headers=self.headers,
+                                                timeout=ClientTimeout(total=timeout)) as response:
+                await response.read()
+            return True
+        except (aiohttp.ClientError, asyncio.TimeoutError) as ex:
+            _LOGGER.debug("Cannot warm up the connection to %s: %r", self.control_url, ex)
+            return False
+
+    async def close(self):
+        """Close the pooled connections to the device."""
+        self.invalidate_probes()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _post_soap_request(self, url, params, action, *, endpoint=ENDPOINT_OTHER, timeout=TIMEOUT,
+                                 idempotent=False) -> str | None:
+        # pylint: disable=too-many-arguments
         headers = {
             'SOAPACTION': '"{0}"'.format(action),
             "Content-Type": "text/xml"
@@ -600,7 +257,8 @@ class SonyDevice:
                         </SOAP-ENV:Body>
                     </SOAP-ENV:Envelope>""".format(params)
         response = await self._send_http(
-            url, method=HttpMethod.POST, headers=headers, data=data)
+            url, method=HttpMethod.POST, headers=headers, data=data, endpoint=endpoint, timeout=timeout,
+            idempotent=idempotent)
         if response:
             return response
         return None
@@ -612,38 +270,73 @@ class SonyDevice:
                   </u:X_SendIRCC>""".format(params)
         action = "urn:schemas-sony-com:service:IRCC:1#X_SendIRCC"
 
-        content = await self._post_soap_request(
-            url=self.control_url, params=data, action=action)
+        try:
+            content = await self._post_soap_request(
+                url=self.control_url, params=data, action=action, endpoint=ENDPOINT_IRCC)
+        finally:
+            self.invalidate_probes()
         return content
 
+    def invalidate_probes(self) -> None:
+        """Forget the probe results and the probes in flight, e.g. after a command changing the device state."""
+        self._probe_generation += 1
+        self._probe_tasks.clear()
+        self._probe_results.clear()
+
+    async def _shared_probe(self, name: str, probe, timeout: float):
+        """
+        Run an idempotent probe of the device state, concurrent callers share the request in flight.
+
+        The result is reused for probe_cache_ttl seconds.
+
+        :param name: name of the probe
+        :param probe: coroutine function of the probe, called with the timeout
+        :param timeout: timeout in seconds of the request
+        """
+        cached = self._probe_results.get(name)
+        if cached is not None and time.monotonic() - cached[0] < self.probe_cache_ttl:
+            return cached[1]
+        timeout = deadline.remaining(timeout)
+        task = self._probe_tasks.get(name)
+        if task is None or task.done():
+            try:
+                task = self._spawn(self._run_probe(name, probe, timeout), "probe")
+            except RuntimeError as ex:
+                # no task can be started for the device, probe without sharing the request
+                _LOGGER.debug("Probe %s not shared: %s", name, ex)
+                return await probe(timeout)
+            self._probe_tasks[name] = task
+        # cancelling a caller must not cancel the request shared with the other callers
+        return await asyncio.wait_for(asyncio.shield(task), deadline.remaining())
+
+    async def _run_probe(self, name: str, probe, timeout: float):
+        generation = self._probe_generation
+        try:
+            result = await probe(timeout)
+        finally:
+            if self._probe_tasks.get(name) is asyncio.current_task():
+                del self._probe_tasks[name]
+        if generation == self._probe_generation:
+            self._probe_results[name] = (time.monotonic(), result)
+        return result
+
     async def _send_command(self, name):
         if not self.commands:
             raise ValueError('Unknown command: %s' % name)
             # self.init_device()
 
-        if self.commands:
-            if name in self.commands:
-                await self._send_req_ircc(self.commands[name].value)
-            else:
-                raise ValueError('Unknown command: %s' % name)
-        else:
-            raise ValueError('Failed to read command list from device.')
-
-    def _get_action(self, name):
-        """Get the action object for the action with the given name"""
-        if name not in self.actions and not self.actions:
-            # self.init_device()
-            # if name not in self.actions and not self.actions:
-            raise ValueError('Failed to read action list from device.')
-
-        return self.actions[name]
+        if name not in self.commands:
+            raise ValueError('Unknown command: %s' % name)
+        # the SOAP response, None if the device could not be connected to
+        return await self._send_req_ircc(self.commands[name].value)
 
     async def _register_without_auth(self, registration_action):
         try:
             await self._send_http(
                 registration_action.url,
                 method=HttpMethod.GET,
-                raise_errors=True)
+                raise_errors=True,
+                endpoint=ENDPOINT_REGISTER)
             # set the pin to something to make sure init_device is called
             self.pin = 9999
         except (Exception, HTTPError) as ex:
@@ -655,7 +348,7 @@ class SonyDevice:
     async def _register_v3(self, registration_action):
         try:
             await self._send_http(registration_action.url,
-                                  method=HttpMethod.GET, raise_errors=True)
+                                  method=HttpMethod.GET, raise_errors=True, endpoint=ENDPOINT_REGISTER)
         except ClientResponseError as ex:
             _LOGGER.error("Registration v3 error", ex)
             if ex.status == 401:
@@ -677,13 +370,29 @@ class SonyDevice:
             else:
                 auth_pin = str(self.pin)
 
-            async with aiohttp.ClientSession(timeout=ClientTimeout(sock_read=60, sock_connect=TIMEOUT,
-                                                                   connect=TIMEOUT, total=60),
+            data = json.dumps(authorization)
+            start = time.monotonic()
+            timeout = deadline.remaining(REGISTER_TIMEOUT)
+            connect_timeout = min(timeout, TIMEOUT)
+            async with aiohttp.ClientSession(timeout=ClientTimeout(sock_read=timeout, sock_connect=connect_timeout,
+                                                                   connect=connect_timeout, total=timeout),
                                              raise_for_status=True) as session:
-                response = await session.post(registration_action.url,
-                                              data=json.dumps(authorization),
-                                              headers=headers,
-                                              params={'auth': ('', auth_pin)})
+                failed = False
+                timed_out = False
+                try:
+                    response = await session.post(registration_action.url,
+                                                  data=data,
+                                                  headers=headers,
+                                                  params={'auth': ('', auth_pin)})
+                except asyncio.TimeoutError:
+                    timed_out = True
+                    raise
+                except Exception:
+                    failed = True
+                    raise
+                finally:
+                    http_metrics.observe(self.device_id or self.host, ENDPOINT_REGISTER, time.monotonic() - start,
+                                         error=failed, timeout=timed_out, bytes_sent=len(data))
 
                 # response = await self._send_http(registration_action.url,
                 #                                  method=HttpMethod.POST,
@@ -703,11 +412,6 @@ class SonyDevice:
                 return AuthenticationResult.PIN_NEEDED
             return AuthenticationResult.ERROR
 
-    def _add_headers(self):
-        """Add headers which all devices need"""
-        self.headers['X-CERS-DEVICE-ID'] = self.client_id
-        self.headers['X-CERS-DEVICE-INFO'] = self.client_id
-
     async def register(self):
         """Register at the api.
 
@@ -753,33 +457,27 @@ class SonyDevice:
 
         return AuthenticationResult.SUCCESS == result
 
-    def _create_magic_packet(self, mac_address: str) -> bytes:
-        """Create a magic packet to wake on LAN."""
-        addr_byte = mac_address.replace("-", ":").split(":")
-        hw_addr = struct.pack(
-            "BBBBBB",
-            int(addr_byte[0], 16),
-            int(addr_byte[1], 16),
-            int(addr_byte[2], 16),
-            int(addr_byte[3], 16),
-            int(addr_byte[4], 16),
-            int(addr_byte[5], 16),
-        )
-        return b"\xff" * 6 + hw_addr * 16
-
-    def wakeonlan(self, broadcast='255.255.255.255') -> None:
-        """Send WOL command. to known mac addresses."""
-        messages = [self._create_magic_packet(self.mac)]
-        broadcast = "<broadcast>" if broadcast is None else broadcast
-        socket_instance = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        socket_instance.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-        for msg in messages:
-            socket_instance.sendto(msg, (broadcast, 9))
-
-    async def get_status(self) -> DeviceState:
+    async def wakeonlan(self, broadcast=None) -> None:
+        """Send a burst of WOL packets on every local network, and to the last known address of the device."""
+        if not self.mac:
+            _LOGGER.debug("Unknown mac address, cannot wake on LAN")
+            return
+        addresses = wol.broadcast_addresses() + [self.host]
+        if broadcast:
+            addresses.append(broadcast)
+        await wol.send_magic_packet(self.mac, addresses)
+        self.invalidate_probes()
+
+    async def get_status(self, timeout=TIMEOUT) -> DeviceState | None:
+        """Get the status of the device, None if the device does not support the status action."""
+        return await self._shared_probe("status", self._get_status, timeout)
+
+    async def _get_status(self, timeout) -> DeviceState | None:
+        if "getStatus" not in self.actions:
+            return None
         response = await self._send_http(
             self._get_action(
-                "getStatus").url, method=HttpMethod.GET)
+                "getStatus").url, method=HttpMethod.GET, endpoint=ENDPOINT_STATUS, timeout=timeout)
         if not response:
             return DeviceState.OFF
         for element in find_in_xml(
@@ -789,8 +487,11 @@ class SonyDevice:
                 return DeviceState.PLAYING
         return DeviceState.STOPPED
 
-    async def get_playing_status(self):
+    async def get_playing_status(self, timeout=TIMEOUT):
         """Get the status of playback from the device"""
+        return await self._shared_probe("transport", self._get_playing_status, timeout)
+
+    async def _get_playing_status(self, timeout):
         data = """<m:GetTransportInfo xmlns:m="urn:schemas-upnp-org:service:AVTransport:1">
             <InstanceID>0</InstanceID>
             </m:GetTransportInfo>"""
@@ -798,38 +499,95 @@ class SonyDevice:
         action = "urn:schemas-upnp-org:service:AVTransport:1#GetTransportInfo"
 
         content = await self._post_soap_request(
-            url=self.av_transport_url, params=data, action=action)
+            url=self.av_transport_url, params=data, action=action, endpoint=ENDPOINT_AV_TRANSPORT,
+            timeout=timeout, idempotent=True)
         if not content:
             return "OFF"
 
         return find_in_xml(content, [".//CurrentTransportState"]).text
 
+    async def get_position_info(self, timeout=TIMEOUT) -> tuple[int | None, int | None]:
+        """Get the playback position and the duration of the current track in seconds, None if unknown."""
+        data = """<m:GetPositionInfo xmlns:m="urn:schemas-upnp-org:service:AVTransport:1">
+            <InstanceID>0</InstanceID>
+            </m:GetPositionInfo>"""
+
+        action = "urn:schemas-upnp-org:service:AVTransport:1#GetPositionInfo"
+
+        content = await self._post_soap_request(
+            url=self.av_transport_url, params=data, action=action, endpoint=ENDPOINT_AV_TRANSPORT,
+            timeout=timeout, idempotent=True)
+        if not content:
+            return None, None
+        return (parse_duration(find_in_xml(content, [".//RelTime"])),
+                parse_duration(find_in_xml(content, [".//TrackDuration"])))
+
+    async def get_media_info(self, timeout=TIMEOUT) -> int | None:
+        """Get the duration of the current media in seconds, None if unknown."""
+        data = """<m:GetMediaInfo xmlns:m="urn:schemas-upnp-org:service:AVTransport:1">
+            <InstanceID>0</InstanceID>
+            </m:GetMediaInfo>"""
+
+        action = "urn:schemas-upnp-org:service:AVTransport:1#GetMediaInfo"
+
+        content = await self._post_soap_request(
+            url=self.av_transport_url, params=data, action=action, endpoint=ENDPOINT_AV_TRANSPORT,
+            timeout=timeout, idempotent=True)
+        if not content:
+            return None
+        return parse_duration(find_in_xml(content, [".//MediaDuration"]))
+
     async def get_power_status(self, timeout=TIMEOUT):
         """Check if the device is online."""
-        if self.api_version < 4:
-            url = self.actionlist_url
-            try:
-                await self._send_http(url, HttpMethod.GET,
-                                      log_errors=False, raise_errors=True, timeout=timeout)
-            except Exception as ex:
-                _LOGGER.debug(ex)
-                return False
-            return True
+        return await self._shared_probe("power", self._get_power_status, timeout)
+
+    async def _get_power_status(self, timeout) -> bool:
+        return bool(await self._read_power_status(timeout))
+
+    async def _read_power_status(self, timeout) -> bool | None:
+        """Read the power status, None if the device doesn't answer in time."""
+        try:
+            if self.api_version < 4:
+                return await self._read_power_status_v3(timeout)
+            return await self._read_power_status_v4(timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def _read_power_status_v3(self, timeout) -> bool:
+        url = self.actionlist_url
+        if url is None:
+            # the description of the device could not be read
+            return False
+        try:
+            await self._send_http(url, HttpMethod.GET,
+                                  log_errors=False, raise_errors=True, timeout=timeout,
+                                  endpoint=ENDPOINT_POWER)
+        except asyncio.TimeoutError:
+            raise
+        except Exception as ex:
+            _LOGGER.debug(ex)
+            return False
+        return True
+
+    async def _read_power_status_v4(self, timeout) -> bool:
         try:
             resp = await self._send_http(urljoin(self.base_url, "system"),
                                          HttpMethod.POST,
                                          json=self._create_api_json(
                                              "getPowerStatus"),
-                                         timeout=timeout)
+                                         timeout=timeout,
+                                         endpoint=ENDPOINT_POWER)
             if not resp:
                 return False
             json_data = json.loads(resp)
-            if not json_data.get('error'):
-                power_data = json_data.get('result')[0]
-                return power_data.get('status') != "off"
+            if json_data.get('error'):
+                return False
+            power_data = json_data.get('result')[0]
+            return power_data.get('status') != "off"
+        except asyncio.TimeoutError:
+            raise
         except Exception:
-            pass
-        return False
+            return False
 
     async def start_app(self, app_name):
         """Start an app by name"""
@@ -839,26 +597,52 @@ class SonyDevice:
         if self.api_version < 4:
             url = "{0}/apps/{1}".format(self.app_url, self.apps[app_name].id)
             data = "LOCATION: {0}/run".format(url)
-            await self._send_http(url, HttpMethod.POST, data=data)
+            await self._send_http(url, HttpMethod.POST, data=data, endpoint=ENDPOINT_APP)
         else:
             url = 'http://{}/DIAL/apps/{}'.format(
                 self.host, self.apps[app_name].id)
             await self._send_http(url, HttpMethod.POST,
-                                  cookies={"auth", self.cookies.get("auth")})
+                                  endpoint=ENDPOINT_APP)
 
-    async def power(self, power_on, broadcast='255.255.255.255'):
+    async def power(self, power_on, broadcast=None):
         """Powers the device on or shuts it off."""
         if power_on:
             _LOGGER.debug("Wake on lan")
-            self.wakeonlan(broadcast)
-            # Try using the power on command incase the WOL doesn't work
-            if self.initialized and not await self.get_power_status(timeout=2):
-                # Try using the power on command incase the WOL doesn't work
-                _LOGGER.debug("Sends power command asynchronously")
-                self._event_loop.create_task(self._send_command('Power'))
+            # the power command is sent along, in case the WOL doesn't work
+            wol_result, fallback_result = await asyncio.gather(
+                self.wakeonlan(broadcast), self._power_on_fallback(), return_exceptions=True)
+            if isinstance(wol_result, Exception):
+                _LOGGER.warning("Cannot send the WOL packets: %r", wol_result)
+            if isinstance(fallback_result, Exception):
+                raise fallback_result
         else:
             await self._send_command('Power')
 
+    async def _power_on_fallback(self):
+        """
+        Send the power command if the device reports it is off or refuses the connection.
+
+        The command toggles the power: it is not sent to a device which is slow to answer, it may be on.
+        """
+        if not self.initialized:
+            return
+        # not shared with the other probes, a result cached before the WOL packets is not relevant
+        powered = await self._read_power_status(POWER_PROBE_TIMEOUT)
+        if powered is None:
+            _LOGGER.debug("No answer to the power status, the power command is not sent")
+        elif not powered:
+            _LOGGER.debug("Sends power command asynchronously")
+            try:
+                self._spawn(self._send_command('Power'), "power")
+            except RuntimeError as ex:
+                _LOGGER.debug("Sends power command now: %s", ex)
+                await self._send_command('Power')
+
+    def _spawn(self, coro, name: str):
+        if self.task_spawner is not None:
+            return self.task_spawner(coro, name)
+        return self._event_loop.create_task(coro)
+
     def get_apps(self):
         """Get the apps from the stored dict."""
         return list(self.apps.keys())
@@ -1072,41 +856,22 @@ class SonyDevice:
         await self._send_command('List')
 
 
-def xml_search_helper(data, param):
-    """Perform find or findall on given xml with string from param."""
-    if isinstance(param, (tuple, list)) and param[1]:
-        result = data.findall(param[0])
-    else:
-        result = data.find(param)
-    return result
+def _body_size(kwargs) -> int:
+    """Return the size in bytes of the request body given to _send_http."""
+    data = kwargs.get("data")
+    if data is None and kwargs.get("json") is not None:
+        data = json.dumps(kwargs["json"])
+    if data is None:
+        return 0
+    return len(data.encode("utf-8") if isinstance(data, str) else data)
 
 
-def iterate_search_data(data, param):
-    """Search in nested lists."""
-    result = []
-    for element in data:
-        if isinstance(element, list):
-            result.append(iterate_search_data(element, param))
-        else:
-            result.append(xml_search_helper(element, param))
-    return result
-
-
-def find_in_xml(data, search_params):
-    """Try to find an element in an xml
-
-    Take an xml from string or as xml.etree.ElementTree
-    and an iterable of strings (and/or tuples in case of findall) to search.
-    The tuple should contain the string to search for and a true value.
-    """
-    if isinstance(data, str):
-        data = xml.etree.ElementTree.fromstring(data)
-    param = search_params[0]
-    if isinstance(data, list):
-        result = iterate_search_data(data, param)
-    else:
-        result = xml_search_helper(data, param)
-
-    if len(search_params) == 1:
-        return result
-    return find_in_xml(result, search_params[1:])
+def parse_duration(element) -> int | None:
+    """Parse an UPnP duration element (H+:MM:SS[.F+]) into seconds, None if missing or not implemented."""
+    if element is None or not element.text:
+        return None
+    try:
+        hours, minutes, seconds = element.text.strip().split(":")
+        return int(hours) * 3600 + int(minutes) * 60 + int(float(seconds))
+    except ValueError:
+        return None
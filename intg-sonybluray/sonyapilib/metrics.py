@@ -0,0 +1,222 @@
+"""HTTP request, state prediction and command queue metrics of the Sony devices."""
+import bisect
+import os
+from dataclasses import dataclass, field
+
+ENDPOINT_IRCC = "ircc"
+ENDPOINT_IRCC_LIST = "ircc-list"
+ENDPOINT_POWER = "power"
+ENDPOINT_STATUS = "status"
+ENDPOINT_AV_TRANSPORT = "avtransport"
+ENDPOINT_DMR = "dmr"
+ENDPOINT_ACTION_LIST = "actionlist"
+ENDPOINT_V4_SYSTEM = "v4-system"
+ENDPOINT_REGISTER = "register"
+ENDPOINT_APP = "app"
+ENDPOINT_OTHER = "other"
+
+PREDICTION_PREDICTED = "predicted"
+PREDICTION_CONFIRMED = "confirmed"
+PREDICTION_ROLLED_BACK = "rolled_back"
+
+QUEUE_ENQUEUED = "enqueued"
+QUEUE_DELIVERED = "delivered"
+QUEUE_FAILED = "failed"
+QUEUE_DROPPED = "dropped"
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+@dataclass(slots=True)
+class EndpointStats:
+    """Statistics of the requests sent to one endpoint of one device."""
+
+    buckets: list[int] = field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+    count: int = 0
+    duration_sum: float = 0.0
+    duration_max: float = 0.0
+    errors: int = 0
+    timeouts: int = 0
+    retries: int = 0
+    bytes_sent: int = 0
+    bytes_received: int = 0
+
+    def to_dict(self) -> dict:
+        """Return the statistics as a dictionary."""
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "retries": self.retries,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "duration_sum": round(self.duration_sum, 6),
+            "duration_max": round(self.duration_max, 6),
+            "buckets": dict(zip([str(bound) for bound in LATENCY_BUCKETS] + ["+Inf"], self.buckets)),
+        }
+
+
+class HttpMetrics:
+    """Collect latency histograms and counters of HTTP requests, labeled by device and logical endpoint."""
+
+    def __init__(self):
+        """Create an empty registry."""
+        self._stats: dict[tuple[str, str], EndpointStats] = {}
+
+    def _get(self, device: str, endpoint: str) -> EndpointStats:
+        key = (device, endpoint)
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = EndpointStats()
+        return stats
+
+    def observe(self, device: str, endpoint: str, duration: float, *, error: bool = False, timeout: bool = False,
+                bytes_sent: int = 0, bytes_received: int = 0) -> None:
+        """Record one request."""
+        stats = self._get(device, endpoint)
+        stats.buckets[bisect.bisect_left(LATENCY_BUCKETS, duration)] += 1
+        stats.count += 1
+        stats.duration_sum += duration
+        stats.duration_max = max(stats.duration_max, duration)
+        if timeout:
+            stats.timeouts += 1
+        elif error:
+            stats.errors += 1
+        stats.bytes_sent += bytes_sent
+        stats.bytes_received += bytes_received
+
+    def record_retry(self, device: str, endpoint: str) -> None:
+        """Record a request which is retried."""
+        self._get(device, endpoint).retries += 1
+
+    def remove_device(self, device: str) -> None:
+        """Drop the statistics of the given device."""
+        for key in [key for key in self._stats if key[0] == device]:
+            del self._stats[key]
+
+    def clear(self) -> None:
+        """Reset all statistics."""
+        self._stats.clear()
+
+    def snapshot(self, device: str | None = None) -> dict[str, dict[str, dict]]:
+        """
+        Return the current statistics.
+
+        :param device: only return the statistics of this device
+        :return: dictionary of device -> endpoint -> statistics
+        """
+        result = {}
+        for (stats_device, endpoint), stats in self._stats.items():
+            if device is not None and stats_device != device:
+                continue
+            result.setdefault(stats_device, {})[endpoint] = stats.to_dict()
+        return result
+
+    def to_prometheus(self) -> str:
+        """Return the statistics in the Prometheus text exposition format."""
+        lines = [
+            "# HELP sony_http_request_duration_seconds Duration of the HTTP requests sent to the devices.",
+            "# TYPE sony_http_request_duration_seconds histogram",
+        ]
+        counters = {
+            "errors": ("sony_http_errors_total", "Failed HTTP requests."),
+            "timeouts": ("sony_http_timeouts_total", "Timed out HTTP requests."),
+            "retries": ("sony_http_retries_total", "Retried HTTP requests."),
+            "bytes_sent": ("sony_http_request_bytes_total", "Bytes sent in HTTP request bodies."),
+            "bytes_received": ("sony_http_response_bytes_total", "Bytes received in HTTP response bodies."),
+        }
+        items = sorted(self._stats.items())
+        for (device, endpoint), stats in items:
+            labels = f'device="{_escape(device)}",endpoint="{endpoint}"'
+            cumulated = 0
+            for bound, count in zip([str(bound) for bound in LATENCY_BUCKETS] + ["+Inf"], stats.buckets):
+                cumulated += count
+                lines.append(f'sony_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulated}')
+            lines.append(f"sony_http_request_duration_seconds_sum{{{labels}}} {stats.duration_sum:.6f}")
+            lines.append(f"sony_http_request_duration_seconds_count{{{labels}}} {stats.count}")
+        for attribute, (name, description) in counters.items():
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} counter")
+            for (device, endpoint), stats in items:
+                lines.append(f'{name}{{device="{_escape(device)}",endpoint="{endpoint}"}} {getattr(stats, attribute)}')
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str) -> None:
+        """Write the statistics in the Prometheus text format to the given file."""
+        _write(path, self.to_prometheus())
+
+
+class OutcomeMetrics:
+    """Count events by outcome per device, e.g. the state predictions and how they were reconciled."""
+
+    def __init__(self, name: str, description: str, outcomes: tuple[str, ...]):
+        """
+        Create an empty registry.
+
+        :param name: name of the Prometheus counter
+        :param description: help text of the Prometheus counter
+        :param outcomes: recorded outcomes
+        """
+        self._name = name
+        self._description = description
+        self._outcomes = outcomes
+        self._counts: dict[str, dict[str, int]] = {}
+
+    def record(self, device: str, outcome: str) -> None:
+        """Record an event with the given outcome."""
+        counts = self._counts.get(device)
+        if counts is None:
+            counts = self._counts[device] = dict.fromkeys(self._outcomes, 0)
+        counts[outcome] += 1
+
+    def remove_device(self, device: str) -> None:
+        """Drop the counters of the given device."""
+        self._counts.pop(device, None)
+
+    def clear(self) -> None:
+        """Reset all counters."""
+        self._counts.clear()
+
+    def snapshot(self, device: str | None = None) -> dict[str, dict[str, int]]:
+        """Return the current counters, as a dictionary of device -> outcome -> count."""
+        return {
+            counts_device: dict(counts) for counts_device, counts in self._counts.items()
+            if device is None or counts_device == device
+        }
+
+    def to_prometheus(self) -> str:
+        """Return the counters in the Prometheus text exposition format."""
+        lines = [
+            f"# HELP {self._name} {self._description}",
+            f"# TYPE {self._name} counter",
+        ]
+        for device, counts in sorted(self._counts.items()):
+            for outcome, count in counts.items():
+                lines.append(f'{self._name}{{device="{_escape(device)}",outcome="{outcome}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def _write(path: str, data: str) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def dump_prometheus(path: str) -> None:
+    """Write all the metrics in the Prometheus text format to the given file."""
+    _write(path, http_metrics.to_prometheus() + prediction_metrics.to_prometheus()
+           + command_queue_metrics.to_prometheus())
+
+
+http_metrics = HttpMetrics()
+prediction_metrics = OutcomeMetrics("sony_state_predictions_total", "Optimistic state predictions by outcome.",
+                                    (PREDICTION_PREDICTED, PREDICTION_CONFIRMED, PREDICTION_ROLLED_BACK))
+command_queue_metrics = OutcomeMetrics("sony_queued_commands_total",
+                                       "Commands acknowledged before they are sent to the device, by outcome.",
+                                       (QUEUE_ENQUEUED, QUEUE_DELIVERED, QUEUE_FAILED, QUEUE_DROPPED))
@@ -0,0 +1,108 @@
+"""Adaptive pacing of the key streams sent to a Sony device, learned from its IRCC response times."""
+import asyncio
+import logging
+import time
+from contextvars import ContextVar
+
+_LOGGER = logging.getLogger(__name__)
+
+# Bounds in seconds of the interval between the starts of two consecutive keys of a stream
+MIN_INTERVAL = 0.05
+MAX_INTERVAL = 1.0
+# Additive decrease of the interval after a key acknowledged in the usual time
+DECREASE_STEP = 0.01
+# Multiplicative increase of the interval after a slow or failed key
+INCREASE_FACTOR = 1.5
+# A response slower than this multiple of the average latency, and than the average latency plus MIN_INTERVAL to
+# ignore the jitter of fast responses, means the device is still busy with previous keys
+SLOW_FACTOR = 2
+# Weight of the latest response in the average latency
+LATENCY_WEIGHT = 0.2
+
+_in_stream: ContextVar[bool] = ContextVar("sony_key_stream", default=False)
+
+
+def _clamp(interval: float) -> float:
+    return min(MAX_INTERVAL, max(MIN_INTERVAL, interval))
+
+
+class KeyPacer:
+    """
+    Space the keys of a stream (repeats, sequences, queued keys) to the fastest rate the device handles.
+
+    The interval is learned from the first response time, then follows an additive-increase/multiplicative-decrease of
+    the key rate: it shrinks by DECREASE_STEP while the keys are acknowledged in the usual time, down to the average
+    latency, and grows by INCREASE_FACTOR only when a key is slow or fails.
+    """
+
+    def __init__(self, interval: float | None = None):
+        """Create the pacer, starting at the interval in seconds learned previously if any."""
+        self.interval: float | None = None if interval is None else _clamp(interval)
+        # average IRCC response time in seconds, None until a key is acknowledged
+        self.latency: float | None = None
+        # monotonic time from which the next key may be sent
+        self._next_slot = 0.0
+
+    async def wait(self) -> float:
+        """
+        Wait for the slot of the next key of a stream, concurrent callers get consecutive slots.
+
+        :return: the time waited in seconds
+        """
+        now = time.monotonic()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + (self.interval or MIN_INTERVAL)
+        if slot <= now:
+            return 0.0
+        await asyncio.sleep(slot - now)
+        return slot - now
+
+    def observe(self, latency: float, failed: bool = False) -> None:
+        """
+        Adapt the interval to the response time of a key.
+
+        :param latency: duration in seconds of the IRCC request
+        :param failed: True if the request failed or timed out
+        """
+        if self.interval is None:
+            if failed:
+                # the duration of a failed key tells nothing about the response time of the device
+                return
+            self.interval = _clamp(latency)
+        elif failed or (self.latency is not None
+                        and latency > max(SLOW_FACTOR * self.latency, self.latency + MIN_INTERVAL)):
+            interval = _clamp(self.interval * INCREASE_FACTOR)
+            if interval != self.interval:
+                _LOGGER.debug("Key interval %.3f -> %.3f s after a %s key", self.interval, interval,
+                              "failed" if failed else "slow")
+            self.interval = interval
+        else:
+            floor = MIN_INTERVAL if self.latency is None else max(MIN_INTERVAL, self.latency)
+            self.interval = max(min(self.interval, floor), self.interval - DECREASE_STEP)
+        if not failed:
+            self.latency = latency if self.latency is None else (
+                LATENCY_WEIGHT * latency + (1 - LATENCY_WEIGHT) * self.latency)
+
+
+class _StreamScope:
+    __slots__ = ("_active", "_token")
+
+    def __init__(self, active: bool):
+        self._active = active
+        self._token = None
+
+    def __enter__(self):
+        self._token = _in_stream.set(self._active)
+
+    def __exit__(self, exc_type, exc, traceback):
+        _in_stream.reset(self._token)
+
+
+def stream(active: bool = True) -> _StreamScope:
+    """Return a context manager marking the keys sent by the current task as a stream, to be paced."""
+    return _StreamScope(active)
+
+
+def in_stream() -> bool:
+    """Return True if the keys sent by the current task are part of a stream."""
+    return _in_stream.get()
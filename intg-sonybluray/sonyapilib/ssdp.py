@@ -1,59 +1,134 @@
 """SSDP Implementation"""
-import email
 import logging
 import socket
-from io import StringIO
+from urllib.parse import urlparse
 
 _LOGGER = logging.getLogger(__name__)
 
+NTS_ALIVE = "ssdp:alive"
+NTS_BYEBYE = "ssdp:byebye"
+
+# start lines of the parsed messages: search responses and announcements
+_RESPONSE = b"HTTP/1.1 200 OK"
+_NOTIFY = b"NOTIFY * HTTP/1.1"
+# header name -> record attribute
+_HEADERS = {
+    b"LOCATION": "location",
+    b"USN": "usn",
+    b"ST": "st",
+    b"NT": "st",
+    b"NTS": "nts",
+    b"SERVER": "server",
+    b"CACHE-CONTROL": "cache_control",
+    b"BOOTID.UPNP.ORG": "boot_id",
+}
+# Sony devices identify themselves in the SERVER header, or with a unique device name derived from their mac address
+_SONY_SERVER = b"sony"
+_SONY_USN = b"-1010-8000-"
+_SONY_SCHEMA = b"schemas-sony-com"
 
-class SSDPResponse:
-    # pylint: disable=too-few-public-methods
-    """Hold the response of a ssdp request."""
 
-    def __init__(self, response):
-        """Init the ssdp response with given data"""
-        if not response:
-            return
+class SSDPRecord:
+    # pylint: disable=too-few-public-methods,too-many-instance-attributes
+    """Headers of an SSDP search response or NOTIFY announcement."""
 
-        # construct a message from the request string
-        message = email.message_from_file(StringIO(response))
+    __slots__ = ("notify", "address", "location", "usn", "st", "nts", "server", "cache_control", "boot_id")
 
-        # construct a dictionary containing the headers
-        headers = dict(message.items())
-        self.location = headers.get("LOCATION", None)
-        self.usn = headers.get("USN", None)
+    def __init__(self, notify: bool, address: str | None = None):
+        """Init an empty record, see parse_ssdp."""
+        self.notify = notify
+        # address the message was received from
+        self.address = address
+        self.location: str | None = None
+        self.usn: str | None = None
+        # search target of a response, notification type of an announcement
         # pylint: disable=invalid-name
-        self.st = headers.get("ST", None)
-        if headers.get("CACHE-CONTROL", None):
-            self.cache = headers["CACHE-CONTROL"].split("=")[1]
+        self.st: str | None = None
+        self.nts: str | None = None
+        self.server: str | None = None
+        self.cache_control: str | None = None
+        self.boot_id: str | None = None
+
+    @property
+    def alive(self) -> bool:
+        """Return True unless the record is an ssdp:byebye announcement."""
+        return self.nts != NTS_BYEBYE
+
+    @property
+    def uuid(self) -> str | None:
+        """Return the unique device name (uuid:...) of the device."""
+        return self.usn.split("::", 1)[0] if self.usn else None
+
+    @property
+    def host(self) -> str | None:
+        """Return the host of the device description, or the address the message was received from."""
+        if self.location:
+            host = urlparse(self.location).hostname
+            if host:
+                return host
+        return self.address
+
+    @property
+    def max_age(self) -> int | None:
+        """Return the validity duration in seconds of the announcement."""
+        if not self.cache_control:
+            return None
+        _, sep, value = self.cache_control.partition("=")
+        try:
+            return int(value) if sep else None
+        except ValueError:
+            return None
 
     def __repr__(self):
         """Define how string representation looks"""
-        return "<SSDPResponse({location}, {st}, {usn})>"\
-            .format(**self.__dict__)
+        return f"<SSDPRecord({self.location}, {self.st}, {self.usn})>"
+
+
+def parse_ssdp(data: bytes, address: str | None = None, sony_only: bool = False) -> SSDPRecord | None:
+    """
+    Parse an SSDP datagram.
+
+    :param data: received datagram, with CRLF or bare LF line endings
+    :param address: address the datagram was received from
+    :param sony_only: reject the messages of other devices, checked before the other headers are decoded
+    :return: the record of a search response or NOTIFY announcement, None for any other message.
+    """
+    lines = data.splitlines()
+    if not lines:
+        return None
+    start = lines[0]
+    if start.startswith(_RESPONSE):
+        record = SSDPRecord(False, address)
+    elif start == _NOTIFY:
+        record = SSDPRecord(True, address)
+    else:
+        return None
+
+    values = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(b":")
+        if sep:
+            attribute = _HEADERS.get(name.strip().upper())
+            if attribute:
+                values[attribute] = value.strip()
+    if sony_only and not _is_sony(values):
+        return None
+    for attribute, value in values.items():
+        setattr(record, attribute, value.decode("latin-1"))
+    return record
+
+
+def _is_sony(values: dict[str, bytes]) -> bool:
+    if _SONY_SERVER in values.get("server", b"").lower():
+        return True
+    usn = values.get("usn", b"")
+    return _SONY_USN in usn or _SONY_SCHEMA in usn or _SONY_SCHEMA in values.get("st", b"")
 
 
 class SSDPDiscovery():
     # pylint: disable=too-few-public-methods
     """Discover devices via the ssdp protocol."""
 
-    @staticmethod
-    def _parse_response(data):
-        responses = {}
-        lines = ""
-        http_ok = "HTTP/1.1 200 OK"
-        for line in data.split('\r\n'):
-            if http_ok in line and lines:
-                response = SSDPResponse(lines)
-                responses[response.location] = response
-                lines = ""
-            elif http_ok not in line:
-                line_content = line.split(":")
-                if len(line_content) >= 2 and line_content[1]:
-                    lines += line + '\r\n'
-        return list(responses.values())
-
     @staticmethod
     def discover(service="ssdp:all", timeout=1, retries=5, mx=3):
         # pylint: disable=invalid-name
@@ -68,6 +143,7 @@ class SSDPDiscovery():
             'MAN: "ssdp:discover"',
             'ST: {st}', 'MX: {mx}', '', ''])
         # using a dict to prevent duplicated entries.
+        responses = {}
         for _ in range(0, retries):
             sock = socket.socket(
                 socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
@@ -81,11 +157,14 @@ class SSDPDiscovery():
                 sock.sendto(str.encode(message.format(
                     *host, st=service, mx=mx)), host)
 
-            data = ""
             while True:
                 try:
-                    data = data + bytes.decode(sock.recv(1024))
+                    data, address = sock.recvfrom(4096)
                 except socket.timeout:
                     break
+                record = parse_ssdp(data, address[0])
+                if record is not None and not record.notify:
+                    responses[record.location] = record
+            sock.close()
 
-            return SSDPDiscovery._parse_response(data)
+        return list(responses.values())
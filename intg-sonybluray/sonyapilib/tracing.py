@@ -0,0 +1,168 @@
+"""Lightweight tracing of the commands sent to the Sony devices."""
+import time
+from collections import deque
+from contextvars import ContextVar
+
+import aiohttp
+
+STAGE_DISPATCH = "dispatch"
+# time spent by an acknowledged command in the queue of the device
+STAGE_QUEUE = "queue"
+# wait of a key of a stream for its slot, see pacing
+STAGE_PACING = "pacing"
+STAGE_RECONNECT = "reconnect"
+STAGE_CONNECT = "connect"
+STAGE_REQUEST = "request"
+STAGE_RESPONSE = "response"
+
+TRACE_BUFFER_SIZE = 50
+
+_current_trace: ContextVar["CommandTrace | None"] = ContextVar("sony_command_trace", default=None)
+
+
+class CommandTrace:
+    """Timeline of one command, from the entity command handler to the device acknowledgement."""
+
+    __slots__ = ("command", "start", "end", "status", "spans")
+
+    def __init__(self, command: str):
+        """Start a trace of the given command."""
+        self.command = command
+        self.start = time.monotonic()
+        self.end: float | None = None
+        self.status = None
+        # list of [stage, start, end] with monotonic timestamps
+        self.spans: list[list] = []
+
+    def add_span(self, stage: str, start: float, end: float | None) -> list:
+        """Record a stage between the given monotonic times, the end is None while the stage is running."""
+        entry = [stage, start, end]
+        self.spans.append(entry)
+        return entry
+
+    def to_dict(self) -> dict:
+        """Return the trace with timestamps relative to the start of the command, in milliseconds."""
+        return {
+            "command": self.command,
+            "status": None if self.status is None else str(self.status),
+            "duration_ms": None if self.end is None else round((self.end - self.start) * 1000, 3),
+            "spans": [
+                {
+                    "stage": stage,
+                    "start_ms": round((start - self.start) * 1000, 3),
+                    "duration_ms": None if end is None else round((end - start) * 1000, 3),
+                }
+                for stage, start, end in self.spans
+            ],
+        }
+
+
+class _TraceScope:
+    __slots__ = ("_tracer", "_trace", "_token")
+
+    def __init__(self, tracer: "DeviceTracer", command: str):
+        self._tracer = tracer
+        self._trace = CommandTrace(command)
+        self._token = None
+
+    def __enter__(self) -> CommandTrace:
+        self._tracer.traces.append(self._trace)
+        self._token = _current_trace.set(self._trace)
+        return self._trace
+
+    def __exit__(self, exc_type, exc, traceback):
+        self._trace.end = time.monotonic()
+        if exc is not None:
+            self._trace.status = repr(exc)
+        _current_trace.reset(self._token)
+
+
+class _ResumeScope:
+    __slots__ = ("_trace", "_token")
+
+    def __init__(self, trace: CommandTrace | None):
+        self._trace = trace
+        self._token = None
+
+    def __enter__(self) -> CommandTrace | None:
+        self._token = _current_trace.set(self._trace)
+        return self._trace
+
+    def __exit__(self, exc_type, exc, traceback):
+        _current_trace.reset(self._token)
+
+
+class _SpanScope:
+    __slots__ = ("_stage", "_span")
+
+    def __init__(self, stage: str):
+        self._stage = stage
+        self._span = None
+
+    def __enter__(self):
+        trace = _current_trace.get()
+        if trace is not None:
+            self._span = trace.add_span(self._stage, time.monotonic(), None)
+
+    def __exit__(self, exc_type, exc, traceback):
+        if self._span is not None:
+            self._span[2] = time.monotonic()
+
+
+class DeviceTracer:
+    """Bounded ring buffer of the latest command traces of one device."""
+
+    def __init__(self, size: int = TRACE_BUFFER_SIZE):
+        """Create the tracer keeping the given number of traces."""
+        self.traces: deque[CommandTrace] = deque(maxlen=size)
+
+    def trace(self, command: str) -> _TraceScope:
+        """Return a context manager tracing the given command in the current task."""
+        return _TraceScope(self, command)
+
+    def dump(self) -> list[dict]:
+        """Return the buffered traces, oldest first."""
+        return [trace.to_dict() for trace in self.traces]
+
+
+def current_trace() -> CommandTrace | None:
+    """Return the trace of the command being processed in the current task, if any."""
+    return _current_trace.get()
+
+
+def resume(trace: CommandTrace | None) -> _ResumeScope:
+    """Return a context manager recording the stages of the current task in the trace of a command started earlier."""
+    return _ResumeScope(trace)
+
+
+def span(stage: str) -> _SpanScope:
+    """Return a context manager recording a stage of the current command trace (no-op outside a trace)."""
+    return _SpanScope(stage)
+
+
+def mark(stage: str) -> None:
+    """Record a stage which lasted from the start of the current command trace until now."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_span(stage, trace.start, time.monotonic())
+
+
+async def _on_connection_create_start(_session, context, _params):
+    trace = _current_trace.get()
+    if trace is not None:
+        context.connect_start = time.monotonic()
+
+
+async def _on_connection_create_end(_session, context, _params):
+    trace = _current_trace.get()
+    start = getattr(context, "connect_start", None)
+    if trace is not None and start is not None:
+        trace.add_span(STAGE_CONNECT, start, time.monotonic())
+
+
+def create_aiohttp_trace_config() -> aiohttp.TraceConfig:
+    """Return an aiohttp trace configuration recording the TCP connections of the traced commands."""
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_connection_create_start.append(_on_connection_create_start)
+    trace_config.on_connection_create_end.append(_on_connection_create_end)
+    return trace_config
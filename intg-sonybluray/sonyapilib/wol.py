@@ -0,0 +1,74 @@
+"""Asynchronous Wake-on-LAN."""
+import asyncio
+import ipaddress
+import logging
+import socket
+import struct
+from typing import Iterable
+
+import ifaddr
+
+_LOGGER = logging.getLogger(__name__)
+
+WOL_PORT = 9
+# Number of magic packets sent to every address, and interval in seconds between them
+BURST_COUNT = 3
+BURST_INTERVAL = 0.1
+LIMITED_BROADCAST = "255.255.255.255"
+
+
+def create_magic_packet(mac_address: str) -> bytes:
+    """Create a magic packet to wake on LAN."""
+    addr_byte = mac_address.replace("-", ":").split(":")
+    hw_addr = struct.pack("BBBBBB", *[int(byte, 16) for byte in addr_byte])
+    return b"\xff" * 6 + hw_addr * 16
+
+
+def broadcast_addresses() -> list[str]:
+    """Return the directed broadcast address of every local IPv4 network, and the limited broadcast address."""
+    addresses = []
+    for adapter in ifaddr.get_adapters():
+        for ip in adapter.ips:
+            if not ip.is_IPv4 or ip.network_prefix >= 31:
+                continue
+            network = ipaddress.IPv4Network(f"{ip.ip}/{ip.network_prefix}", strict=False)
+            if network.is_loopback or network.is_link_local:
+                continue
+            address = str(network.broadcast_address)
+            if address not in addresses:
+                addresses.append(address)
+    addresses.append(LIMITED_BROADCAST)
+    return addresses
+
+
+class _WolProtocol(asyncio.DatagramProtocol):
+    def error_received(self, exc):
+        _LOGGER.debug("Wake on LAN packet not sent: %s", exc)
+
+
+async def send_magic_packet(mac_address: str, addresses: Iterable[str], count: int = BURST_COUNT,
+                            interval: float = BURST_INTERVAL, port: int = WOL_PORT) -> None:
+    """
+    Send a burst of magic packets to the given broadcast or unicast addresses, without blocking the event loop.
+
+    :param mac_address: mac address of the device to wake up
+    :param addresses: target addresses
+    :param count: number of packets sent to every address
+    :param interval: interval in seconds between two packets to the same address
+    :param port: target UDP port
+    """
+    packet = create_magic_packet(mac_address)
+    addresses = list(dict.fromkeys(addresses))
+    transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+        _WolProtocol, family=socket.AF_INET, allow_broadcast=True)
+    try:
+        for i in range(count):
+            if i:
+                await asyncio.sleep(interval)
+            for address in addresses:
+                try:
+                    transport.sendto(packet, (address, port))
+                except OSError as ex:
+                    _LOGGER.debug("Cannot send wake on LAN packet to %s: %s", address, ex)
+    finally:
+        transport.close()
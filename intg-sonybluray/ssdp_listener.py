@@ -0,0 +1,68 @@
+"""
+Passive listener of the SSDP announcements of the devices.
+
+The players multicast ``ssdp:alive`` NOTIFY messages when their network stack comes up and ``ssdp:byebye`` when it
+goes down. Listening to them gives presence hints and the current address of the devices without any polling.
+
+:copyright: (c) 2024 by Unfolded Circle ApS.
+:license: Mozilla Public License Version 2.0, see LICENSE for more details.
+"""
+
+import asyncio
+import logging
+import socket
+import struct
+from typing import Callable
+
+from discover import SSDP_ADDR, SSDP_PORT
+from sonyapilib.ssdp import NTS_ALIVE, NTS_BYEBYE, SSDPRecord, parse_ssdp
+
+_LOG = logging.getLogger(__name__)
+
+
+class SSDPListener(asyncio.DatagramProtocol):
+    """Receive the SSDP NOTIFY announcements on the multicast group."""
+
+    def __init__(self, on_notification: Callable[[SSDPRecord], None]):
+        """
+        Create the listener.
+
+        :param on_notification: called with every alive or byebye announcement of a Sony device
+        """
+        self._on_notification = on_notification
+        self._transport: asyncio.DatagramTransport | None = None
+
+    async def start(self) -> bool:
+        """
+        Join the SSDP multicast group.
+
+        :return: False if the SSDP port can't be bound, e.g. if it is used without address reuse by another process.
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if hasattr(socket, "SO_REUSEPORT"):
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind(("", SSDP_PORT))
+            membership = struct.pack("4s4s", socket.inet_aton(SSDP_ADDR), socket.inet_aton("0.0.0.0"))
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+            sock.setblocking(False)
+        except OSError as ex:
+            _LOG.warning("Cannot listen to SSDP announcements: %s", ex)
+            sock.close()
+            return False
+        self._transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(lambda: self, sock=sock)
+        _LOG.debug("Listening to SSDP announcements")
+        return True
+
+    def stop(self) -> None:
+        """Leave the multicast group."""
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+
+    def datagram_received(self, data: bytes, addr: tuple[str, int]) -> None:
+        """Handle an SSDP message, only the NOTIFY announcements are considered."""
+        record = parse_ssdp(data, addr[0], sony_only=True)
+        if record is not None and record.notify and record.nts in (NTS_ALIVE, NTS_BYEBYE):
+            self._on_notification(record)
@@ -0,0 +1,76 @@
+"""
+Registry of the background tasks of a device.
+
+:copyright: (c) 2024 by Unfolded Circle ApS.
+:license: Mozilla Public License Version 2.0, see LICENSE for more details.
+"""
+
+import asyncio
+import contextvars
+import logging
+from collections import Counter
+from typing import Coroutine
+
+_LOG = logging.getLogger(__name__)
+
+# Maximum number of outstanding background tasks of one device
+MAX_TASKS = 32
+
+
+class TaskLimitError(RuntimeError):
+    """Raised when a device has too many outstanding background tasks."""
+
+
+class DeviceTasks:
+    """Own the background tasks of one device: track, name, cap and cancel them."""
+
+    def __init__(self, owner: str, loop: asyncio.AbstractEventLoop, limit: int = MAX_TASKS):
+        """
+        Create the registry.
+
+        :param owner: device identifier, used as prefix of the task names
+        :param loop: event loop running the tasks
+        :param limit: maximum number of outstanding tasks
+        """
+        self._owner = owner
+        self._loop = loop
+        self._limit = limit
+        self._tasks: set[asyncio.Task] = set()
+
+    def spawn(self, coro: Coroutine, name: str) -> asyncio.Task:
+        """
+        Start a background task, detached from the context (and command trace) of the caller.
+
+        :param coro: coroutine to run
+        :param name: name of the task, without the device prefix
+        :raises TaskLimitError: if the device has too many outstanding tasks, the coroutine is closed
+        """
+        if len(self._tasks) >= self._limit:
+            coro.close()
+            _LOG.warning("[%s] Too many background tasks, %s not started: %s", self._owner, name, self.counts())
+            raise TaskLimitError(f"Too many background tasks for {self._owner}")
+        task = self._loop.create_task(coro, name=f"{self._owner}:{name}", context=contextvars.Context())
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+        return task
+
+    def _task_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            _LOG.debug("[%s] Task %s failed: %r", self._owner, task.get_name(), task.exception())
+
+    def cancel_all(self) -> None:
+        """Cancel all the outstanding tasks, except the calling task."""
+        current = asyncio.current_task()
+        for task in list(self._tasks):
+            if task is not current:
+                task.cancel()
+
+    def __len__(self) -> int:
+        """Return the number of outstanding tasks."""
+        return len(self._tasks)
+
+    def counts(self) -> dict[str, int]:
+        """Return the number of outstanding tasks by name."""
+        prefix = len(self._owner) + 1
+        return dict(Counter(task.get_name()[prefix:] for task in self._tasks))
@@ -0,0 +1,14 @@
+"""
+Test configuration: the driver modules are imported from the integration directory, as when the driver runs, and
+the Sony player emulator from the tools directory.
+
+:copyright: (c) 2024 by Unfolded Circle ApS.
+:license: Mozilla Public License Version 2.0, see LICENSE for more details.
+"""
+
+import os
+import sys
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(_ROOT, "intg-sonybluray"))
+sys.path.insert(0, os.path.join(_ROOT, "tools"))
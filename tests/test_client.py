@@ -0,0 +1,238 @@
+"""
+Tests of the device client against the Sony player emulator.
+
+:copyright: (c) 2024 by Unfolded Circle ApS.
+:license: Mozilla Public License Version 2.0, see LICENSE for more details.
+"""
+
+import asyncio
+import time
+
+import client
+import rediscovery
+import ucapi
+from client import ConnectionState, Events, SonyBlurayDevice
+from config import DeviceInstance, normalize_mac
+from sony_emulator import SonyPlayerEmulator
+from tasks import MAX_TASKS
+from ucapi.media_player import States
+
+
+def _device(player, address=None, **kwargs) -> SonyBlurayDevice:
+    return SonyBlurayDevice(DeviceInstance(id=player.mac, name="Player", address=address or player.host,
+                                           pin_code="0000", client_name="Remote", mac_address=player.mac, **kwargs))
+
+
+async def _wait_for(condition, timeout=5):
+    async with asyncio.timeout(timeout):
+        while not condition():
+            await asyncio.sleep(0.02)
+
+
+def _count_calls(device: SonyBlurayDevice, name: str) -> list:
+    """Count the calls of a method of the device."""
+    calls = []
+    method = getattr(device, name)
+
+    async def counted(*args, **kwargs):
+        calls.append(args)
+        return await method(*args, **kwargs)
+
+    setattr(device, name, counted)
+    return calls
+
+
+def test_concurrent_connects_share_one_bootstrap():
+    async def main():
+        async with SonyPlayerEmulator(1, 4, 0.05) as emulator:
+            device = _device(emulator.players[0])
+            bootstraps = _count_calls(device, "_bootstrap")
+            await asyncio.gather(*(device.connect() for _ in range(5)))
+            assert device.connection_state == ConnectionState.READY
+            # the device is ready: no new connection
+            await device.connect()
+            await device.disconnect()
+            return len(bootstraps)
+
+    assert asyncio.run(main()) == 1
+
+
+def test_concurrent_updates_trigger_one_follow_up_refresh():
+    async def main():
+        async with SonyPlayerEmulator(1, 4, 0.05) as emulator:
+            device = _device(emulator.players[0])
+            await device.connect()
+            refreshes = _count_calls(device, "_refresh")
+            # calls before the refresh starts are served by it
+            await asyncio.gather(*(device.update() for _ in range(5)))
+            assert len(refreshes) == 1
+            # calls during the refresh are served by one more refresh
+            first = asyncio.create_task(device.update())
+            await _wait_for(lambda: len(refreshes) == 2)
+            await asyncio.gather(first, *(device.update() for _ in range(4)))
+            state = device.state
+            await device.disconnect()
+            return len(refreshes), state
+
+    assert asyncio.run(main()) == (3, States.ON)
+
+
+def test_prediction_confirmed():
+    async def main():
+        async with SonyPlayerEmulator(1, 4) as emulator:
+            device = _device(emulator.players[0])
+            await device.connect()
+            await device.update()
+            assert await device.play() == ucapi.StatusCodes.OK
+            # shown before the device is polled
+            assert device.state == States.PLAYING
+            await _wait_for(lambda: device._prediction is None)
+            state = device.state
+            await device.disconnect()
+            return state
+
+    assert asyncio.run(main()) == States.PLAYING
+
+
+def test_prediction_rolled_back(monkeypatch):
+    monkeypatch.setattr(client, "TRANSPORT_CONVERGENCE_TIMEOUT", 0.5)
+
+    async def main():
+        async with SonyPlayerEmulator(1, 4) as emulator:
+            player = emulator.players[0]
+            device = _device(player)
+            await device.connect()
+            await device.update()
+            assert await device.play() == ucapi.StatusCodes.OK
+            # the playback doesn't start
+            player.set_transport_state("STOPPED")
+            assert device.state == States.PLAYING
+            await _wait_for(lambda: device._prediction is None)
+            state = device.state
+            await device.disconnect()
+            return state
+
+    assert asyncio.run(main()) == States.ON
+
+
+def test_command_sent_once_when_task_limit_reached():
+    async def main():
+        async with SonyPlayerEmulator(1, 3) as emulator:
+            player = emulator.players[0]
+            device = _device(player)
+            await device.connect()
+            player.set_transport_state("PLAYING")
+            while len(device.tasks) < MAX_TASKS:
+                device.tasks.spawn(asyncio.sleep(30), "filler")
+            player.keys.clear()
+            # the state watcher cannot start, the command is not sent again
+            status = await device.pause()
+            keys = list(player.keys)
+            await device.disconnect()
+            return status, keys
+
+    assert asyncio.run(main()) == (ucapi.StatusCodes.OK, ["Pause"])
+
+
+def test_probe_cache_invalidated_by_command():
+    async def main():
+        async with SonyPlayerEmulator(1, 4, 0.05) as emulator:
+            player = emulator.players[0]
+            device = _device(player)
+            await device.connect()
+            sony_device = device._sony_device
+            requests = []
+            start = player.requests
+            await asyncio.gather(*(sony_device.get_power_status() for _ in range(10)))
+            requests.append(player.requests - start)
+            start = player.requests
+            await sony_device.get_power_status()
+            requests.append(player.requests - start)
+            start = player.requests
+            await device.send_key("Up")
+            await sony_device.get_power_status()
+            requests.append(player.requests - start)
+            await device.disconnect()
+            return requests
+
+    # shared request, cached result, key and new probe
+    assert asyncio.run(main()) == [1, 0, 2]
+
+
+def test_queued_keys():
+    async def main():
+        async with SonyPlayerEmulator(1, 4, 0.1) as emulator:
+            player = emulator.players[0]
+            device = _device(player, queue_commands=True)
+            failed = []
+            device.events.on(Events.COMMAND_FAILED, lambda *args: failed.append(args))
+            await device.connect()
+            player.keys.clear()
+            start = time.monotonic()
+            statuses = [await device.send_key(key) for key in ("Up", "Down", "Left", "Right")]
+            # acknowledged before the device answers the first key
+            assert time.monotonic() - start < player.latency
+            requests = player.requests
+            assert await device.send_key("Bogus") == ucapi.StatusCodes.BAD_REQUEST
+            await _wait_for(lambda: len(player.keys) == 4)
+            keys = list(player.keys)
+            await device.disconnect()
+            return statuses, keys, player.requests - requests, failed
+
+    statuses, keys, requests, failed = asyncio.run(main())
+    assert statuses == [ucapi.StatusCodes.OK] * 4
+    assert keys == ["Up", "Down", "Left", "Right"]
+    # the unknown key was not sent
+    assert requests == 4
+    assert not failed
+
+
+def test_standby_resume_without_bootstrap():
+    async def main():
+        async with SonyPlayerEmulator(1, 4) as emulator:
+            player = emulator.players[0]
+            device = _device(player)
+            await device.connect()
+            await device.enter_standby()
+            assert device.connection_state == ConnectionState.DISCONNECTED
+            start = player.requests
+            await device.connect()
+            requests = player.requests - start
+            state = device.connection_state
+            player.keys.clear()
+            status = await device.send_key("Up")
+            keys = list(player.keys)
+            await device.disconnect()
+            return requests, state, status, keys
+
+    assert asyncio.run(main()) == (0, ConnectionState.READY, ucapi.StatusCodes.OK, ["Up"])
+
+
+def test_rediscovery(monkeypatch):
+    async def main():
+        async with SonyPlayerEmulator(1, 4) as emulator:
+            player = emulator.players[0]
+            # nothing listens on the configured address anymore
+            device = _device(player, address="127.0.1.200")
+            monkeypatch.setattr(rediscovery, "read_neighbors", lambda: {player.host: normalize_mac(player.mac)})
+            found = asyncio.Event()
+
+            async def on_address_found(device_id, address):
+                assert device_id == device.id
+                device._device_config.address = address
+                device.set_address(address)
+                await device.update()
+                found.set()
+
+            service = rediscovery.Rediscovery(on_address_found)
+            device.events.on(Events.UNREACHABLE,
+                             lambda device_id: service.request(device._device_config, device.tasks.spawn))
+            await device.connect()
+            assert device.connection_state == ConnectionState.DEGRADED
+            async with asyncio.timeout(5):
+                await found.wait()
+            result = device._device_config.address, device.connection_state, device.state
+            await device.disconnect()
+            return result
+
+    assert asyncio.run(main()) == ("127.0.1.1", ConnectionState.READY, States.ON)
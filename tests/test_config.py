@@ -0,0 +1,108 @@
+"""
+Tests of the device configuration indexes and persistence.
+
+:copyright: (c) 2024 by Unfolded Circle ApS.
+:license: Mozilla Public License Version 2.0, see LICENSE for more details.
+"""
+
+import asyncio
+import os
+
+import config
+import pytest
+from config import DeviceInstance, normalize_mac
+
+
+def _device(device_id="dev1", address="192.168.1.20", mac_address="AA-BB-CC-DD-EE-01"):
+    return DeviceInstance(id=device_id, name="Player", address=address, pin_code=None, client_name="Remote",
+                          mac_address=mac_address)
+
+
+@pytest.fixture(name="devices")
+def devices_fixture(tmp_path):
+    added, removed = [], []
+    devices = config.Devices(str(tmp_path), added.append, removed.append)
+    devices.added, devices.removed = added, removed
+    return devices
+
+
+def test_normalize_mac():
+    assert normalize_mac(" AA-BB-CC-DD-EE-01 ") == "aa:bb:cc:dd:ee:01"
+    assert normalize_mac("aa:bb:cc:dd:ee:01") == "aa:bb:cc:dd:ee:01"
+    assert normalize_mac("") is None
+    assert normalize_mac(None) is None
+
+
+def test_lookups(devices):
+    devices.add(_device())
+    assert devices.contains("dev1")
+    assert devices.get("dev1").address == "192.168.1.20"
+    assert devices.get_by_id_or_address("", "192.168.1.20").id == "dev1"
+    assert devices.get_by_id_or_address("dev1", "").id == "dev1"
+    assert devices.get_by_mac("aa:bb:cc:dd:ee:01").id == "dev1"
+    assert devices.get("other") is None
+    assert devices.get_by_mac("aa:bb:cc:dd:ee:02") is None
+    assert [item.id for item in devices.added] == ["dev1"]
+
+
+def test_lookups_return_copies(devices):
+    devices.add(_device())
+    devices.get("dev1").address = "10.0.0.1"
+    assert devices.get("dev1").address == "192.168.1.20"
+
+
+def test_add_replaces_device_at_same_address(devices):
+    devices.add(_device())
+    devices.add(_device(device_id="dev2", mac_address="AA-BB-CC-DD-EE-02"))
+    assert [item.id for item in devices.all()] == ["dev2"]
+    assert devices.get("dev1") is None
+    assert devices.get_by_mac("aa:bb:cc:dd:ee:01") is None
+
+
+def test_update_reindexes(devices):
+    devices.add(_device())
+    devices.update(_device(address="192.168.1.21"))
+    assert devices.get_by_id_or_address("", "192.168.1.20") is None
+    assert devices.get_by_id_or_address("", "192.168.1.21").id == "dev1"
+    assert not devices.update(_device(device_id="unknown"))
+
+
+def test_remove(devices):
+    devices.add(_device())
+    assert devices.remove("dev1")
+    assert not devices.contains("dev1")
+    assert devices.get_by_mac("aa:bb:cc:dd:ee:01") is None
+    assert not devices.remove("dev1")
+    assert [item.id for item in devices.removed] == ["dev1"]
+
+
+def test_store_and_load(devices, tmp_path):
+    device = _device()
+    device.queue_commands = True
+    devices.add(device)
+    assert devices.store()
+    loaded = config.Devices(str(tmp_path), None, None)
+    assert loaded.get("dev1") == device
+    assert loaded.get_by_mac("aa:bb:cc:dd:ee:01").id == "dev1"
+
+
+def test_clear_discards_pending_write(devices, tmp_path):
+    devices.add(_device())
+    data = devices._serialize()  # pylint: disable=protected-access
+    generation = devices._generation  # pylint: disable=protected-access
+    devices.clear()
+    assert not devices._write(data, generation)  # pylint: disable=protected-access
+    assert not os.path.exists(tmp_path / "config.json")
+    assert devices.removed == [None]
+
+
+def test_flush_writes_debounced_changes(devices, tmp_path):
+    async def change_and_flush():
+        devices.add(_device())
+        assert devices.store()
+        # the write is debounced
+        assert not os.path.exists(tmp_path / "config.json")
+        return await devices.flush()
+
+    assert asyncio.run(change_and_flush())
+    assert config.Devices(str(tmp_path), None, None).contains("dev1")
@@ -0,0 +1,57 @@
+"""
+Tests of the deadline budget of the operations.
+
+:copyright: (c) 2024 by Unfolded Circle ApS.
+:license: Mozilla Public License Version 2.0, see LICENSE for more details.
+"""
+
+import asyncio
+import time
+
+import pytest
+from sonyapilib import deadline
+
+
+def test_no_budget():
+    assert deadline.remaining() is None
+    assert deadline.remaining(3) == 3
+
+
+def test_budget_limits_remaining():
+    with deadline.budget(10):
+        assert 9 < deadline.remaining() <= 10
+        assert deadline.remaining(2) == 2
+    assert deadline.remaining() is None
+
+
+def test_nested_budget_never_extends_the_deadline():
+    with deadline.budget(1):
+        with deadline.budget(60):
+            assert deadline.remaining() <= 1
+        with deadline.budget(0.5):
+            assert deadline.remaining() <= 0.5
+        assert 0.5 < deadline.remaining() <= 1
+
+
+def test_budget_exceeded():
+    with deadline.budget(0.01):
+        time.sleep(0.02)
+        with pytest.raises(deadline.DeadlineExceeded):
+            deadline.remaining()
+    # the exception is a timeout for the callers which don't know about budgets
+    assert issubclass(deadline.DeadlineExceeded, asyncio.TimeoutError)
+
+
+def test_budget_is_task_local():
+    async def other_task():
+        return deadline.remaining()
+
+    async def main():
+        with deadline.budget(5):
+            # a task started inside the budget inherits it, a task started outside doesn't
+            inherited = await asyncio.create_task(other_task())
+        return inherited, await asyncio.create_task(other_task())
+
+    inherited, outside = asyncio.run(main())
+    assert inherited <= 5
+    assert outside is None
@@ -0,0 +1,43 @@
+"""
+Tests of the persistence of the last known device states.
+
+:copyright: (c) 2024 by Unfolded Circle ApS.
+:license: Mozilla Public License Version 2.0, see LICENSE for more details.
+"""
+
+import asyncio
+
+from device_state import DeviceStateStore
+
+
+def test_save_is_debounced_until_flush(tmp_path):
+    store = DeviceStateStore(str(tmp_path))
+
+    async def save_and_flush():
+        store.save("dev1", {"state": "ON"})
+        store.save("dev1", {"state": "PLAYING"})
+        store.save("dev2", {"state": "OFF"})
+        assert store.load("dev1") is None
+        await store.flush()
+
+    asyncio.run(save_and_flush())
+    assert store.load("dev1") == {"state": "PLAYING"}
+    assert store.load("dev2") == {"state": "OFF"}
+
+
+def test_remove(tmp_path):
+    store = DeviceStateStore(str(tmp_path))
+
+    async def save_and_flush():
+        store.save("dev1", {"state": "ON"})
+        await store.flush()
+
+    asyncio.run(save_and_flush())
+    store.remove("dev1")
+    assert store.load("dev1") is None
+
+
+def test_invalid_file(tmp_path):
+    (tmp_path / "state").mkdir()
+    (tmp_path / "state" / "dev1.json").write_text("{", encoding="utf-8")
+    assert DeviceStateStore(str(tmp_path)).load("dev1") is None
@@ -0,0 +1,106 @@
+"""
+Tests of the adaptive pacing of the key streams.
+
+:copyright: (c) 2024 by Unfolded Circle ApS.
+:license: Mozilla Public License Version 2.0, see LICENSE for more details.
+"""
+
+import asyncio
+
+import pytest
+from sonyapilib import pacing
+from sonyapilib.pacing import INCREASE_FACTOR, MAX_INTERVAL, MIN_INTERVAL, KeyPacer
+
+
+def test_interval_learned_from_first_latency():
+    pacer = KeyPacer()
+    assert pacer.interval is None
+    pacer.observe(0.2)
+    assert pacer.interval == 0.2
+    assert pacer.latency == 0.2
+
+
+@pytest.mark.parametrize("latency, interval", [(0.001, MIN_INTERVAL), (5, MAX_INTERVAL)])
+def test_first_interval_bounded(latency, interval):
+    pacer = KeyPacer()
+    pacer.observe(latency)
+    assert pacer.interval == interval
+
+
+def test_restored_interval_bounded():
+    assert KeyPacer(0.3).interval == 0.3
+    assert KeyPacer(0).interval == MIN_INTERVAL
+    assert KeyPacer(10).interval == MAX_INTERVAL
+
+
+def test_additive_decrease_down_to_latency():
+    pacer = KeyPacer(0.3)
+    pacer.observe(0.1)
+    assert pacer.interval == pytest.approx(0.29)
+    for _ in range(50):
+        pacer.observe(0.1)
+    assert pacer.interval == pytest.approx(0.1)
+
+
+def test_no_increase_on_jitter_of_fast_responses():
+    pacer = KeyPacer()
+    pacer.observe(0.002)
+    pacer.observe(0.006)
+    assert pacer.interval == MIN_INTERVAL
+
+
+def test_multiplicative_increase_on_slow_response():
+    pacer = KeyPacer(0.1)
+    pacer.observe(0.1)
+    interval = pacer.interval
+    pacer.observe(0.5)
+    assert pacer.interval == pytest.approx(interval * INCREASE_FACTOR)
+
+
+def test_multiplicative_increase_on_failure():
+    pacer = KeyPacer(0.8)
+    pacer.observe(0.1, failed=True)
+    assert pacer.interval == MAX_INTERVAL
+    # a failure doesn't update the average latency
+    assert pacer.latency is None
+
+
+def test_interval_not_learned_from_failure():
+    pacer = KeyPacer()
+    pacer.observe(5, failed=True)
+    assert pacer.interval is None
+    pacer.observe(0.2)
+    assert pacer.interval == pytest.approx(0.2)
+
+
+def test_wait():
+    async def main():
+        pacer = KeyPacer(0.05)
+        first = await pacer.wait()
+        second = await pacer.wait()
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert first == 0
+    assert second == pytest.approx(0.05, abs=0.01)
+
+
+def test_concurrent_waits_get_consecutive_slots():
+    async def main():
+        pacer = KeyPacer(0.05)
+        return await asyncio.gather(*(pacer.wait() for _ in range(3)))
+
+    waits = sorted(asyncio.run(main()))
+    assert waits[0] == 0
+    assert waits[1] == pytest.approx(0.05, abs=0.01)
+    assert waits[2] == pytest.approx(0.10, abs=0.01)
+
+
+def test_stream_scope():
+    assert not pacing.in_stream()
+    with pacing.stream():
+        assert pacing.in_stream()
+        with pacing.stream(False):
+            assert not pacing.in_stream()
+        assert pacing.in_stream()
+    assert not pacing.in_stream()
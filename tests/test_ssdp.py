@@ -0,0 +1,104 @@
+"""
+Tests of the SSDP message parser.
+
+:copyright: (c) 2024 by Unfolded Circle ApS.
+:license: Mozilla Public License Version 2.0, see LICENSE for more details.
+"""
+
+import pytest
+from sonyapilib.ssdp import NTS_BYEBYE, parse_ssdp
+
+SONY_RESPONSE = (
+    "HTTP/1.1 200 OK\r\n"
+    "CACHE-CONTROL: max-age=1800\r\n"
+    "LOCATION: http://192.168.1.20:52323/dmr.xml\r\n"
+    "SERVER: Linux/2.6 UPnP/1.0 SonyBDP/2.0\r\n"
+    "ST: urn:schemas-sony-com:service:IRCC:1\r\n"
+    "USN: uuid:00000000-0000-1010-8000-0123456789ab::urn:schemas-sony-com:service:IRCC:1\r\n"
+    "\r\n"
+)
+
+OTHER_NOTIFY = (
+    "NOTIFY * HTTP/1.1\r\n"
+    "HOST: 239.255.255.250:1900\r\n"
+    "LOCATION: http://192.168.1.30:8080/description.xml\r\n"
+    "NT: upnp:rootdevice\r\n"
+    "NTS: ssdp:alive\r\n"
+    "SERVER: Linux UPnP/1.0 Router/1.0\r\n"
+    "USN: uuid:4d696e69-444c-164e-9d41-b827eb123456::upnp:rootdevice\r\n"
+    "\r\n"
+)
+
+
+def test_search_response():
+    record = parse_ssdp(SONY_RESPONSE.encode(), "192.168.1.20")
+    assert not record.notify
+    assert record.location == "http://192.168.1.20:52323/dmr.xml"
+    assert record.st == "urn:schemas-sony-com:service:IRCC:1"
+    assert record.uuid == "uuid:00000000-0000-1010-8000-0123456789ab"
+    assert record.host == "192.168.1.20"
+    assert record.max_age == 1800
+    assert record.alive
+
+
+def test_notify():
+    record = parse_ssdp(OTHER_NOTIFY.encode(), "192.168.1.30")
+    assert record.notify
+    assert record.st == "upnp:rootdevice"
+    assert record.nts == "ssdp:alive"
+    assert record.alive
+
+
+def test_byebye():
+    data = OTHER_NOTIFY.replace("ssdp:alive", NTS_BYEBYE).encode()
+    assert not parse_ssdp(data).alive
+
+
+@pytest.mark.parametrize("separator", ["\r\n", "\n"])
+def test_line_endings(separator):
+    record = parse_ssdp(SONY_RESPONSE.replace("\r\n", separator).encode())
+    assert record.location == "http://192.168.1.20:52323/dmr.xml"
+    assert record.usn.endswith("::urn:schemas-sony-com:service:IRCC:1")
+
+
+def test_header_names_case_and_spaces():
+    record = parse_ssdp(b"HTTP/1.1 200 OK\r\nlocation:http://10.0.0.2/dmr.xml\r\nUsn :  uuid:abc \r\n\r\n")
+    assert record.location == "http://10.0.0.2/dmr.xml"
+    assert record.usn == "uuid:abc"
+
+
+@pytest.mark.parametrize("data", [b"", b"M-SEARCH * HTTP/1.1\r\nST: ssdp:all\r\n\r\n", b"garbage"])
+def test_other_messages(data):
+    assert parse_ssdp(data) is None
+
+
+def test_sony_only():
+    assert parse_ssdp(SONY_RESPONSE.encode(), sony_only=True) is not None
+    assert parse_ssdp(OTHER_NOTIFY.encode(), sony_only=True) is None
+    assert parse_ssdp(OTHER_NOTIFY.encode(), sony_only=False) is not None
+
+
+@pytest.mark.parametrize("header", [
+    "SERVER: FedoraCore/2 UPnP/1.0 SONY/1.0",
+    "USN: uuid:00000000-0000-1010-8000-0123456789ab::upnp:rootdevice",
+    "ST: urn:schemas-sony-com:service:ScalarWebAPI:1",
+])
+def test_sony_identification(header):
+    data = f"HTTP/1.1 200 OK\r\nLOCATION: http://10.0.0.2/dmr.xml\r\n{header}\r\n\r\n".encode()
+    assert parse_ssdp(data, sony_only=True) is not None
+
+
+def test_missing_headers():
+    record = parse_ssdp(b"NOTIFY * HTTP/1.1\r\nHOST: 239.255.255.250:1900\r\n\r\n", "10.0.0.5")
+    assert record.location is None
+    assert record.usn is None
+    assert record.uuid is None
+    assert record.max_age is None
+    assert record.alive
+    # without a description location, the announcement is attributed to its sender
+    assert record.host == "10.0.0.5"
+
+
+def test_invalid_max_age():
+    record = parse_ssdp(b"HTTP/1.1 200 OK\r\nCACHE-CONTROL: no-cache\r\n\r\n")
+    assert record.max_age is None
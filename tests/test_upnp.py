@@ -0,0 +1,38 @@
+"""
+Tests of the parsing of the UPnP values returned by the players.
+
+:copyright: (c) 2024 by Unfolded Circle ApS.
+:license: Mozilla Public License Version 2.0, see LICENSE for more details.
+"""
+
+import xml.etree.ElementTree
+
+import pytest
+from sonyapilib.device import parse_duration
+
+
+def _element(text):
+    element = xml.etree.ElementTree.Element("RelTime")
+    element.text = text
+    return element
+
+
+@pytest.mark.parametrize("text, seconds", [
+    ("0:00:00", 0),
+    ("0:01:05", 65),
+    ("1:30:00", 5400),
+    ("12:00:01", 43201),
+    ("0:00:07.500", 7),
+    (" 0:00:10 ", 10),
+])
+def test_parse_duration(text, seconds):
+    assert parse_duration(_element(text)) == seconds
+
+
+@pytest.mark.parametrize("text", [None, "", "NOT_IMPLEMENTED", "1:30", "a:b:c"])
+def test_parse_duration_unknown(text):
+    assert parse_duration(_element(text)) is None
+
+
+def test_parse_duration_missing_element():
+    assert parse_duration(None) is None
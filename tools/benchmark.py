@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the driver hot paths against the local Sony player emulator.
+
+Measured for each device count:
+
+- end to end latency of ``SonyBlurayDevice.send_key``, for single key presses and for a key stream (e.g. a repeated
+  command) paced by the device, with the pacing waits reported separately
+- ``SonyDevice.init_device`` bootstrap time for v3 and v4 devices
+- cost of one ``SonyBlurayDevice.update`` tick, with the probe cache disabled, and right after another tick when the
+  probe results are cached
+- discovery time of ``discover.async_identify_sonybluray_devices``
+- memory allocated per configured device
+
+Results are printed (or written with ``--output``) as JSON.
+
+:copyright: (c) 2024 by Unfolded Circle ApS.
+:license: Mozilla Public License Version 2.0, see LICENSE for more details.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "intg-sonybluray"))
+
+# pylint: disable=wrong-import-position
+import discover  # noqa: E402
+from client import SonyBlurayDevice  # noqa: E402
+from config import DeviceInstance  # noqa: E402
+from sony_emulator import IRCC_PORT, SonyPlayerEmulator  # noqa: E402
+from sonyapilib import pacing, tracing  # noqa: E402
+from sonyapilib.device import PROBE_CACHE_TTL, SonyDevice  # noqa: E402
+
+_ERRORS: list[BaseException] = []
+
+
+def _percentile(values: list[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(percent / 100 * len(values) + 0.5) - 1))
+    return values[index]
+
+
+def _summary(values: list[float]) -> dict[str, float]:
+    """Summarize durations given in seconds, in milliseconds."""
+    return {
+        "count": len(values),
+        "mean_ms": round(statistics.fmean(values) * 1000, 3) if values else 0.0,
+        "p50_ms": round(_percentile(values, 50) * 1000, 3),
+        "p99_ms": round(_percentile(values, 99) * 1000, 3),
+        "max_ms": round(max(values) * 1000, 3) if values else 0.0,
+    }
+
+
+def _device_config(player) -> DeviceInstance:
+    return DeviceInstance(id=player.mac, name=f"Emulated {player.index}", address=player.host, pin_code="0000",
+                          client_name="benchmark", mac_address=player.mac)
+
+
+async def _timed(coro) -> float:
+    """Return the duration of the given coroutine, errors are part of the measure (and counted in ``_ERRORS``)."""
+    start = time.perf_counter()
+    try:
+        await coro
+    except Exception:  # pylint: disable=broad-exception-caught
+        _ERRORS.append(sys.exc_info()[1])
+    return time.perf_counter() - start
+
+
+async def bench_bootstrap(count: int, api_version: int, latency: float) -> dict:
+    """Measure SonyDevice.init_device for every emulated player, concurrently."""
+    async with SonyPlayerEmulator(count, api_version, latency) as emulator:
+        devices = [SonyDevice(host=player.host, nickname="benchmark") for player in emulator.players]
+        for device in devices:
+            device.pin = "0000"
+        _ERRORS.clear()
+        durations = await asyncio.gather(*[_timed(device.init_device()) for device in devices])
+        await asyncio.gather(*[device.close() for device in devices])
+        return {**_summary(list(durations)), "errors": len(_ERRORS),
+                "error_types": sorted({type(error).__name__ for error in _ERRORS})}
+
+
+async def bench_devices(count: int, api_version: int, latency: float, keys: int) -> dict:
+    """Measure key press latency, update tick cost and memory of configured devices."""
+    async with SonyPlayerEmulator(count, api_version, latency) as emulator:
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        devices = [SonyBlurayDevice(_device_config(player)) for player in emulator.players]
+        await asyncio.gather(*[device.connect() for device in devices])
+        memory = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+
+        # pylint: disable=protected-access
+        # the ticks are closer than the probe cache TTL: it is disabled to measure the requests
+        for device in devices:
+            device._sony_device.probe_cache_ttl = 0
+        update_durations = []
+        for _ in range(3):
+            update_durations.extend(await asyncio.gather(*[_timed(device.update()) for device in devices]))
+        for device in devices:
+            device._sony_device.probe_cache_ttl = PROBE_CACHE_TTL
+        await asyncio.gather(*[device.update() for device in devices])
+        cached_update_durations = await asyncio.gather(*[_timed(device.update()) for device in devices])
+
+        async def press_keys(device: SonyBlurayDevice) -> list[float]:
+            durations = []
+            for i in range(keys):
+                durations.append(await _timed(device.send_key("Up" if i % 2 else "Down")))
+            return durations
+
+        key_durations = [duration for result in await asyncio.gather(*[press_keys(device) for device in devices])
+                         for duration in result]
+
+        async def stream_keys(device: SonyBlurayDevice) -> tuple[list[float], list[float]]:
+            durations = []
+            waits = []
+            with pacing.stream():
+                for i in range(keys):
+                    with device.tracer.trace("stream") as trace:
+                        durations.append(await _timed(device.send_key("Up" if i % 2 else "Down")))
+                    waits.append(sum(end - start for stage, start, end in trace.spans
+                                     if stage == tracing.STAGE_PACING and end is not None))
+            return durations, waits
+
+        stream_results = await asyncio.gather(*[stream_keys(device) for device in devices])
+        delivered = sum(len(player.keys) for player in emulator.players)
+        await asyncio.gather(*[device.disconnect() for device in devices])
+
+        return {
+            "send_key": _summary(key_durations),
+            "send_key_stream": _summary([duration for durations, _ in stream_results for duration in durations]),
+            "pacing_wait": _summary([wait for _, waits in stream_results for wait in waits]),
+            "keys_delivered": delivered,
+            "keys_sent": 2 * keys * count,
+            "update_tick": _summary(update_durations),
+            "update_tick_cached": _summary(list(cached_update_durations)),
+            "memory_per_device_bytes": memory // count,
+        }
+
+
+async def bench_discovery(count: int, latency: float) -> dict:
+    """
+    Measure the device identification part of the discovery.
+
+    Multicast SSDP can't be emulated on loopback addresses: the SSDP search is replaced by the list of emulated
+    players, so this measures the SCPD fetch and evaluation. The SSDP search itself waits a fixed ``SSDP_MX``.
+    """
+    async with SonyPlayerEmulator(count, 3, latency) as emulator:
+        locations = {f"http://{player.host}:{IRCC_PORT}/Ircc.xml" for player in emulator.players}
+
+        async def ssdp_broadcast():
+            return locations
+
+        original = discover.async_send_ssdp_broadcast
+        discover.async_send_ssdp_broadcast = ssdp_broadcast
+        try:
+            start = time.perf_counter()
+            found = await discover.async_identify_sonybluray_devices()
+            duration = time.perf_counter() - start
+        finally:
+            discover.async_send_ssdp_broadcast = original
+
+        return {"duration_ms": round(duration * 1000, 3), "found": len(found),
+                "ssdp_wait_ms": discover.SSDP_MX * 1000}
+
+
+async def run(counts: list[int], keys: int, latency: float) -> dict:
+    """Run all benchmarks for the given device counts."""
+    results = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "latency_ms": latency * 1000,
+        "runs": [],
+    }
+    for count in counts:
+        run_result = {"devices": count}
+        for api_version in (3, 4):
+            run_result[f"bootstrap_v{api_version}"] = await bench_bootstrap(count, api_version, latency)
+            run_result[f"device_v{api_version}"] = await bench_devices(count, api_version, latency, keys)
+        run_result["discovery"] = await bench_discovery(count, latency)
+        results["runs"].append(run_result)
+    return results
+
+
+def main():
+    """Parse the arguments and run the benchmark."""
+    parser = argparse.ArgumentParser(description="Benchmark the driver against emulated Sony players")
+    parser.add_argument("--devices", default="1,10,50", help="comma separated list of device counts")
+    parser.add_argument("--keys", type=int, default=50, help="key presses per device")
+    parser.add_argument("--latency", type=float, default=0.0, help="emulated player processing time in seconds")
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    counts = [int(count) for count in args.devices.split(",") if count]
+    results = asyncio.run(run(counts, args.keys, args.latency))
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Local emulator of Sony Bluray players for benchmarks and manual testing.
+
+Each emulated player listens on its own loopback address (127.0.1.x) with the regular DMR, IRCC and application
+ports, and answers the requests the driver sends during bootstrap, polling and key presses.
+
+:copyright: (c) 2024 by Unfolded Circle ApS.
+:license: Mozilla Public License Version 2.0, see LICENSE for more details.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+
+from aiohttp import web
+
+_LOG = logging.getLogger("sony_emulator")
+
+IRCC_PORT = 50001
+DMR_PORT = 52323
+APP_PORT = 50202
+
+SOAP_RESPONSE = """<?xml version="1.0"?>
+<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/"
+    s:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/">
+<s:Body>{0}</s:Body>
+</s:Envelope>"""
+
+# Subset of the BD1 IRCC codes, enough for the driver to build its command list
+COMMANDS = {
+    "Power": "AAAAAwAAHFoAAAAVAw==",
+    "Eject": "AAAAAwAAHFoAAAAWAw==",
+    "Stop": "AAAAAwAAHFoAAAAYAw==",
+    "Pause": "AAAAAwAAHFoAAAAZAw==",
+    "Play": "AAAAAwAAHFoAAAAaAw==",
+    "Rewind": "AAAAAwAAHFoAAAAbAw==",
+    "Forward": "AAAAAwAAHFoAAAAcAw==",
+    "Up": "AAAAAwAAHFoAAAA5Aw==",
+    "Down": "AAAAAwAAHFoAAAA6Aw==",
+    "Left": "AAAAAwAAHFoAAAA7Aw==",
+    "Right": "AAAAAwAAHFoAAAA8Aw==",
+    "Confirm": "AAAAAwAAHFoAAAA9Aw==",
+    "Home": "AAAAAwAAHFoAAABCAw==",
+    "Return": "AAAAAwAAHFoAAABDAw==",
+}
+
+
+@dataclass
+class EmulatedPlayer:
+    """State of one emulated Sony player."""
+
+    index: int
+    api_version: int = 3
+    latency: float = 0.0
+    power: bool = True
+    transport_state: str = "STOPPED"
+    media_duration: int = 5400
+    requests: int = 0
+    keys: list[str] = field(default_factory=list)
+    _position: float = field(default=0.0, init=False, repr=False)
+    _playing_since: float | None = field(default=None, init=False, repr=False)
+
+    @property
+    def position(self) -> float:
+        """Return the playback position in seconds."""
+        if self._playing_since is None:
+            return self._position
+        return min(self.media_duration, self._position + time.monotonic() - self._playing_since)
+
+    def set_transport_state(self, transport_state: str) -> None:
+        """Change the transport state, the position runs while playing and is reset on stop."""
+        self._position = 0.0 if transport_state == "STOPPED" else self.position
+        self._playing_since = time.monotonic() if transport_state == "PLAYING" else None
+        self.transport_state = transport_state
+
+    @property
+    def host(self) -> str:
+        """Return the loopback address of the player."""
+        return f"127.0.1.{self.index + 1}"
+
+    @property
+    def mac(self) -> str:
+        """Return the (fake) mac address of the player."""
+        return f"02-00-00-00-{self.index // 256:02x}-{self.index % 256:02x}"
+
+    @property
+    def dmr_url(self) -> str:
+        """Return the DMR description url of the player."""
+        return f"http://{self.host}:{DMR_PORT}/dmr.xml"
+
+
+def _format_time(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def _dmr_xml(player: EmulatedPlayer) -> str:
+    scalar_web_api = ""
+    if player.api_version >= 4:
+        scalar_web_api = f"""
+      <av:X_ScalarWebAPI_DeviceInfo xmlns:av="urn:schemas-sony-com:av">
+        <av:X_ScalarWebAPI_Version>1.0</av:X_ScalarWebAPI_Version>
+        <av:X_ScalarWebAPI_BaseURL>http://{player.host}:{DMR_PORT}/sony</av:X_ScalarWebAPI_BaseURL>
+        <av:X_ScalarWebAPI_ServiceList>
+          <av:X_ScalarWebAPI_ServiceType>system</av:X_ScalarWebAPI_ServiceType>
+        </av:X_ScalarWebAPI_ServiceList>
+      </av:X_ScalarWebAPI_DeviceInfo>"""
+    return f"""<?xml version="1.0"?>
+<root xmlns="urn:schemas-upnp-org:device-1-0" xmlns:av="urn:schemas-sony-com:av">
+  <specVersion><major>1</major><minor>0</minor></specVersion>
+  <device>
+    <deviceType>urn:schemas-upnp-org:device:MediaRenderer:1</deviceType>
+    <friendlyName>Emulated Player {player.index}</friendlyName>
+    <manufacturer>Sony Corporation</manufacturer>
+    <modelName>BDP-EMU{player.api_version}</modelName>
+    <serialNumber>{player.index:08d}</serialNumber>
+    <UDN>uuid:00000000-0000-1010-8000-{player.mac.replace("-", "")}</UDN>
+    <serviceList>
+      <service>
+        <serviceType>urn:schemas-upnp-org:service:AVTransport:1</serviceType>
+        <serviceId>urn:upnp-org:serviceId:AVTransport</serviceId>
+        <SCPDURL>/AVTransportSCPD.xml</SCPDURL>
+        <controlURL>/upnp/control/AVTransport</controlURL>
+        <eventSubURL>/upnp/event/AVTransport</eventSubURL>
+      </service>
+    </serviceList>{scalar_web_api}
+  </device>
+</root>"""
+
+
+def _ircc_xml(player: EmulatedPlayer) -> str:
+    return f"""<?xml version="1.0"?>
+<root xmlns="urn:schemas-upnp-org:device-1-0" xmlns:av="urn:schemas-sony-com:av">
+  <device>
+    <deviceType>urn:schemas-upnp-org:device:Basic:1</deviceType>
+    <friendlyName>Emulated Player {player.index}</friendlyName>
+    <manufacturer>Sony Corporation</manufacturer>
+    <modelName>BDP-EMU{player.api_version}</modelName>
+    <serialNumber>{player.index:08d}</serialNumber>
+    <presentationURL>http://{player.host}/</presentationURL>
+    <serviceList>
+      <service>
+        <serviceType>urn:schemas-sony-com:service:IRCC:1</serviceType>
+        <serviceId>urn:schemas-sony-com:serviceId:IRCC</serviceId>
+        <SCPDURL>/IRCCSCPD.xml</SCPDURL>
+        <controlURL>/upnp/control/IRCC</controlURL>
+        <eventSubURL></eventSubURL>
+      </service>
+    </serviceList>
+    <av:X_UNR_DeviceInfo>
+      <av:X_UNR_Version>1.3</av:X_UNR_Version>
+      <av:X_CERS_ActionList_URL>http://{player.host}:{IRCC_PORT}/actionList</av:X_CERS_ActionList_URL>
+    </av:X_UNR_DeviceInfo>
+    <av:X_IRCC_DeviceInfo>
+      <av:X_IRCC_Version>1.0</av:X_IRCC_Version>
+      <av:X_IRCC_CategoryList>
+        <av:X_IRCC_Category>
+          <av:X_CategoryInfo>AAMAABxa</av:X_CategoryInfo>
+        </av:X_IRCC_Category>
+      </av:X_IRCC_CategoryList>
+    </av:X_IRCC_DeviceInfo>
+  </device>
+</root>"""
+
+
+_ACTION_LIST = """<?xml version="1.0"?>
+<actionList>
+  <action name="register" mode="3"/>
+  <action name="getRemoteCommandList"/>
+  <action name="getSystemInformation"/>
+  <action name="getStatus"/>
+</actionList>"""
+
+
+class SonyPlayerEmulator:
+    """Run a set of emulated Sony players on loopback addresses."""
+
+    def __init__(self, count: int = 1, api_version: int = 3, latency: float = 0.0):
+        """
+        Create the emulator.
+
+        :param count: number of emulated players
+        :param api_version: API version exposed by every player (3 or 4)
+        :param latency: artificial processing time of the players, in seconds
+        """
+        self.players = [EmulatedPlayer(index=i, api_version=api_version, latency=latency) for i in range(count)]
+        self._runners: list[web.AppRunner] = []
+
+    async def start(self) -> None:
+        """Start listening for all emulated players."""
+        for player in self.players:
+            runner = web.AppRunner(self._create_app(player), access_log=None)
+            await runner.setup()
+            for port in (DMR_PORT, IRCC_PORT, APP_PORT):
+                await web.TCPSite(runner, player.host, port).start()
+            self._runners.append(runner)
+
+    async def stop(self) -> None:
+        """Stop all emulated players."""
+        for runner in self._runners:
+            await runner.cleanup()
+        self._runners.clear()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.stop()
+
+    def _create_app(self, player: EmulatedPlayer) -> web.Application:
+        @web.middleware
+        async def simulate_player(request: web.Request, handler):
+            player.requests += 1
+            if player.latency:
+                await asyncio.sleep(player.latency)
+            return await handler(request)
+
+        async def dmr(_request):
+            return web.Response(text=_dmr_xml(player), content_type="text/xml")
+
+        async def ircc(_request):
+            return web.Response(text=_ircc_xml(player), content_type="text/xml")
+
+        async def action_list(request: web.Request):
+            action = request.query.get("action")
+            if action is None:
+                return web.Response(text=_ACTION_LIST, content_type="text/xml")
+            if action == "getRemoteCommandList":
+                commands = "".join(f'<command name="{name}" type="ircc" value="{value}"/>'
+                                   for name, value in COMMANDS.items())
+                return web.Response(text=f"<remoteCommandList>{commands}</remoteCommandList>", content_type="text/xml")
+            if action == "getSystemInformation":
+                return web.Response(text=f"""<systemInformation><supportFunction>
+                    <function name="WOL"><functionItem field="MAC" value="{player.mac}"/></function>
+                    </supportFunction></systemInformation>""", content_type="text/xml")
+            if action == "getStatus":
+                status = "viewing" if player.transport_state == "PLAYING" else "disc"
+                return web.Response(text=f'<statusList><status name="{status}"/></statusList>',
+                                    content_type="text/xml")
+            if action == "register":
+                return web.Response(text="")
+            raise web.HTTPNotFound()
+
+        async def ircc_control(request: web.Request):
+            body = await request.text()
+            for name, value in COMMANDS.items():
+                if value in body:
+                    player.keys.append(name)
+                    if name == "Power":
+                        player.power = not player.power
+                    elif name == "Play":
+                        player.set_transport_state("PLAYING")
+                    elif name == "Pause":
+                        player.set_transport_state("PAUSED_PLAYBACK")
+                    elif name == "Stop":
+                        player.set_transport_state("STOPPED")
+                    break
+            return web.Response(text=SOAP_RESPONSE.format(
+                '<u:X_SendIRCCResponse xmlns:u="urn:schemas-sony-com:service:IRCC:1"/>'), content_type="text/xml")
+
+        async def av_transport(request: web.Request):
+            action = request.headers.get("SOAPACTION", "").strip('"').split("#")[-1]
+            if action == "GetTransportInfo":
+                body = (f'<u:GetTransportInfoResponse xmlns:u="urn:schemas-upnp-org:service:AVTransport:1">'
+                        f"<CurrentTransportState>{player.transport_state}</CurrentTransportState>"
+                        f"<CurrentTransportStatus>OK</CurrentTransportStatus>"
+                        f"<CurrentSpeed>1</CurrentSpeed></u:GetTransportInfoResponse>")
+                return web.Response(text=SOAP_RESPONSE.format(body), content_type="text/xml")
+            playing = player.transport_state != "STOPPED"
+            duration = _format_time(player.media_duration) if playing else "0:00:00"
+            if action == "GetPositionInfo":
+                body = (f'<u:GetPositionInfoResponse xmlns:u="urn:schemas-upnp-org:service:AVTransport:1">'
+                        f"<Track>1</Track><TrackDuration>{duration}</TrackDuration>"
+                        f"<RelTime>{_format_time(player.position)}</RelTime>"
+                        f"<AbsTime>NOT_IMPLEMENTED</AbsTime></u:GetPositionInfoResponse>")
+                return web.Response(text=SOAP_RESPONSE.format(body), content_type="text/xml")
+            if action == "GetMediaInfo":
+                body = (f'<u:GetMediaInfoResponse xmlns:u="urn:schemas-upnp-org:service:AVTransport:1">'
+                        f"<NrTracks>{int(playing)}</NrTracks><MediaDuration>{duration}</MediaDuration>"
+                        f"</u:GetMediaInfoResponse>")
+                return web.Response(text=SOAP_RESPONSE.format(body), content_type="text/xml")
+            raise web.HTTPInternalServerError()
+
+        async def scalar_system(request: web.Request):
+            data = await request.json()
+            method = data.get("method")
+            if method == "getPowerStatus":
+                result = [{"status": "active" if player.power else "standby"}]
+            elif method == "getSystemSupportedFunction":
+                result = [[{"option": "WOL", "value": player.mac.replace("-", ":")}]]
+            elif method == "getRemoteControllerInfo":
+                result = [{"bundled": True, "type": "BD"},
+                          [{"name": name, "value": value} for name, value in COMMANDS.items()]]
+            else:
+                return web.json_response({"error": [12, "No Such Method"], "id": data.get("id")})
+            return web.json_response({"result": result, "id": data.get("id")})
+
+        async def apps(_request):
+            return web.Response(text="<service><app><name>Netflix</name><id>netflix</id></app></service>",
+                                content_type="text/xml")
+
+        app = web.Application(middlewares=[simulate_player])
+        app.router.add_get("/dmr.xml", dmr)
+        app.router.add_get("/Ircc.xml", ircc)
+        app.router.add_get("/actionList", action_list)
+        app.router.add_post("/upnp/control/IRCC", ircc_control)
+        app.router.add_post("/upnp/control/AVTransport", av_transport)
+        app.router.add_post("/sony/system", scalar_system)
+        app.router.add_post("/sony/IRCC", ircc_control)
+        app.router.add_get("/appslist", apps)
+        return app
+
+
+async def _main():
+    parser = argparse.ArgumentParser(description="Emulate Sony Bluray players on loopback addresses")
+    parser.add_argument("--count", type=int, default=1, help="number of emulated players")
+    parser.add_argument("--api-version", type=int, default=3, choices=(3, 4), help="emulated API version")
+    parser.add_argument("--latency", type=float, default=0.0, help="processing time of each request in seconds")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    async with SonyPlayerEmulator(args.count, args.api_version, args.latency) as emulator:
+        _LOG.info("Emulated players: %s", json.dumps([player.dmr_url for player in emulator.players]))
+        await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())